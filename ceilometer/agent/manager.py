@@ -423,6 +423,7 @@ class AgentManager(cotyledon.Service):
         self.stop_pollsters_tasks()
         if self.partition_coordinator:
             self.partition_coordinator.stop()
+        messaging.cleanup()
         super(AgentManager, self).terminate()
 
     def interval_task(self, task):
@@ -40,6 +40,13 @@ API_OPTS = [
                default=100,
                help='Default maximum number of items returned by API request.'
                ),
+    cfg.IntOpt('post_samples_batch_size',
+               min=1,
+               default=1000,
+               help='Maximum number of posted samples recorded in a single '
+                    'storage batch, or sent in a single notification when '
+                    'they are not posted directly to storage.'
+               ),
 ]
 
 
@@ -50,6 +57,8 @@ def setup_app(pecan_config=None, conf=None):
     # FIXME: Replace DBHook with a hooks.TransactionHook
     app_hooks = [hooks.ConfigHook(conf),
                  hooks.DBHook(conf),
+                 hooks.QueryCacheHook(conf),
+                 hooks.StreamHook(),
                  hooks.NotifierHook(conf),
                  hooks.TranslationHook()]
 
@@ -0,0 +1,130 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Read-through cache of the results of the API storage queries.
+
+Dashboards poll the same meter listings and statistics over and over. Their
+results are cached for a few seconds, keyed by the normalized query and the
+user and project the request is limited to. Statistics of a time range
+which is already over are cached longer, since new samples rarely fall in
+it.
+"""
+
+import hashlib
+import threading
+import time
+
+import cachetools
+from oslo_config import cfg
+from oslo_log import log
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+
+try:
+    from oslo_cache import core as oslo_cache
+except ImportError:
+    oslo_cache = None
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('query_cache_backend',
+               default='none', choices=['none', 'memory', 'oslo.cache'],
+               help="Where the results of meter listings and statistics "
+               "queries are cached: none disables the cache, memory keeps "
+               "them in a LRU of each API process, oslo.cache uses the "
+               "backend configured in the [cache] section, which should "
+               "keep entries at least closed_statistics_cache_ttl "
+               "seconds."),
+    cfg.IntOpt('query_cache_size',
+               default=1000, min=1,
+               help="Maximum number of query results kept in memory by the "
+               "memory cache backend."),
+    cfg.IntOpt('meters_cache_ttl',
+               default=30, min=1,
+               help="Number of seconds meter listings are cached."),
+    cfg.IntOpt('statistics_cache_ttl',
+               default=30, min=1,
+               help="Number of seconds statistics whose time range is still "
+               "open are cached."),
+    cfg.IntOpt('closed_statistics_cache_ttl',
+               default=3600, min=1,
+               help="Number of seconds statistics whose time range ended "
+               "before the request are cached."),
+]
+
+
+class QueryCache(object):
+    """Cache the results of storage queries for a time depending on them."""
+
+    def __init__(self, conf):
+        self.conf = conf
+        self._lock = threading.Lock()
+        self._local = None
+        self._region = None
+        backend = conf.api.query_cache_backend
+        if backend == 'oslo.cache' and oslo_cache is None:
+            LOG.warning("oslo.cache is not installed, caching query results "
+                        "in memory")
+            backend = 'memory'
+        if backend == 'memory':
+            self._local = cachetools.LRUCache(conf.api.query_cache_size)
+        elif backend == 'oslo.cache':
+            oslo_cache.configure(conf)
+            self._region = oslo_cache.create_region()
+            oslo_cache.configure_cache_region(conf, self._region)
+
+    @staticmethod
+    def key(kind, *args):
+        """Return the cache key of a query.
+
+        :param kind: the kind of query, such as meters or statistics.
+        :param args: the parameters of the query, including the user and
+                     project the request is limited to.
+        """
+        query = jsonutils.dumps(args, sort_keys=True)
+        if six.PY3:
+            query = query.encode('utf-8')
+        return 'ceilometer-api-%s-%s' % (kind,
+                                         hashlib.sha1(query).hexdigest())
+
+    def statistics_ttl(self, sample_filter):
+        """Return the TTL of statistics, longer once their range is over."""
+        end = sample_filter.end_timestamp
+        if end is not None and end <= timeutils.utcnow():
+            return self.conf.api.closed_statistics_cache_ttl
+        return self.conf.api.statistics_cache_ttl
+
+    def get_or_compute(self, key, ttl, compute):
+        """Return the cached result of a query, computing it if needed.
+
+        :param compute: a function returning the result of the query, which
+                        must not be a generator.
+        """
+        if self._region is not None:
+            value = self._region.get(key, expiration_time=ttl)
+            if value is oslo_cache.NO_VALUE:
+                value = compute()
+                self._region.set(key, value)
+            return value
+        if self._local is None:
+            return compute()
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = compute()
+        with self._lock:
+            self._local[key] = (now + ttl, value)
+        return value
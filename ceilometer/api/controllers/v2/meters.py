@@ -32,6 +32,7 @@ from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
 from ceilometer.api.controllers.v2 import base
+from ceilometer.api.controllers.v2 import streaming
 from ceilometer.api.controllers.v2 import utils as v2_utils
 from ceilometer.api import rbac
 from ceilometer.i18n import _
@@ -278,12 +279,14 @@ class MeterController(rest.RestController):
         pecan.request.context['meter_name'] = meter_name
         self.meter_name = meter_name
 
-    @wsme_pecan.wsexpose([OldSample], [base.Query], int)
-    def get_all(self, q=None, limit=None):
+    @wsme_pecan.wsexpose([OldSample], [base.Query], int, wtypes.text)
+    def get_all(self, q=None, limit=None, marker=None):
         """Return samples for the meter.
 
         :param q: Filter rules for the data to be returned.
         :param limit: Maximum number of samples to return.
+        :param marker: The marker of the page to return, as advertised by
+                       the Link header of the previous page.
         """
 
         rbac.enforce('get_samples', pecan.request)
@@ -292,10 +295,15 @@ class MeterController(rest.RestController):
         limit = v2_utils.enforce_limit(limit)
         kwargs = v2_utils.query_to_kwargs(q, storage.SampleFilter.__init__)
         kwargs['meter'] = self.meter_name
+        kwargs['marker'] = v2_utils.decode_sample_marker(marker)
         f = storage.SampleFilter(**kwargs)
-        return [OldSample.from_db_model(e)
-                for e in pecan.request.storage_conn.get_samples(f, limit=limit)
-                ]
+        samples = pecan.request.storage_conn.get_samples(f, limit=limit)
+        if streaming.requested():
+            return streaming.respond(
+                six.moves.map(OldSample.from_db_model, samples), OldSample)
+        samples = list(samples)
+        v2_utils.set_next_link(samples, limit, v2_utils.sample_marker)
+        return [OldSample.from_db_model(e) for e in samples]
 
     @wsme_pecan.wsexpose([OldSample], str, body=[OldSample], status_code=201)
     def post(self, direct='', samples=None):
@@ -318,7 +326,8 @@ class MeterController(rest.RestController):
         def_project_id = pecan.request.headers.get('X-Project-Id')
         def_user_id = pecan.request.headers.get('X-User-Id')
 
-        published_samples = []
+        # NOTE: the whole request is validated before anything is recorded,
+        # so that an invalid sample does not leave it partially recorded.
         for s in samples:
             if self.meter_name != s.counter_name:
                 raise wsme.exc.InvalidInput('counter_name', s.counter_name,
@@ -344,6 +353,8 @@ class MeterController(rest.RestController):
                 raise wsme.exc.InvalidInput('project_id', s.project_id,
                                             auth_msg)
 
+        published_samples = []
+        for s in samples:
             published_sample = sample.Sample(
                 name=s.counter_name,
                 type=s.counter_type,
@@ -357,23 +368,26 @@ class MeterController(rest.RestController):
                                                         separator='.'),
                 source=s.source)
             s.message_id = published_sample.id
-
-            sample_dict = publisher_utils.meter_message_from_counter(
-                published_sample,
-                pecan.request.cfg.publisher.telemetry_secret)
-            if direct:
-                ts = timeutils.parse_isotime(sample_dict['timestamp'])
-                sample_dict['timestamp'] = timeutils.normalize_time(ts)
-                pecan.request.storage_conn.record_metering_data(sample_dict)
-            else:
-                published_samples.append(sample_dict)
-        if not direct:
-            pecan.request.notifier.sample(
-                {'user': def_user_id,
-                 'tenant': def_project_id,
-                 'is_admin': True},
-                'telemetry.api',
-                {'samples': published_samples})
+            published_samples.append(published_sample)
+
+        sample_dicts = publisher_utils.meter_messages_from_counters(
+            published_samples, pecan.request.cfg.publisher.telemetry_secret)
+        batch_size = pecan.request.cfg.api.post_samples_batch_size
+        if direct:
+            for s, sample_dict in zip(samples, sample_dicts):
+                sample_dict['timestamp'] = timeutils.normalize_time(
+                    s.timestamp)
+            for i in six.moves.range(0, len(sample_dicts), batch_size):
+                pecan.request.storage_conn.record_metering_data_batch(
+                    sample_dicts[i:i + batch_size])
+        else:
+            for i in six.moves.range(0, len(sample_dicts), batch_size):
+                pecan.request.notifier.sample(
+                    {'user': def_user_id,
+                     'tenant': def_project_id,
+                     'is_admin': True},
+                    'telemetry.api',
+                    {'samples': sample_dicts[i:i + batch_size]})
 
         return samples
 
@@ -415,9 +429,15 @@ class MeterController(rest.RestController):
                 start = timeutils.parse_isotime(i.value).replace(
                     tzinfo=None)
 
+        query_cache = pecan.request.query_cache
+        key = query_cache.key('statistics', vars(f), period, g,
+                              [(a.func, a.param) for a in aggregate],
+                              rbac.get_limited_to(pecan.request.headers))
         try:
-            computed = pecan.request.storage_conn.get_meter_statistics(
-                f, period, g, aggregate)
+            computed = query_cache.get_or_compute(
+                key, query_cache.statistics_ttl(f),
+                lambda: list(pecan.request.storage_conn.get_meter_statistics(
+                    f, period, g, aggregate)))
             return [Statistics(start_timestamp=start,
                                end_timestamp=end,
                                **c.as_dict())
@@ -499,7 +519,12 @@ class MetersController(rest.RestController):
         kwargs = v2_utils.query_to_kwargs(
             q, pecan.request.storage_conn.get_meters,
             ['limit'], allow_timestamps=False)
-        return [Meter.from_db_model(m)
-                for m in pecan.request.storage_conn.get_meters(
-                limit=limit, unique=strutils.bool_from_string(unique),
-                **kwargs)]
+        unique = strutils.bool_from_string(unique)
+        query_cache = pecan.request.query_cache
+        key = query_cache.key('meters', kwargs, limit, unique,
+                              rbac.get_limited_to(pecan.request.headers))
+        meters = query_cache.get_or_compute(
+            key, pecan.request.cfg.api.meters_cache_ttl,
+            lambda: list(pecan.request.storage_conn.get_meters(
+                limit=limit, unique=unique, **kwargs)))
+        return [Meter.from_db_model(m) for m in meters]
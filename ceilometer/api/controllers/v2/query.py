@@ -19,7 +19,9 @@
 # under the License.
 
 import json
+import threading
 
+import cachetools
 import jsonschema
 from oslo_log import log
 from oslo_utils import timeutils
@@ -38,6 +40,12 @@ from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Number of validated queries kept in memory
+VALIDATED_QUERY_CACHE_SIZE = 1000
+
+_validated_queries = cachetools.LRUCache(VALIDATED_QUERY_CACHE_SIZE)
+_validated_queries_lock = threading.Lock()
+
 
 class ComplexQuery(base.Base):
     """Holds a sample query encoded in json."""
@@ -95,6 +103,8 @@ class ValidatedComplexQuery(object):
         self.name_mapping = {"user": "user_id",
                              "project": "project_id"}
         self.name_mapping.update(additional_name_mapping)
+        self.db_model = db_model
+        self.metadata_allowed = metadata_allowed
         valid_keys = db_model.get_field_names()
         valid_keys = list(valid_keys) + list(self.name_mapping.keys())
         valid_fields = _list_to_regexp(valid_keys)
@@ -191,38 +201,88 @@ class ValidatedComplexQuery(object):
         self.original_query = query
 
     def validate(self, visibility_field):
-        """Validates the query content and does the necessary conversions."""
+        """Validates the query content and does the necessary conversions.
+
+        The validated filter and order-by expressions are kept in a LRU
+        keyed by the query and the project the request is limited to, and
+        shared by the requests repeating it, so they must not be modified.
+        """
+        authorized_project = rbac.get_limited_to_project(pecan.request.headers)
         if self.original_query.filter is wtypes.Unset:
-            self.filter_expr = None
+            filter_expr = None
         else:
             try:
-                self.filter_expr = json.loads(self.original_query.filter)
-                self._validate_filter(self.filter_expr)
-            except (ValueError, jsonschema.exceptions.ValidationError) as e:
+                filter_expr = json.loads(self.original_query.filter)
+            except ValueError as e:
                 raise base.ClientSideError(
                     _("Filter expression not valid: %s") % e)
-            self._replace_isotime_with_datetime(self.filter_expr)
-            self._convert_operator_to_lower_case(self.filter_expr)
-            self._normalize_field_names_for_db_model(self.filter_expr)
+        orderby = (None if self.original_query.orderby is wtypes.Unset
+                   else self.original_query.orderby)
+
+        key = (self.db_model.__name__,
+               tuple(sorted(self.name_mapping.items())),
+               self.metadata_allowed, visibility_field, authorized_project,
+               json.dumps(filter_expr, sort_keys=True), orderby)
+        with _validated_queries_lock:
+            validated = _validated_queries.get(key)
+        if validated is None:
+            validated = self._validate(filter_expr, orderby,
+                                       authorized_project, visibility_field)
+            with _validated_queries_lock:
+                _validated_queries[key] = validated
+        self.filter_expr, self.orderby = validated
+
+        self.limit = (None if self.original_query.limit is wtypes.Unset
+                      else self.original_query.limit)
 
-        self._force_visibility(visibility_field)
+        self.limit = v2_utils.enforce_limit(self.limit)
 
-        if self.original_query.orderby is wtypes.Unset:
-            self.orderby = None
-        else:
+    def _validate(self, filter_expr, orderby, authorized_project,
+                  visibility_field):
+        if filter_expr is not None:
+            try:
+                self._validate_filter(filter_expr)
+            except jsonschema.exceptions.ValidationError as e:
+                raise base.ClientSideError(
+                    _("Filter expression not valid: %s") % e)
+            self._normalize_filter(filter_expr, authorized_project,
+                                   visibility_field)
+        if authorized_project is not None:
+            restriction = {"=": {visibility_field: authorized_project}}
+            filter_expr = (restriction if filter_expr is None
+                           else {"and": [restriction, filter_expr]})
+
+        if orderby is not None:
             try:
-                self.orderby = json.loads(self.original_query.orderby)
-                self._validate_orderby(self.orderby)
+                orderby = json.loads(orderby)
+                self._validate_orderby(orderby)
             except (ValueError, jsonschema.exceptions.ValidationError) as e:
                 raise base.ClientSideError(
                     _("Order-by expression not valid: %s") % e)
-            self._convert_orderby_to_lower_case(self.orderby)
-            self._normalize_field_names_in_orderby(self.orderby)
+            self._convert_orderby_to_lower_case(orderby)
+            self._normalize_field_names_in_orderby(orderby)
+        return filter_expr, orderby
 
-        self.limit = (None if self.original_query.limit is wtypes.Unset
-                      else self.original_query.limit)
+    def _normalize_filter(self, filter_expr, own_project_id,
+                          visibility_field):
+        """Normalize a validated filter in a single traversal.
 
-        self.limit = v2_utils.enforce_limit(self.limit)
+        Operators are converted to lower case, timestamps to datetime and
+        field names to the ones of the db model. Unless own_project_id is
+        None, references to other projects are rejected.
+        """
+        def normalize(subfilter):
+            utils.lowercase_keys(subfilter)
+            op, value = list(subfilter.items())[0]
+            if op in self.complex_operators:
+                return
+            self._replace_isotime(subfilter)
+            self._replace_field_names(value)
+            if own_project_id is not None:
+                self._check_project_id(subfilter, own_project_id,
+                                       visibility_field)
+
+        self._traverse_postorder(filter_expr, normalize)
 
     @staticmethod
     def _convert_orderby_to_lower_case(orderby):
@@ -243,56 +303,23 @@ class ValidatedComplexQuery(object):
 
         visitor(tree)
 
-    def _check_cross_project_references(self, own_project_id,
-                                        visibility_field):
-        """Do not allow other than own_project_id."""
-        def check_project_id(subfilter):
-            op, value = list(subfilter.items())[0]
-            if (op.lower() not in self.complex_operators
-                    and list(value.keys())[0] == visibility_field
-                    and value[visibility_field] != own_project_id):
-                raise base.ProjectNotAuthorized(value[visibility_field])
-
-        self._traverse_postorder(self.filter_expr, check_project_id)
-
-    def _force_visibility(self, visibility_field):
-        """Force visibility field.
-
-        If the tenant is not admin insert an extra
-        "and <visibility_field>=<tenant's project_id>" clause to the query.
-        """
-        authorized_project = rbac.get_limited_to_project(pecan.request.headers)
-        is_admin = authorized_project is None
-        if not is_admin:
-            self._restrict_to_project(authorized_project, visibility_field)
-            self._check_cross_project_references(authorized_project,
-                                                 visibility_field)
-
-    def _restrict_to_project(self, project_id, visibility_field):
-        restriction = {"=": {visibility_field: project_id}}
-        if self.filter_expr is None:
-            self.filter_expr = restriction
-        else:
-            self.filter_expr = {"and": [restriction, self.filter_expr]}
+    def _check_project_id(self, subfilter, own_project_id, visibility_field):
+        op, value = list(subfilter.items())[0]
+        if (op.lower() not in self.complex_operators
+                and list(value.keys())[0] == visibility_field
+                and value[visibility_field] != own_project_id):
+            raise base.ProjectNotAuthorized(value[visibility_field])
+
+    def _replace_isotime(self, subfilter):
+        op, value = list(subfilter.items())[0]
+        if op.lower() not in self.complex_operators:
+            field = list(value.keys())[0]
+            if field in self.timestamp_fields:
+                date_time = self._convert_to_datetime(subfilter[op][field])
+                subfilter[op][field] = date_time
 
     def _replace_isotime_with_datetime(self, filter_expr):
-        def replace_isotime(subfilter):
-            op, value = list(subfilter.items())[0]
-            if op.lower() not in self.complex_operators:
-                field = list(value.keys())[0]
-                if field in self.timestamp_fields:
-                    date_time = self._convert_to_datetime(subfilter[op][field])
-                    subfilter[op][field] = date_time
-
-        self._traverse_postorder(filter_expr, replace_isotime)
-
-    def _normalize_field_names_for_db_model(self, filter_expr):
-        def _normalize_field_names(subfilter):
-            op, value = list(subfilter.items())[0]
-            if op.lower() not in self.complex_operators:
-                self._replace_field_names(value)
-        self._traverse_postorder(filter_expr,
-                                 _normalize_field_names)
+        self._traverse_postorder(filter_expr, self._replace_isotime)
 
     def _replace_field_names(self, subfilter):
         field, value = list(subfilter.items())[0]
@@ -28,6 +28,7 @@ from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
 from ceilometer.api.controllers.v2 import base
+from ceilometer.api.controllers.v2 import streaming
 from ceilometer.api.controllers.v2 import utils
 from ceilometer.api import rbac
 from ceilometer.i18n import _
@@ -134,13 +135,15 @@ class ResourcesController(rest.RestController):
         return Resource.from_db_and_links(resources[0],
                                           self._resource_links(resource_id))
 
-    @wsme_pecan.wsexpose([Resource], [base.Query], int, int)
-    def get_all(self, q=None, limit=None, meter_links=1):
+    @wsme_pecan.wsexpose([Resource], [base.Query], int, int, six.text_type)
+    def get_all(self, q=None, limit=None, meter_links=1, marker=None):
         """Retrieve definitions of all of the resources.
 
         :param q: Filter rules for the resources to be returned.
         :param limit: Maximum number of resources to return.
         :param meter_links: option to include related meter links.
+        :param marker: The marker of the page to return, as advertised by
+                       the Link header of the previous page.
         """
 
         rbac.enforce('get_resources', pecan.request)
@@ -149,10 +152,18 @@ class ResourcesController(rest.RestController):
         limit = utils.enforce_limit(limit)
         kwargs = utils.query_to_kwargs(
             q, pecan.request.storage_conn.get_resources, ['limit'])
-        resources = [
-            Resource.from_db_and_links(r,
-                                       self._resource_links(r.resource_id,
-                                                            meter_links))
-            for r in pecan.request.storage_conn.get_resources(limit=limit,
-                                                              **kwargs)]
-        return resources
+        if marker:
+            kwargs['marker'] = utils.decode_marker(marker, 1)[0]
+        resources = pecan.request.storage_conn.get_resources(
+            limit=limit, **kwargs)
+        if streaming.requested():
+            return streaming.respond(
+                (Resource.from_db_and_links(
+                    r, self._resource_links(r.resource_id, meter_links))
+                 for r in resources), Resource)
+        resources = list(resources)
+        utils.set_next_link(resources, limit,
+                            lambda r: utils.encode_marker([r.resource_id]))
+        return [Resource.from_db_and_links(
+                r, self._resource_links(r.resource_id, meter_links))
+                for r in resources]
@@ -23,10 +23,12 @@ import uuid
 
 import pecan
 from pecan import rest
+import six
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
 from ceilometer.api.controllers.v2 import base
+from ceilometer.api.controllers.v2 import streaming
 from ceilometer.api.controllers.v2 import utils
 from ceilometer.api import rbac
 from ceilometer.i18n import _
@@ -109,12 +111,14 @@ class Sample(base.Base):
 class SamplesController(rest.RestController):
     """Controller managing the samples."""
 
-    @wsme_pecan.wsexpose([Sample], [base.Query], int)
-    def get_all(self, q=None, limit=None):
+    @wsme_pecan.wsexpose([Sample], [base.Query], int, wtypes.text)
+    def get_all(self, q=None, limit=None, marker=None):
         """Return all known samples, based on the data recorded so far.
 
         :param q: Filter rules for the samples to be returned.
         :param limit: Maximum number of samples to be returned.
+        :param marker: The marker of the page to return, as advertised by
+                       the Link header of the previous page.
         """
 
         rbac.enforce('get_samples', pecan.request)
@@ -123,9 +127,15 @@ class SamplesController(rest.RestController):
 
         limit = utils.enforce_limit(limit)
         kwargs = utils.query_to_kwargs(q, storage.SampleFilter.__init__)
-        f = storage.SampleFilter(**kwargs)
-        return map(Sample.from_db_model,
-                   pecan.request.storage_conn.get_samples(f, limit=limit))
+        f = storage.SampleFilter(marker=utils.decode_sample_marker(marker),
+                                 **kwargs)
+        samples = pecan.request.storage_conn.get_samples(f, limit=limit)
+        if streaming.requested():
+            return streaming.respond(
+                six.moves.map(Sample.from_db_model, samples), Sample)
+        samples = list(samples)
+        utils.set_next_link(samples, limit, utils.sample_marker)
+        return map(Sample.from_db_model, samples)
 
     @wsme_pecan.wsexpose(Sample, wtypes.text)
     def get_one(self, sample_id):
@@ -0,0 +1,160 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Stream the JSON encoding of large listings.
+
+WSME builds the whole listing, then the JSON document holding it, before
+sending the response. A streamed listing is encoded item by item while the
+storage driver yields the results, so the memory used by the API does not
+grow with the number of items. Its JSON document is the same, but it has
+no Link header to the next page, since the headers are sent before the
+last item is known.
+"""
+
+import datetime
+import decimal
+import itertools
+import json
+import threading
+
+from oslo_config import cfg
+import pecan
+from wsme import types as wtypes
+
+OPTS = [
+    cfg.BoolOpt('stream_listings',
+                default=False,
+                help="Stream the JSON encoding of the samples and resources "
+                "listings instead of building them in memory. Streamed "
+                "listings have no Link header to their next page."),
+]
+
+# Number of items encoded in each chunk of the response
+CHUNK_SIZE = 100
+
+_ENCODER = json.JSONEncoder()
+
+_converters = {}
+_converters_lock = threading.Lock()
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _make_converter(datatype, building):
+    if wtypes.iscomplex(datatype):
+        attributes = []
+
+        def convert_complex(value):
+            if value is None:
+                return None
+            result = {}
+            for key, name, convert in attributes:
+                attr_value = getattr(value, key)
+                if attr_value is not wtypes.Unset:
+                    result[name] = convert(attr_value)
+            return result
+
+        # NOTE: registered before its attributes are resolved, so that a
+        # type can refer to itself.
+        building[datatype] = convert_complex
+        attributes.extend((attr.key, attr.name,
+                           _converter(attr.datatype, building))
+                          for attr in wtypes.list_attributes(datatype))
+        return convert_complex
+    if isinstance(datatype, wtypes.ArrayType):
+        convert_item = _converter(datatype.item_type, building)
+        return lambda value: (None if value is None else
+                              [convert_item(item) for item in value])
+    if isinstance(datatype, wtypes.DictType):
+        convert_key = _converter(datatype.key_type, building)
+        convert_value = _converter(datatype.value_type, building)
+        return lambda value: (None if value is None else
+                              dict((convert_key(k), convert_value(v))
+                                   for k, v in value.items()))
+    if wtypes.isusertype(datatype):
+        convert_base = _converter(datatype.basetype, building)
+        return lambda value: (None if value is None else
+                              convert_base(datatype.tobasetype(value)))
+    if datatype in (datetime.datetime, datetime.date, datetime.time):
+        return _isoformat
+    if datatype is decimal.Decimal:
+        return lambda value: None if value is None else str(value)
+    if datatype is wtypes.bytes:
+        return lambda value: None if value is None else value.decode('ascii')
+    return lambda value: value
+
+
+def _converter(datatype, building):
+    """Return the converter of a type, building it in building if needed."""
+    convert = _converters.get(datatype) or building.get(datatype)
+    if convert is None:
+        convert = building[datatype] = _make_converter(datatype, building)
+    return convert
+
+
+def converter(datatype):
+    """Return a function converting the values of a WSME type to JSON types.
+
+    It converts them as WSME does, but the conversion of each attribute of
+    the type is resolved once, instead of for each value.
+    """
+    convert = _converters.get(datatype)
+    if convert is None:
+        with _converters_lock:
+            # NOTE: converters are only published once complete, since
+            # they are looked up without the lock.
+            building = {}
+            convert = _converter(datatype, building)
+            _converters.update(building)
+    return convert
+
+
+def encode(items, datatype):
+    """Yield the JSON encoding of a list of values of a WSME type."""
+    convert = converter(datatype)
+    dumps = _ENCODER.encode
+    separator = '['
+    while True:
+        chunk = [dumps(convert(item))
+                 for item in itertools.islice(items, CHUNK_SIZE)]
+        if not chunk:
+            break
+        yield (separator + ', '.join(chunk)).encode('utf-8')
+        separator = ', '
+    yield b'[]' if separator == '[' else b']'
+
+
+def requested():
+    """Tell whether the listing of the current request is streamed."""
+    return (pecan.request.cfg.api.stream_listings and
+            pecan.request.pecan['content_type'] == 'application/json')
+
+
+def respond(items, datatype):
+    """Stream a listing as the body of the response.
+
+    The first item is read right away, so that the errors of the storage
+    query are reported as usual instead of interrupting the response.
+
+    :param items: an iterable of the values of the listing.
+    :param datatype: the WSME type of the values.
+    """
+    items = iter(items)
+    try:
+        first = next(items)
+    except StopIteration:
+        items = iter(())
+    else:
+        items = itertools.chain([first], items)
+    pecan.request.json_stream = encode(items, datatype)
@@ -18,14 +18,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import base64
 import copy
 import datetime
 import inspect
 
 from oslo_log import log
+from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 import pecan
 import six
+from six.moves import urllib
 import wsme
 
 from ceilometer.api.controllers.v2 import base
@@ -47,6 +50,64 @@ def enforce_limit(limit):
     return limit
 
 
+def encode_marker(values):
+    """Return an opaque page marker holding a list of values."""
+    token = base64.urlsafe_b64encode(
+        jsonutils.dump_as_bytes(values, default=six.text_type))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_marker(marker, size):
+    """Return the list of values held by a page marker.
+
+    :param marker: the marker returned with the previous page.
+    :param size: the number of values of a valid marker.
+    """
+    try:
+        token = marker.encode('ascii')
+        values = jsonutils.loads(base64.urlsafe_b64decode(
+            token + b'=' * (-len(token) % 4)).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise base.ClientSideError(_("Invalid marker"))
+    return values
+
+
+def decode_sample_marker(marker):
+    """Return the sample filter marker held by a samples page marker."""
+    if not marker:
+        return None
+    timestamp, message_id, counter_name = decode_marker(marker, 3)
+    try:
+        timestamp = timeutils.parse_isotime(timestamp).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        raise base.ClientSideError(_("Invalid marker"))
+    return timestamp, message_id, counter_name
+
+
+def sample_marker(sample):
+    """Return the page marker of a storage sample."""
+    return encode_marker([sample.timestamp.isoformat(), sample.message_id,
+                          sample.counter_name])
+
+
+def set_next_link(results, limit, make_marker):
+    """Advertise the next page of a listing in a Link header.
+
+    The header is only set when the page is full, the URL of the next page
+    being the one of the current request with the marker of its last item.
+    """
+    if not results or len(results) < limit:
+        return
+    params = [(k, v) for k, v in pecan.request.GET.items() if k != 'marker']
+    params.append(('marker', make_marker(results[-1])))
+    url = '%s?%s' % (pecan.request.path_url, urllib.parse.urlencode(
+        [(k, v.encode('utf-8') if isinstance(v, six.text_type) else v)
+         for k, v in params]))
+    pecan.response.headers['Link'] = '<%s>; rel="next"' % url
+
+
 def get_auth_project(on_behalf_of=None):
     auth_project = rbac.get_limited_to_project(pecan.request.headers)
     created_by = pecan.request.headers.get('X-Project-Id')
@@ -128,6 +189,8 @@ def validate_query(query, db_func, internal_keys=None,
         valid_keys += ['timestamp', 'search_offset']
     internal_keys.append('self')
     internal_keys.append('metaquery')
+    # NOTE: the page marker is a request parameter, not a query field
+    internal_keys.append('marker')
     valid_keys = set(valid_keys) - set(internal_keys)
     translation = {'user_id': 'user',
                    'project_id': 'project',
@@ -19,6 +19,7 @@ from oslo_policy import policy
 
 from pecan import hooks
 
+from ceilometer.api import cache
 from ceilometer import messaging
 from ceilometer import storage
 
@@ -56,12 +57,32 @@ class DBHook(hooks.PecanHook):
     @staticmethod
     def get_connection(conf):
         try:
-            return storage.get_connection_from_config(conf)
+            return storage.get_connection_from_config(conf, warm_up=True)
         except Exception as err:
             LOG.exception("Failed to connect to db" "retry later: %s",
                           err)
 
 
+class QueryCacheHook(hooks.PecanHook):
+    """Attach the cache of the results of storage queries to the request."""
+
+    def __init__(self, conf):
+        self.query_cache = cache.QueryCache(conf)
+
+    def before(self, state):
+        state.request.query_cache = self.query_cache
+
+
+class StreamHook(hooks.PecanHook):
+    """Send the listing streamed by the controller as the response body."""
+
+    def after(self, state):
+        stream = getattr(state.request, 'json_stream', None)
+        if stream is not None and state.response.status_int == 200:
+            state.response.app_iter = stream
+            state.response.content_type = 'application/json'
+
+
 class NotifierHook(hooks.PecanHook):
     """Create and attach a notifier to the request.
 
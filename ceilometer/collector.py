@@ -13,9 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 from itertools import chain
 import select
 import socket
+import threading
+import time
 
 import cotyledon
 import msgpack
@@ -52,7 +55,36 @@ OPTS = [
                deprecated_group='DEFAULT',
                deprecated_name='collector_workers',
                help='Number of workers for collector service. '
-               'default value is 1.')
+               'default value is 1.'),
+    cfg.IntOpt('udp_receivers',
+               default=1,
+               min=1,
+               help='Number of UDP sockets, each with its own receiver '
+               'thread, bound by every collector worker. Sockets share the '
+               'port through SO_REUSEPORT so the kernel spreads incoming '
+               'datagrams over them.'),
+    cfg.IntOpt('udp_processing_workers',
+               default=1,
+               min=1,
+               help='Number of threads per collector worker decoding, '
+               'verifying and dispatching received UDP datagrams.'),
+    cfg.IntOpt('udp_queue_size',
+               default=10000,
+               min=1,
+               help='Maximum number of received UDP datagrams waiting to be '
+               'processed. When the queue is full the oldest datagrams are '
+               'dropped.'),
+    cfg.IntOpt('udp_batch_size',
+               default=100,
+               min=1,
+               help='Maximum number of UDP samples sent to the dispatchers '
+               'in a single call.'),
+    cfg.IntOpt('udp_stats_interval',
+               default=60,
+               min=0,
+               help='Number of seconds between two logs of the UDP '
+               'ingestion counters and the kernel UDP drop rate. Set to 0 '
+               'to disable.'),
 ]
 
 LOG = log.getLogger(__name__)
@@ -69,6 +101,9 @@ class CollectorService(cotyledon.Service):
         self.sample_listener = None
         self.event_listener = None
         self.udp_thread = None
+        self.udp_queue = None
+        self.udp_stats = UDPStats()
+        self._udp_kernel_stats = None
 
         import debtcollector
         debtcollector.deprecate("Ceilometer collector service is deprecated."
@@ -107,7 +142,7 @@ class CollectorService(cotyledon.Service):
                         batch_timeout=self.conf.collector.batch_timeout))
                 self.event_listener.start()
 
-    def start_udp(self):
+    def _udp_socket(self):
         address_family = socket.AF_INET
         if netutils.is_valid_ipv6(self.conf.collector.udp_address):
             address_family = socket.AF_INET6
@@ -122,9 +157,40 @@ class CollectorService(cotyledon.Service):
                         "incoming data.")
         udp.bind((self.conf.collector.udp_address,
                   self.conf.collector.udp_port))
+        return udp
 
+    def start_udp(self):
+        conf = self.conf.collector
+        sockets = [self._udp_socket() for _i in range(conf.udp_receivers)]
+        self.udp_queue = DatagramQueue(conf.udp_queue_size)
+        self.udp_stats = self.udp_queue.stats
         self.udp_run = True
+
+        processors = [utils.spawn_thread(self._udp_process)
+                      for _i in range(conf.udp_processing_workers)]
+        receivers = [utils.spawn_thread(self._udp_receive, udp)
+                     for udp in sockets[1:]]
+
+        self._udp_receive(sockets[0], report=True)
+
+        # receivers have been asked to stop, wait for them and then let the
+        # processors drain what is left in the queue
+        for thread in receivers:
+            thread.join()
+        self.udp_queue.close()
+        for thread in processors:
+            thread.join()
+        for udp in sockets:
+            udp.close()
+        self._udp_report()
+
+    def _udp_receive(self, udp, report=False):
+        interval = self.conf.collector.udp_stats_interval
+        last_report = time.time()
         while self.udp_run:
+            if report and interval and time.time() - last_report >= interval:
+                last_report = time.time()
+                self._udp_report()
             # NOTE(sileht): return every 10 seconds to allow
             # clear shutdown
             if not select.select([udp], [], [], 10.0)[0]:
@@ -132,22 +198,55 @@ class CollectorService(cotyledon.Service):
             # NOTE(jd) Arbitrary limit of 64K because that ought to be
             # enough for anybody.
             data, source = udp.recvfrom(64 * units.Ki)
-            try:
-                sample = msgpack.loads(data, encoding='utf-8')
-            except Exception:
-                LOG.warning(_("UDP: Cannot decode data sent by %s"), source)
-            else:
-                if publisher_utils.verify_signature(
-                        sample, self.conf.publisher.telemetry_secret):
-                    try:
-                        LOG.debug("UDP: Storing %s", sample)
-                        self.meter_manager.map_method(
-                            'record_metering_data', sample)
-                    except Exception:
-                        LOG.exception(_("UDP: Unable to store meter"))
+            self.udp_queue.put((data, source))
+
+    def _udp_process(self):
+        stats = self.udp_queue.stats
+        secret = self.conf.publisher.telemetry_secret
+        batch_size = self.conf.collector.udp_batch_size
+        while True:
+            datagrams = self.udp_queue.get_batch(batch_size)
+            if datagrams is None:
+                return
+            goods = []
+            for data, source in datagrams:
+                try:
+                    sample = msgpack.loads(data, encoding='utf-8')
+                except Exception:
+                    LOG.warning(_("UDP: Cannot decode data sent by %s"),
+                                source)
+                    continue
+                stats.incr('decoded')
+                if publisher_utils.verify_signature(sample, secret):
+                    goods.append(sample)
                 else:
+                    stats.incr('invalid_signature')
                     LOG.warning('sample signature invalid, '
                                 'discarding: %s', sample)
+            if not goods:
+                continue
+            try:
+                LOG.debug("UDP: Storing %s", goods)
+                self.meter_manager.map_method('record_metering_data', goods)
+            except Exception:
+                LOG.exception(_("UDP: Unable to store meter"))
+            else:
+                stats.incr('dispatched', len(goods))
+
+    def _udp_report(self):
+        counters = self.udp_stats.snapshot()
+        kernel = udp_kernel_stats()
+        if kernel is not None:
+            previous = self._udp_kernel_stats or kernel
+            self._udp_kernel_stats = kernel
+            received = (kernel.get('InDatagrams', 0) -
+                        previous.get('InDatagrams', 0))
+            dropped = (kernel.get('RcvbufErrors', 0) -
+                       previous.get('RcvbufErrors', 0))
+            total = received + dropped
+            counters['kernel_drop_rate'] = (
+                float(dropped) / total if total else 0.0)
+        LOG.info("UDP ingestion statistics: %s", counters)
 
     def terminate(self):
         if self.sample_listener:
@@ -157,9 +256,85 @@ class CollectorService(cotyledon.Service):
         if self.udp_thread:
             self.udp_run = False
             self.udp_thread.join()
+        messaging.cleanup()
         super(CollectorService, self).terminate()
 
 
+class UDPStats(object):
+    """Thread-safe counters of the UDP ingestion path."""
+
+    COUNTERS = ('received', 'decoded', 'invalid_signature', 'dispatched',
+                'dropped')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class DatagramQueue(object):
+    """Bounded ring buffer between the UDP receivers and processors.
+
+    Receivers never block: once the buffer is full, the oldest datagram is
+    overwritten and accounted as dropped, so the kernel socket buffer keeps
+    being drained even when the dispatchers are slow.
+    """
+
+    def __init__(self, size):
+        self.stats = UDPStats()
+        self._buffer = collections.deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, datagram):
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.stats.incr('dropped')
+            self._buffer.append(datagram)
+            self.stats.incr('received')
+            self._cond.notify()
+
+    def get_batch(self, size):
+        """Return up to size datagrams, or None once closed and drained."""
+        with self._cond:
+            while not self._buffer:
+                if self._closed:
+                    return None
+                self._cond.wait(1.0)
+            return [self._buffer.popleft()
+                    for _i in range(min(size, len(self._buffer)))]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def udp_kernel_stats(path='/proc/net/snmp'):
+    """Return the host wide UDP counters of the kernel.
+
+    InDatagrams are the datagrams delivered to sockets and RcvbufErrors the
+    ones dropped because a socket receive buffer was full. Returns None when
+    the counters are not available (non Linux systems).
+    """
+    try:
+        with open(path) as f:
+            lines = [line.split() for line in f if line.startswith('Udp:')]
+    except (IOError, OSError):
+        return None
+    if len(lines) < 2:
+        return None
+    return dict((k, int(v)) for k, v in zip(lines[0][1:], lines[1][1:])
+                if k in ('InDatagrams', 'RcvbufErrors', 'InErrors'))
+
+
 class CollectorEndpoint(object):
     def __init__(self, secret, dispatcher_manager):
         self.secret = secret
@@ -35,11 +35,19 @@ class MeterDatabaseDispatcher(dispatcher.MeterDispatcherBase):
     meter_dispatchers = database
     """
 
+    def __init__(self, conf):
+        super(MeterDatabaseDispatcher, self).__init__(conf)
+        if conf.database.connection_warm_up:
+            # NOTE: open the connections at start-up rather than when the
+            # first samples are received.
+            self._conn = storage.get_connection_from_config(conf,
+                                                            warm_up=True)
+
     @property
     def conn(self):
         if not hasattr(self, "_conn"):
             self._conn = storage.get_connection_from_config(
-                self.conf)
+                self.conf, warm_up=True)
         return self._conn
 
     def record_metering_data(self, data):
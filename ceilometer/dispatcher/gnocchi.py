@@ -13,9 +13,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 from collections import defaultdict
+from concurrent import futures
 import hashlib
 import itertools
-import operator
 import pkg_resources
 import threading
 import uuid
@@ -223,6 +223,9 @@ class GnocchiDispatcher(dispatcher.MeterDispatcherBase,
         self._gnocchi = gnocchi_client.get_gnocchiclient(conf)
         self._already_logged_event_types = set()
         self._already_logged_metric_names = set()
+        self._metric_definitions = {}
+        self._batch_executor = None
+        self._batch_executor_lock = threading.Lock()
 
     @classmethod
     def _load_resources_definitions(cls, conf):
@@ -281,9 +284,19 @@ class GnocchiDispatcher(dispatcher.MeterDispatcherBase,
         ))
 
     def _get_resource_definition_from_metric(self, metric_name):
+        # NOTE: definitions are immutable once loaded, so the (possibly
+        # None) result of the fnmatch scan is memoized per metric name.
+        try:
+            return self._metric_definitions[metric_name]
+        except KeyError:
+            pass
         for rd in self.resources_definition:
             if rd.metric_match(metric_name):
-                return rd
+                break
+        else:
+            rd = None
+        self._metric_definitions[metric_name] = rd
+        return rd
 
     def _get_resource_definition_from_event(self, event_type):
         for rd in self.resources_definition:
@@ -295,63 +308,75 @@ class GnocchiDispatcher(dispatcher.MeterDispatcherBase,
         # We may have receive only one counter on the wire
         if not isinstance(data, list):
             data = [data]
-        # NOTE(sileht): skip sample generated by gnocchi itself
-        data = [s for s in data if not self._is_gnocchi_activity(s)]
-
-        data.sort(key=lambda s: (s['resource_id'], s['counter_name']))
-        resource_grouped_samples = itertools.groupby(
-            data, key=operator.itemgetter('resource_id'))
 
+        # NOTE: a single pass over the batch in arrival order: measures are
+        # appended as they come and only the last sample seen for each
+        # (resource, definition) pair is kept for attribute extraction.
         gnocchi_data = {}
         measures = {}
+        last_samples = {}
         stats = dict(measures=0, resources=0, metrics=0)
-        for resource_id, samples_of_resource in resource_grouped_samples:
-            # NOTE(sileht): / is forbidden by Gnocchi
-            resource_id = resource_id.replace('/', '_')
-
-            stats['resources'] += 1
-            metric_grouped_samples = itertools.groupby(
-                list(samples_of_resource),
-                key=operator.itemgetter('counter_name'))
+        for sample in data:
+            # NOTE(sileht): skip sample generated by gnocchi itself
+            if self._is_gnocchi_activity(sample):
+                continue
 
-            res_info = {}
-            for metric_name, samples in metric_grouped_samples:
+            # NOTE(sileht): / is forbidden by Gnocchi
+            resource_id = sample['resource_id'].replace('/', '_')
+            metric_name = sample['counter_name']
+
+            resource_measures = measures.get(resource_id)
+            if resource_measures is None:
+                resource_measures = measures[resource_id] = {}
+                stats['resources'] += 1
+            metric_measures = resource_measures.get(metric_name)
+            if metric_measures is None:
+                metric_measures = resource_measures[metric_name] = []
                 stats['metrics'] += 1
 
-                samples = list(samples)
-                rd = self._get_resource_definition_from_metric(metric_name)
-                if rd is None:
-                    if metric_name not in self._already_logged_metric_names:
-                        LOG.warning("metric %s is not handled by Gnocchi" %
-                                    metric_name)
-                        self._already_logged_metric_names.add(metric_name)
-                    continue
-                if rd.cfg.get("ignore"):
-                    continue
-
-                res_info['resource_type'] = rd.cfg['resource_type']
-                res_info.setdefault("resource", {}).update({
-                    "id": resource_id,
-                    "user_id": samples[0]['user_id'],
-                    "project_id": samples[0]['project_id'],
-                    "metrics": rd.metrics,
-                })
-
-                for sample in samples:
-                    res_info.setdefault("resource_extra", {}).update(
-                        rd.sample_attributes(sample))
-                    m = measures.setdefault(resource_id, {}).setdefault(
-                        metric_name, [])
-                    m.append({'timestamp': sample['timestamp'],
-                              'value': sample['counter_volume']})
-                    unit = sample['counter_unit']
-                    metric = sample['counter_name']
-                    res_info['resource']['metrics'][metric]['unit'] = unit
-
-                stats['measures'] += len(measures[resource_id][metric_name])
-                res_info["resource"].update(res_info["resource_extra"])
-                if res_info:
-                    gnocchi_data[resource_id] = res_info
+            rd = self._get_resource_definition_from_metric(metric_name)
+            if rd is None:
+                if metric_name not in self._already_logged_metric_names:
+                    LOG.warning("metric %s is not handled by Gnocchi" %
+                                metric_name)
+                    self._already_logged_metric_names.add(metric_name)
+                continue
+            if rd.cfg.get("ignore"):
+                continue
+
+            metric_measures.append({'timestamp': sample['timestamp'],
+                                    'value': sample['counter_volume']})
+            stats['measures'] += 1
+            rd.metrics[metric_name]['unit'] = sample['counter_unit']
+
+            res_info = gnocchi_data.get(resource_id)
+            if res_info is None:
+                res_info = gnocchi_data[resource_id] = {"resource": {}}
+            res_info['resource_type'] = rd.cfg['resource_type']
+            res_info['resource'].update({
+                "id": resource_id,
+                "user_id": sample['user_id'],
+                "project_id": sample['project_id'],
+                "metrics": rd.metrics,
+            })
+            last_samples.setdefault(resource_id, {})[rd] = sample
+
+        # Drop the entries of resources or metrics without any handled
+        # measure, they have nothing to post.
+        for resource_id in list(measures):
+            resource_measures = measures[resource_id]
+            for metric_name in [m for m, v in resource_measures.items()
+                                if not v]:
+                del resource_measures[metric_name]
+            if not resource_measures:
+                del measures[resource_id]
+
+        for resource_id, res_info in gnocchi_data.items():
+            resource_extra = {}
+            for rd, sample in last_samples[resource_id].items():
+                resource_extra.update(rd.sample_attributes(sample))
+            res_info["resource_extra"] = resource_extra
+            res_info["resource"].update(resource_extra)
 
         try:
             self.batch_measures(measures, gnocchi_data, stats)
@@ -383,7 +408,66 @@ class GnocchiDispatcher(dispatcher.MeterDispatcherBase,
                  resource_infos[rid]['resource'])
                 for rid in resource_ids]
 
+    def _split_measures(self, measures):
+        """Split measures into chunks of bounded size.
+
+        Measures of a resource are never split across chunks, so a resource
+        with more measures than the limit gets a chunk of its own.
+        """
+        max_measures = self.conf.dispatcher_gnocchi.batch_max_measures
+        if not max_measures:
+            return [measures]
+        chunks = []
+        chunk = {}
+        size = 0
+        for resource_id, metrics in measures.items():
+            count = sum(len(m) for m in metrics.values())
+            if chunk and size + count > max_measures:
+                chunks.append(chunk)
+                chunk = {}
+                size = 0
+            chunk[resource_id] = metrics
+            size += count
+        if chunk or not chunks:
+            chunks.append(chunk)
+        return chunks
+
+    def _get_batch_executor(self):
+        if self._batch_executor is None:
+            with self._batch_executor_lock:
+                if self._batch_executor is None:
+                    self._batch_executor = futures.ThreadPoolExecutor(
+                        max_workers=self.conf.dispatcher_gnocchi.
+                        batch_concurrency)
+        return self._batch_executor
+
     def batch_measures(self, measures, resource_infos, stats):
+        chunks = self._split_measures(measures)
+        if len(chunks) == 1:
+            self._post_measures(chunks[0], resource_infos)
+        else:
+            executor = self._get_batch_executor()
+            jobs = [executor.submit(self._post_measures, chunk,
+                                    resource_infos) for chunk in chunks]
+            failed = False
+            for job in jobs:
+                try:
+                    job.result()
+                except (gnocchi_exc.ClientException,
+                        ka_exceptions.ConnectFailure) as e:
+                    failed = True
+                    LOG.error(six.text_type(e))
+                except Exception as e:
+                    failed = True
+                    LOG.error(six.text_type(e), exc_info=True)
+            if failed:
+                return
+
+        # FIXME(sileht): take care of measures removed in stats
+        LOG.debug("%(measures)d measures posted against %(metrics)d "
+                  "metrics through %(resources)d resources", stats)
+
+    def _post_measures(self, measures, resource_infos):
         # NOTE(sileht): We don't care about error here, we want
         # resources metadata always been updated
         try:
@@ -416,10 +500,6 @@ class GnocchiDispatcher(dispatcher.MeterDispatcherBase,
             self._gnocchi.metric.batch_resources_metrics_measures(
                 measures, create_metrics=True)
 
-        # FIXME(sileht): take care of measures removed in stats
-        LOG.debug("%(measures)d measures posted against %(metrics)d "
-                  "metrics through %(resources)d resources", stats)
-
     def _create_resource(self, resource_type, resource):
         self._gnocchi.resource.create(resource_type, resource)
         LOG.debug('Resource %s created', resource["id"])
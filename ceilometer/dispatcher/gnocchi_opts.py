@@ -34,4 +34,11 @@ dispatcher_opts = [
                      'and gnocchi resources/metrics')),
     cfg.FloatOpt('request_timeout', default=6.05, min=0.0,
                  help='Number of seconds before request to gnocchi times out'),
+    cfg.IntOpt('batch_max_measures', default=10000, min=0,
+               help='Maximum number of measures posted to Gnocchi in a '
+               'single batch request. Larger batches are split by resource '
+               'into several requests. 0 means no limit.'),
+    cfg.IntOpt('batch_concurrency', default=4, min=1,
+               help='Number of batch requests posted to Gnocchi '
+               'concurrently when a batch is split.'),
 ]
@@ -13,22 +13,66 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
+import time
+
+from oslo_log import log
 import oslo_messaging
 from oslo_messaging.notify import notifier
 from oslo_messaging import serializer as oslo_serializer
+import six.moves.urllib.parse as urlparse
+
+LOG = log.getLogger(__name__)
 
 DEFAULT_URL = "__default__"
 TRANSPORTS = {}
+NOTIFIERS = {}
+SEND_STATS = {}
+_LOCK = threading.Lock()
 
 
 def setup():
     oslo_messaging.set_transport_defaults('ceilometer')
 
 
+def normalize_url(url):
+    """Return a canonical form of a transport URL.
+
+    Scheme and host names are case insensitive and the order of the query
+    parameters does not matter, so URLs only differing on these points
+    share the same transport.
+    """
+    if not url:
+        return DEFAULT_URL
+    parsed = urlparse.urlsplit(url)
+    netloc = parsed.netloc
+    if '@' in netloc:
+        auth, hosts = netloc.rsplit('@', 1)
+        netloc = '%s@%s' % (auth, hosts.lower())
+    else:
+        netloc = netloc.lower()
+    query = urlparse.urlencode(
+        sorted(urlparse.parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlparse.urlunsplit([parsed.scheme.lower(), netloc, parsed.path,
+                                query, parsed.fragment])
+
+
+def mask_url(url):
+    """Return the URL without the password, suitable for logging."""
+    if not url or url == DEFAULT_URL:
+        return DEFAULT_URL
+    parsed = urlparse.urlsplit(url)
+    if parsed.password is None:
+        return url
+    netloc = parsed.netloc.replace(':%s@' % parsed.password, ':***@', 1)
+    return urlparse.urlunsplit([parsed.scheme, netloc, parsed.path,
+                                parsed.query, parsed.fragment])
+
+
 def get_transport(conf, url=None, optional=False, cache=True):
     """Initialise the oslo_messaging layer."""
     global TRANSPORTS, DEFAULT_URL
-    cache_key = url or DEFAULT_URL
+    cache_key = normalize_url(url)
     transport = TRANSPORTS.get(cache_key)
     if not transport or not cache:
         try:
@@ -42,17 +86,81 @@ def get_transport(conf, url=None, optional=False, cache=True):
             return None
         else:
             if cache:
-                TRANSPORTS[cache_key] = transport
+                with _LOCK:
+                    # another thread may have created the same transport
+                    transport = TRANSPORTS.setdefault(cache_key, transport)
     return transport
 
 
+def get_shared_notifier(transport, **kwargs):
+    """Return an oslo_messaging notifier shared by identical publishers.
+
+    Notifiers are keyed by their transport and their arguments, so that
+    sinks publishing to the same broker and topics reuse one producer.
+    """
+    key = (id(transport),) + tuple(sorted(
+        (k, tuple(v) if isinstance(v, list) else v)
+        for k, v in kwargs.items()))
+    with _LOCK:
+        entry = NOTIFIERS.get(key)
+        if entry is None or entry[0] is not transport:
+            entry = (transport, oslo_messaging.Notifier(transport, **kwargs))
+            NOTIFIERS[key] = entry
+    return entry[1]
+
+
+class SendStats(object):
+    """Statistics of the messages sent to a transport and its topics."""
+
+    def __init__(self):
+        self.messages = 0
+        self.items = 0
+        self.failures = 0
+        self.duration = 0.0
+        self.last_failure = None
+
+    def as_dict(self):
+        return {'messages': self.messages,
+                'items': self.items,
+                'failures': self.failures,
+                'duration': self.duration,
+                'last_failure': self.last_failure}
+
+
+def record_send(url, topics, items, started, failed=False):
+    """Account for a message sent to the topics of the transport at url."""
+    now = time.time()
+    with _LOCK:
+        stats = SEND_STATS.setdefault((normalize_url(url), tuple(topics)),
+                                      SendStats())
+        stats.messages += 1
+        stats.duration += now - started
+        if failed:
+            stats.failures += 1
+            stats.last_failure = now
+        else:
+            stats.items += items
+
+
+def get_send_stats():
+    """Return the send statistics indexed by masked URL and topics."""
+    with _LOCK:
+        return dict(((mask_url(url), topics), stats.as_dict())
+                    for (url, topics), stats in SEND_STATS.items())
+
+
 def cleanup():
     """Cleanup the oslo_messaging layer."""
-    global TRANSPORTS, NOTIFIERS
-    NOTIFIERS = {}
-    for url in TRANSPORTS:
-        TRANSPORTS[url].cleanup()
-        del TRANSPORTS[url]
+    global TRANSPORTS, NOTIFIERS, SEND_STATS
+    stats = get_send_stats()
+    if stats:
+        LOG.info("Messaging send statistics: %s", stats)
+    with _LOCK:
+        transports, TRANSPORTS = TRANSPORTS, {}
+        NOTIFIERS = {}
+        SEND_STATS = {}
+    for transport in transports.values():
+        transport.cleanup()
 
 
 _SERIALIZER = oslo_serializer.JsonPayloadSerializer()
@@ -330,6 +330,7 @@ class NotificationService(cotyledon.Service):
                 utils.kill_listeners([self.pipeline_listener])
             utils.kill_listeners(self.listeners)
 
+        messaging.cleanup()
         super(NotificationService, self).terminate()
 
 
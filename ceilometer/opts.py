@@ -19,7 +19,9 @@ from oslo_config import cfg
 
 import ceilometer.agent.manager
 import ceilometer.api.app
+import ceilometer.api.cache
 import ceilometer.api.controllers.v2.root
+import ceilometer.api.controllers.v2.streaming
 import ceilometer.collector
 import ceilometer.compute.discovery
 import ceilometer.compute.virt.inspector
@@ -94,7 +96,9 @@ def list_opts():
                          ceilometer.exchange_control.EXCHANGE_OPTS,
                          OPTS)),
         ('api', itertools.chain(ceilometer.api.app.API_OPTS,
-                                ceilometer.api.controllers.v2.root.API_OPTS)),
+                                ceilometer.api.cache.OPTS,
+                                ceilometer.api.controllers.v2.root.API_OPTS,
+                                ceilometer.api.controllers.v2.streaming.OPTS)),
         ('collector', ceilometer.collector.OPTS),
         ('compute', ceilometer.compute.discovery.OPTS),
         ('coordination', [
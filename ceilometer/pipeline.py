@@ -15,12 +15,17 @@
 # under the License.
 
 import abc
+import collections
 import hashlib
 from itertools import chain
 from operator import methodcaller
 import os
 import pkg_resources
+import sys
+import threading
+import time
 
+from concurrent import futures
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
@@ -44,11 +49,30 @@ OPTS = [
                default="event_pipeline.yaml",
                help="Configuration file for event pipeline definition."
                ),
+    cfg.IntOpt('multi_publish_workers',
+               default=4,
+               min=0,
+               help="Number of threads shared by the sinks having several "
+               "publishers to publish to all of them concurrently. Set to 0 "
+               "to call the publishers one after another."),
 ]
 
 
 LOG = log.getLogger(__name__)
 
+_PUBLISH_EXECUTOR = None
+_PUBLISH_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_publish_executor(conf):
+    global _PUBLISH_EXECUTOR
+    if _PUBLISH_EXECUTOR is None:
+        with _PUBLISH_EXECUTOR_LOCK:
+            if _PUBLISH_EXECUTOR is None:
+                _PUBLISH_EXECUTOR = futures.ThreadPoolExecutor(
+                    max_workers=conf.multi_publish_workers)
+    return _PUBLISH_EXECUTOR
+
 
 class ConfigException(Exception):
     def __init__(self, cfg_type, message, cfg):
@@ -423,6 +447,9 @@ class Sink(object):
 
         self.multi_publish = True if len(self.publishers) > 1 else False
         self.transformers = self._setup_transformers(cfg, transformer_manager)
+        self.publisher_stats = collections.defaultdict(
+            lambda: {'calls': 0, 'errors': 0, 'duration': 0.0})
+        self._stats_lock = threading.Lock()
 
     def __str__(self):
         return self.name
@@ -446,6 +473,53 @@ class Sink(object):
 
         return transformers
 
+    def _timed_publish(self, publisher, method, data):
+        start = time.time()
+        error = True
+        try:
+            getattr(publisher, method)(data)
+            error = False
+        finally:
+            duration = time.time() - start
+            with self._stats_lock:
+                stats = self.publisher_stats[str(publisher)]
+                stats['calls'] += 1
+                stats['duration'] += duration
+                if error:
+                    stats['errors'] += 1
+            LOG.debug("Pipeline %(pipeline)s: publisher %(pub)s took "
+                      "%(duration).3fs to publish %(count)d items",
+                      {'pipeline': self, 'pub': publisher,
+                       'duration': duration, 'count': len(data)})
+
+    def _publish(self, method, data):
+        """Hand data to every publisher of the sink.
+
+        With several publishers and multi_publish_workers set, the
+        publishers are called concurrently and this returns once all of
+        them are done. Returns the (publisher, exc_info) pairs of the
+        publishers which failed.
+        """
+        if self.multi_publish and self.conf.multi_publish_workers:
+            executor = _get_publish_executor(self.conf)
+            running = [(p, executor.submit(self._timed_publish, p, method,
+                                           data))
+                       for p in self.publishers]
+            failures = []
+            for p, future in running:
+                try:
+                    future.result()
+                except Exception:
+                    failures.append((p, sys.exc_info()))
+            return failures
+        failures = []
+        for p in self.publishers:
+            try:
+                self._timed_publish(p, method, data)
+            except Exception:
+                failures.append((p, sys.exc_info()))
+        return failures
+
 
 class EventSink(Sink):
 
@@ -453,18 +527,15 @@ class EventSink(Sink):
 
     def publish_events(self, events):
         if events:
-            for p in self.publishers:
-                try:
-                    p.publish_events(events)
-                except Exception:
-                    LOG.error("Pipeline %(pipeline)s: %(status)s "
-                              "after error from publisher %(pub)s" %
-                              {'pipeline': self,
-                               'status': 'Continue' if
-                               self.multi_publish else 'Exit', 'pub': p},
-                              exc_info=True)
-                    if not self.multi_publish:
-                        raise
+            for p, exc_info in self._publish('publish_events', events):
+                LOG.error("Pipeline %(pipeline)s: %(status)s "
+                          "after error from publisher %(pub)s" %
+                          {'pipeline': self,
+                           'status': 'Continue' if
+                           self.multi_publish else 'Exit', 'pub': p},
+                          exc_info=exc_info)
+                if not self.multi_publish:
+                    six.reraise(*exc_info)
 
     @staticmethod
     def flush():
@@ -519,14 +590,12 @@ class SampleSink(Sink):
                     transformed_samples.append(sample)
 
         if transformed_samples:
-            for p in self.publishers:
-                try:
-                    p.publish_samples(transformed_samples)
-                except Exception:
-                    LOG.error("Pipeline %(pipeline)s: Continue after "
-                              "error from publisher %(pub)s"
-                              % {'pipeline': self, 'pub': p},
-                              exc_info=True)
+            for p, exc_info in self._publish('publish_samples',
+                                             transformed_samples):
+                LOG.error("Pipeline %(pipeline)s: Continue after "
+                          "error from publisher %(pub)s"
+                          % {'pipeline': self, 'pub': p},
+                          exc_info=exc_info)
 
     def publish_samples(self, samples):
         self._publish_samples(0, samples)
@@ -13,16 +13,296 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import atexit
+import errno
+import gzip
+import io
 import logging
 import logging.handlers
+import os
+import re
+import socket
+import threading
+import time
+import weakref
 
+import msgpack
 from oslo_log import log
+from oslo_serialization import jsonutils
+from oslo_utils import units
+import six
 from six.moves.urllib import parse as urlparse
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError:
+    pyarrow = None
+
 from ceilometer import publisher
 
 LOG = log.getLogger(__name__)
 
+# Segment writers to close at exit, without keeping them alive
+_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_writers):
+        writer.close()
+
+
+class _RowEncoder(object):
+    """Encode records as a stream of rows in a binary file."""
+
+    def __init__(self, fileobj, raw):
+        self.fileobj = fileobj
+        self.raw = raw
+
+    @staticmethod
+    def accepts(records):
+        return True
+
+    def write(self, records):
+        data = b''.join(self.encode(r) for r in records)
+        self.fileobj.write(data)
+        return len(data)
+
+    def close(self):
+        self.fileobj.close()
+        self.raw.close()
+
+
+class _JSONEncoder(_RowEncoder):
+    extension = 'json'
+
+    @staticmethod
+    def encode(record):
+        return jsonutils.dump_as_bytes(record) + b'\n'
+
+
+class _MsgpackEncoder(_RowEncoder):
+    extension = 'msgpack'
+
+    @staticmethod
+    def encode(record):
+        return msgpack.dumps(jsonutils.to_primitive(record,
+                                                    convert_datetime=True))
+
+
+class _ColumnarEncoder(object):
+    """Encode records as Parquet row groups, one per published batch.
+
+    The schema is frozen with the first batch of a segment. Numbers are
+    stored as doubles, everything else as strings, with nested values such
+    as the resource metadata or the event traits serialized to JSON. A
+    batch which does not fit that schema, because it has new fields or
+    values of another type, is not accepted and must go to a new segment.
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, fileobj, compression):
+        self.fileobj = fileobj
+        self.compression = compression or 'none'
+        self.writer = None
+
+    @staticmethod
+    def _is_number(value):
+        return (isinstance(value, six.integer_types + (float,))
+                and not isinstance(value, bool))
+
+    def _coerce(self, value, is_number):
+        if value is None:
+            return None
+        if is_number:
+            return float(value) if self._is_number(value) else None
+        if isinstance(value, six.string_types):
+            return value
+        return jsonutils.dumps(value)
+
+    def _types(self, records):
+        """Return the type of each field of records, None if never set."""
+        types = {}
+        for key in set().union(*records):
+            values = [r[key] for r in records if r.get(key) is not None]
+            if not values:
+                types[key] = None
+            elif all(self._is_number(v) for v in values):
+                types[key] = pyarrow.float64()
+            else:
+                types[key] = pyarrow.string()
+        return types
+
+    def accepts(self, records):
+        if self.writer is None:
+            return True
+        schema = self.writer.schema
+        for key, type_ in self._types(records).items():
+            index = schema.get_field_index(key)
+            if index < 0 or (type_ is not None and
+                             schema.field(index).type != type_):
+                return False
+        return True
+
+    def write(self, records):
+        if self.writer is None:
+            fields = [pyarrow.field(key, type_ or pyarrow.string())
+                      for key, type_ in sorted(self._types(records).items())]
+            self.writer = parquet.ParquetWriter(
+                self.fileobj, pyarrow.schema(fields),
+                compression=self.compression)
+        columns = {}
+        for field in self.writer.schema:
+            is_number = pyarrow.types.is_floating(field.type)
+            columns[field.name] = [self._coerce(r.get(field.name), is_number)
+                                   for r in records]
+        table = pyarrow.Table.from_pydict(columns, schema=self.writer.schema)
+        self.writer.write_table(table)
+        return table.nbytes
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.fileobj.close()
+
+
+class SegmentWriter(object):
+    """Write records to a series of size and time bounded segment files.
+
+    Every segment is named after the path of the publisher, the UTC time at
+    which it has been opened and the host and process writing it, e.g.
+    ``/var/test.20170801T120000Z.node1-4242.json.gz``, so that several
+    publishers can share a path, and is compressed as a whole. Once a
+    segment reaches max_bytes of encoded data, once the current
+    rotate_interval period is over, or when the encoder does not accept a
+    batch, it is closed and a new one is started. Only the backup_count most
+    recent segments of the process are kept if it is set, the segments of
+    other writers sharing the path are left alone.
+    """
+
+    FORMATS = {'json': _JSONEncoder,
+               'msgpack': _MsgpackEncoder}
+    COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+    def __init__(self, path, fmt='json', compression='none', max_bytes=0,
+                 backup_count=0, rotate_interval=0,
+                 buffer_size=64 * units.Ki):
+        if fmt == 'columnar' and pyarrow is None:
+            LOG.warning('pyarrow is not installed, falling back to json '
+                        'for the columnar file publisher format')
+            fmt = 'json'
+        if fmt != 'columnar' and fmt not in self.FORMATS:
+            raise ValueError('Unknown file publisher format %s' % fmt)
+        if compression not in self.COMPRESSIONS:
+            raise ValueError('Unknown compression %s' % compression)
+        if (compression == 'zstd' and fmt != 'columnar'
+                and zstandard is None):
+            raise ValueError('zstandard is required for zstd compression')
+        self.path = path
+        self.format = fmt
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval = rotate_interval
+        self.buffer_size = buffer_size
+        self.encoder = None
+        self.segment = None
+        self.segment_bytes = 0
+        self.segment_end = None
+        self.lock = threading.Lock()
+        _writers.add(self)
+
+    @staticmethod
+    def _owner():
+        return '%s-%d' % (socket.gethostname(), os.getpid())
+
+    def _create_segment(self, now):
+        """Exclusively create a new segment file and return its fd."""
+        extension = (_ColumnarEncoder.extension if self.format == 'columnar'
+                     else self.FORMATS[self.format].extension)
+        if self.format != 'columnar' and self.compression == 'gzip':
+            extension += '.gz'
+        elif self.format != 'columnar' and self.compression == 'zstd':
+            extension += '.zst'
+        prefix = '%s.%s.%s' % (
+            self.path, time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now)),
+            self._owner())
+        self.segment = '%s.%s' % (prefix, extension)
+        index = 0
+        while True:
+            try:
+                return os.open(self.segment,
+                               os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            index += 1
+            self.segment = '%s-%d.%s' % (prefix, index, extension)
+
+    def _open(self, now):
+        fd = self._create_segment(now)
+        self.segment_bytes = 0
+        if self.rotate_interval:
+            self.segment_end = (now // self.rotate_interval + 1
+                                ) * self.rotate_interval
+        raw = fileobj = io.open(fd, 'wb', buffering=self.buffer_size)
+        if self.format == 'columnar':
+            self.encoder = _ColumnarEncoder(raw, self.compression)
+            return
+        if self.compression == 'gzip':
+            fileobj = gzip.GzipFile(fileobj=raw, mode='wb')
+        elif self.compression == 'zstd':
+            fileobj = zstandard.ZstdCompressor().stream_writer(raw)
+        self.encoder = self.FORMATS[self.format](fileobj, raw)
+
+    def _close_segment(self):
+        if self.encoder is not None:
+            self.encoder.close()
+            self.encoder = None
+            self._prune()
+
+    def _prune(self):
+        if not self.backup_count:
+            return
+        dirname, basename = os.path.split(self.path)
+        pattern = re.compile(r'%s\.\d{8}T\d{6}Z\.%s(-\d+)?\.' % (
+            re.escape(basename), re.escape(self._owner())))
+        segments = sorted((os.path.join(dirname, name)
+                           for name in os.listdir(dirname or '.')
+                           if pattern.match(name)),
+                          key=os.path.getmtime)
+        for segment in segments[:-self.backup_count]:
+            try:
+                os.remove(segment)
+            except OSError:
+                LOG.warning('Unable to remove file publisher segment %s',
+                            segment)
+
+    def write(self, records):
+        if not records:
+            return
+        now = time.time()
+        with self.lock:
+            if self.encoder is not None and (
+                    (self.segment_end and now >= self.segment_end) or
+                    (self.max_bytes and self.segment_bytes >= self.max_bytes)
+                    or not self.encoder.accepts(records)):
+                self._close_segment()
+            if self.encoder is None:
+                self._open(now)
+            self.segment_bytes += self.encoder.write(records)
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+
 
 class FilePublisher(publisher.ConfigPublisherBase):
     """Publisher metering data to file.
@@ -47,12 +327,35 @@ class FilePublisher(publisher.ConfigPublisherBase):
     or backup_count is missing, FileHandler will be used to save the metering
     data. If max_bytes and backup_count are present, RotatingFileHandler will
     be used to save the metering data.
+
+    Setting the `format` parameter to `json` or `msgpack` bypasses the
+    logging machinery and writes one newline-delimited JSON document, or one
+    msgpack object, per sample through a buffered stream. The `columnar`
+    format writes Parquet row groups when pyarrow is installed and falls back
+    to `json` otherwise, a new segment being started whenever the fields of
+    the records or their types change. In these modes the data is written to
+    segment files named after the path, the time they have been opened and
+    the host and process writing them, and these
+    additional parameters are supported:
+
+        - `compression`: `none` (the default), `gzip` or `zstd`, applied to
+          each segment as a whole
+        - `rotate_interval`: number of seconds after which a new segment is
+          started, segments being aligned on multiples of the interval
+        - `max_bytes`: size of encoded data after which a new segment is
+          started
+        - `backup_count`: number of segments of the process to keep, 0
+          keeps all of them
+        - `buffer_size`: size in bytes of the write buffer
+
+    e.g. file:///var/test?format=json&compression=gzip&rotate_interval=3600
     """
 
     def __init__(self, conf, parsed_url):
         super(FilePublisher, self).__init__(conf, parsed_url)
 
         self.publisher_logger = None
+        self.writer = None
         path = parsed_url.path
         if not path:
             LOG.error('The path for the file publisher is required')
@@ -62,16 +365,30 @@ class FilePublisher(publisher.ConfigPublisherBase):
         max_bytes = 0
         backup_count = 0
         # Handling other configuration options in the query string
-        if parsed_url.query:
-            params = urlparse.parse_qs(parsed_url.query)
-            if params.get('max_bytes') and params.get('backup_count'):
-                try:
-                    max_bytes = int(params.get('max_bytes')[0])
-                    backup_count = int(params.get('backup_count')[0])
-                except ValueError:
-                    LOG.error('max_bytes and backup_count should be '
-                              'numbers.')
-                    return
+        params = urlparse.parse_qs(parsed_url.query)
+        if params.get('format'):
+            try:
+                self.writer = SegmentWriter(
+                    path,
+                    fmt=params['format'][-1],
+                    compression=params.get('compression', ['none'])[-1],
+                    max_bytes=int(params.get('max_bytes', [0])[-1]),
+                    backup_count=int(params.get('backup_count', [0])[-1]),
+                    rotate_interval=int(
+                        params.get('rotate_interval', [0])[-1]),
+                    buffer_size=int(
+                        params.get('buffer_size', [64 * units.Ki])[-1]))
+            except ValueError as e:
+                LOG.error('Invalid file publisher configuration: %s', e)
+            return
+        if params.get('max_bytes') and params.get('backup_count'):
+            try:
+                max_bytes = int(params.get('max_bytes')[0])
+                backup_count = int(params.get('backup_count')[0])
+            except ValueError:
+                LOG.error('max_bytes and backup_count should be '
+                          'numbers.')
+                return
         # create rotating file handler
         rfh = logging.handlers.RotatingFileHandler(
             path, encoding='utf8', maxBytes=max_bytes,
@@ -88,7 +405,9 @@ class FilePublisher(publisher.ConfigPublisherBase):
 
         :param samples: Samples from pipeline after transformation
         """
-        if self.publisher_logger:
+        if self.writer:
+            self.writer.write([sample.as_dict() for sample in samples])
+        elif self.publisher_logger:
             for sample in samples:
                 self.publisher_logger.info(sample.as_dict())
 
@@ -97,6 +416,8 @@ class FilePublisher(publisher.ConfigPublisherBase):
 
         :param events: events from pipeline after transformation
         """
-        if self.publisher_logger:
+        if self.writer:
+            self.writer.write([event.as_dict() for event in events])
+        elif self.publisher_logger:
             for event in events:
                 self.publisher_logger.info(event.as_dict())
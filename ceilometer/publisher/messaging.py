@@ -18,6 +18,7 @@
 import abc
 import itertools
 import operator
+import time
 
 from oslo_config import cfg
 from oslo_log import log
@@ -222,33 +223,45 @@ class NotifierPublisher(MessagingPublisher):
 
     """
 
+    # these options are consumed by the publisher itself, they must not end
+    # up in the transport URL otherwise publishers only differing by their
+    # policy would not share their transport
+    PUBLISHER_OPTIONS = ('per_meter_topic', 'policy', 'max_queue_length',
+                         'max_retry')
+
     def __init__(self, conf, parsed_url, default_topic):
         super(NotifierPublisher, self).__init__(conf, parsed_url)
         options = urlparse.parse_qs(parsed_url.query)
-        topics = options.pop('topic', [default_topic])
+        self.topics = options.pop('topic', [default_topic])
         driver = options.pop('driver', ['rabbit'])[0]
         self.max_retry = int(options.get('max_retry', [100])[-1])
+        for option in self.PUBLISHER_OPTIONS:
+            options.pop(option, None)
 
-        url = None
+        self.url = None
         if parsed_url.netloc != '':
-            url = urlparse.urlunsplit([driver, parsed_url.netloc,
-                                       parsed_url.path,
-                                       urlparse.urlencode(options, True),
-                                       parsed_url.fragment])
-        self.notifier = oslo_messaging.Notifier(
-            messaging.get_transport(self.conf, url),
+            self.url = urlparse.urlunsplit([driver, parsed_url.netloc,
+                                            parsed_url.path,
+                                            urlparse.urlencode(options, True),
+                                            parsed_url.fragment])
+        self.notifier = messaging.get_shared_notifier(
+            messaging.get_transport(self.conf, self.url),
             driver=self.conf.publisher_notifier.telemetry_driver,
             publisher_id='telemetry.publisher.%s' % self.conf.host,
-            topics=topics,
+            topics=self.topics,
             retry=self.retry
         )
 
     def _send(self, event_type, data):
+        started = time.time()
         try:
             self.notifier.sample({}, event_type=event_type,
                                  payload=data)
         except oslo_messaging.MessageDeliveryFailure as e:
+            messaging.record_send(self.url, self.topics, len(data), started,
+                                  failed=True)
             raise_delivery_failure(e)
+        messaging.record_send(self.url, self.topics, len(data), started)
 
 
 class SampleNotifierPublisher(NotifierPublisher):
@@ -40,14 +40,20 @@ OPTS = [
 ]
 
 
+def _keyed_digest(secret):
+    if isinstance(secret, six.text_type):
+        secret = secret.encode('utf-8')
+    return hmac.new(secret, b'', hashlib.sha256)
+
+
 def compute_signature(message, secret):
     """Return the signature for a message dictionary."""
     if not secret:
         return ''
+    return _sign(message, _keyed_digest(secret))
 
-    if isinstance(secret, six.text_type):
-        secret = secret.encode('utf-8')
-    digest_maker = hmac.new(secret, b'', hashlib.sha256)
+
+def _sign(message, digest_maker):
     for name, value in utils.recursive_keypairs(message):
         if name == 'message_signature':
             # Skip any existing signature value, which would not have
@@ -81,29 +87,49 @@ def verify_signature(message, secret):
     return secretutils.constant_time_compare(new_sig, old_sig)
 
 
+def _meter_message(sample):
+    return {'source': sample.source,
+            'counter_name': sample.name,
+            'counter_type': sample.type,
+            'counter_unit': sample.unit,
+            'counter_volume': sample.volume,
+            'user_id': sample.user_id,
+            'project_id': sample.project_id,
+            'resource_id': sample.resource_id,
+            'timestamp': sample.timestamp,
+            'resource_metadata': sample.resource_metadata,
+            'message_id': sample.id,
+            'monotonic_time': sample.monotonic_time,
+            }
+
+
 def meter_message_from_counter(sample, secret):
     """Make a metering message ready to be published or stored.
 
     Returns a dictionary containing a metering message
     for a notification message and a Sample instance.
     """
-    msg = {'source': sample.source,
-           'counter_name': sample.name,
-           'counter_type': sample.type,
-           'counter_unit': sample.unit,
-           'counter_volume': sample.volume,
-           'user_id': sample.user_id,
-           'project_id': sample.project_id,
-           'resource_id': sample.resource_id,
-           'timestamp': sample.timestamp,
-           'resource_metadata': sample.resource_metadata,
-           'message_id': sample.id,
-           'monotonic_time': sample.monotonic_time,
-           }
+    msg = _meter_message(sample)
     msg['message_signature'] = compute_signature(msg, secret)
     return msg
 
 
+def meter_messages_from_counters(samples, secret):
+    """Make metering messages ready to be published or stored.
+
+    Same as meter_message_from_counter for a list of samples, the key of
+    the signatures being only set up once.
+    """
+    keyed_digest = _keyed_digest(secret) if secret else None
+    messages = []
+    for s in samples:
+        msg = _meter_message(s)
+        msg['message_signature'] = (_sign(msg, keyed_digest.copy())
+                                    if keyed_digest else '')
+        messages.append(msg)
+    return messages
+
+
 def message_from_event(event, secret):
     """Make an event message ready to be published or stored.
 
@@ -43,6 +43,115 @@ OPTS = [
                 help="Indicates if expirer expires only samples. If set true,"
                 " expired samples will be deleted, but residual"
                 " resource and meter definition data will remain."),
+    cfg.IntOpt('sql_expire_chunk_size',
+               default=10000, min=1,
+               help="Maximum number of rows deleted in a single transaction "
+               "by the expirer on SQL backends. Each chunk is committed, so "
+               "an interrupted expiry resumes where it stopped."),
+    cfg.FloatOpt('sql_expire_chunk_interval',
+                 default=0, min=0,
+                 help="Number of seconds the expirer sleeps between two "
+                 "chunks of deleted rows on SQL backends, to leave room to "
+                 "the recording of samples."),
+    cfg.IntOpt('sql_expire_workers',
+               default=1, min=1,
+               help="Number of time slices of expired samples deleted in "
+               "parallel by the expirer on SQL backends. SQLite and single "
+               "connection pools always use a single worker."),
+    cfg.IntOpt('sql_meter_cache_size',
+               default=1024, min=0,
+               help="Number of meter ids kept in memory by the SQL driver "
+               "to avoid looking them up for each sample (0 disables the "
+               "cache)."),
+    cfg.IntOpt('sql_resource_cache_size',
+               default=10000, min=0,
+               help="Number of resource ids kept in memory by the SQL driver "
+               "to avoid looking them up for each sample (0 disables the "
+               "cache)."),
+    cfg.IntOpt('sql_id_cache_ttl',
+               default=600, min=1,
+               help="Number of seconds a meter or resource id is kept in the "
+               "SQL driver caches. It should stay below "
+               "metering_time_to_live so ids of definitions removed by an "
+               "expirer running in another process are not reused."),
+    cfg.BoolOpt('sql_resource_summary',
+                default=False,
+                help="Maintain a table of the first and last sample "
+                "timestamps of each resource when recording samples, used "
+                "to list resources without scanning samples. Only "
+                "supported on MySQL and PostgreSQL. Run ceilometer-upgrade "
+                "after enabling it to fill the table."),
+    cfg.ListOpt('sql_rollup_resolutions',
+                default=[],
+                help="Resolutions, such as 5m, 1h or 1d, of the rollups of "
+                "samples maintained by the SQL driver when recording "
+                "samples. Statistics whose period and time range are "
+                "multiples of a resolution are computed from the coarsest "
+                "such rollup instead of the samples. Run ceilometer-upgrade "
+                "after adding a resolution to fill its rollups from the "
+                "existing samples."),
+    cfg.StrOpt('sql_sample_partitioning',
+               default='none', choices=['none', 'day', 'week'],
+               help="Partition the sample table of the SQL driver by day or "
+               "week, so that expired samples are removed by dropping "
+               "partitions and queries on a time range only read the "
+               "partitions holding it. Only supported on MySQL and "
+               "PostgreSQL 11 or later. Run ceilometer-upgrade after "
+               "enabling it to partition the table, which is rebuilt on "
+               "MySQL; the existing samples are kept in a single legacy "
+               "partition. MySQL drops the foreign keys of the partitioned "
+               "table, so the meter and resource id caches are disabled "
+               "there."),
+    cfg.IntOpt('sql_sample_partitions_ahead',
+               default=7, min=1,
+               help="Number of partitions of the sample table created in "
+               "advance, after the one of the current day or week, by "
+               "ceilometer-upgrade and ceilometer-expirer. The expirer "
+               "should run more often than they span."),
+    cfg.StrOpt('sql_metadata_store',
+               default='eav', choices=['eav', 'json'],
+               help="Where the SQL driver stores the queryable metadata of "
+               "resources: eav keeps a row per key in the metadata tables, "
+               "joined once per key of a metaquery, json keeps them in a "
+               "JSON column of the resource table, filtered without join. "
+               "json requires MySQL 5.7, PostgreSQL 9.4 or SQLite with its "
+               "JSON functions. Run ceilometer-upgrade after enabling it to "
+               "fill the column of the existing resources. Metaqueries do "
+               "not match the resources created while json was enabled "
+               "after switching back to eav."),
+    cfg.ListOpt('sql_metadata_indexed_keys',
+                default=[],
+                help="Metadata keys, such as instance_type or image.name, "
+                "indexed when sql_metadata_store is json. MySQL only uses "
+                "these indexes for string values. Run ceilometer-upgrade "
+                "after changing it to create and drop the indexes."),
+    cfg.IntOpt('complex_query_cache_size',
+               default=1000, min=0,
+               help="Number of complex query filters whose translation to "
+               "a database query is kept in memory by the SQL and MongoDB "
+               "drivers (0 disables the cache)."),
+    cfg.IntOpt('mongodb_statistics_max_time',
+               default=0, min=0,
+               help="Number of seconds after which MongoDB aborts the "
+               "aggregation computing statistics, failing the request "
+               "(0 means no limit). Requires MongoDB 2.6 or later."),
+    cfg.IntOpt('connection_warm_up',
+               default=0, min=0,
+               help="Number of database connections opened by the API and "
+               "the collector when they start, instead of on their first "
+               "requests. SQL backends open at most max_pool_size of "
+               "them."),
+    cfg.BoolOpt('sql_statement_cache',
+                default=True,
+                help="Keep the compiled statements of the sample, meter and "
+                "resource inserts and lookups in the SQL driver, so that "
+                "recording samples does not compile them again. Ignored "
+                "with SQLAlchemy 1.4 or later, which caches them itself."),
+    cfg.IntOpt('sample_fetch_size',
+               default=1000, min=1,
+               help="Number of samples fetched at once from the database "
+               "when iterating over the results of a sample query, which "
+               "bounds the memory used to read them whatever the limit."),
 ]
 
 
@@ -59,7 +168,17 @@ class StorageBadAggregate(Exception):
     code = 400
 
 
-def get_connection_from_config(conf):
+class StorageBadMarker(Exception):
+    """Error raised when the marker of a page can not be found."""
+    code = 400
+
+
+def get_connection_from_config(conf, warm_up=False):
+    """Return an open connection to the configured database.
+
+    :param warm_up: open connection_warm_up connections to the database
+                    right away, for the long running services.
+    """
     retries = conf.database.max_retries
 
     @tenacity.retry(
@@ -72,7 +191,10 @@ def get_connection_from_config(conf):
                conf.database.connection)
         return get_connection(conf, url)
 
-    return _inner()
+    conn = _inner()
+    if warm_up and conf.database.connection_warm_up:
+        conn.warm_up(conf.database.connection_warm_up)
+    return conn
 
 
 def get_connection(conf, url):
@@ -103,13 +225,16 @@ class SampleFilter(object):
     :param source: Optional source filter.
     :param message_id: Optional sample_id filter.
     :param metaquery: Optional filter on the metadata
+    :param marker: Optional (timestamp, message_id, counter_name) of the
+                   last sample of the previous page, only the samples
+                   following it in the order of get_samples are matched.
     """
     def __init__(self, user=None, project=None,
                  start_timestamp=None, start_timestamp_op=None,
                  end_timestamp=None, end_timestamp_op=None,
                  resource=None, meter=None,
                  source=None, message_id=None,
-                 metaquery=None):
+                 metaquery=None, marker=None):
         self.user = user
         self.project = project
         self.start_timestamp = utils.sanitize_timestamp(start_timestamp)
@@ -121,6 +246,7 @@ class SampleFilter(object):
         self.source = source
         self.metaquery = metaquery or {}
         self.message_id = message_id
+        self.marker = marker
 
     def __repr__(self):
         return ("<SampleFilter(user: %s,"
@@ -133,7 +259,8 @@ class SampleFilter(object):
                 " meter: %s,"
                 " source: %s,"
                 " metaquery: %s,"
-                " message_id: %s)>" %
+                " message_id: %s,"
+                " marker: %s)>" %
                 (self.user,
                  self.project,
                  self.start_timestamp,
@@ -144,4 +271,5 @@ class SampleFilter(object):
                  self.meter,
                  self.source,
                  self.metaquery,
-                 self.message_id))
+                 self.message_id,
+                 self.marker))
@@ -17,8 +17,11 @@
 
 import datetime
 import inspect
+import json
 import math
+import threading
 
+import cachetools
 from oslo_utils import timeutils
 import six
 from six import moves
@@ -71,6 +74,75 @@ def _handle_sort_key(model_name, sort_key=None):
     return sort_keys
 
 
+def _encode_filter_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+class CompiledQueryCache(object):
+    """LRU of the translations of complex query filters by a driver.
+
+    Filters are keyed by their canonical JSON encoding, so the translations
+    must not depend on anything else than the filter and the scope given
+    with it, and must not be modified by their users.
+    """
+
+    def __init__(self, size):
+        self._cache = cachetools.LRUCache(size) if size else None
+        self._lock = threading.Lock()
+
+    def get_or_compile(self, filter_expr, compile, *scope):
+        """Return the translation of a filter, compiling it if needed.
+
+        :param filter_expr: the filter expression of a complex query.
+        :param compile: a function translating the filter expression.
+        :param scope: other values the translation depends on.
+        """
+        if self._cache is None:
+            return compile(filter_expr)
+        key = json.dumps([filter_expr, scope], sort_keys=True,
+                         default=_encode_filter_value)
+        with self._lock:
+            compiled = self._cache.get(key)
+        if compiled is None:
+            compiled = compile(filter_expr)
+            with self._lock:
+                self._cache[key] = compiled
+        return compiled
+
+
+class PoolStatistics(object):
+    """Count the connection checkouts and statements of a driver.
+
+    The drivers feed it from the events of their database client, with
+    durations in seconds.
+    """
+
+    KINDS = ('checkout', 'statement')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = dict((kind, [0, 0.0, 0.0]) for kind in self.KINDS)
+
+    def record(self, kind, duration):
+        with self._lock:
+            stats = self._stats[kind]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def snapshot(self):
+        """Return the count, mean and maximum duration of each kind."""
+        result = {}
+        with self._lock:
+            for kind, (count, total, longest) in self._stats.items():
+                result['%ss' % kind] = count
+                result['%s_time_avg' % kind] = total / count if count else 0.0
+                result['%s_time_max' % kind] = longest
+        return result
+
+
 class Model(object):
     """Base class for storage API models."""
 
@@ -140,6 +212,16 @@ class Connection(object):
     def upgrade():
         """Migrate the database to `version` or the most recent version."""
 
+    def warm_up(self, count):
+        """Open connections to the database ahead of the first requests.
+
+        :param count: the number of connections to open.
+        """
+
+    def get_pool_stats(self):
+        """Return the size, usage and timings of the connection pool."""
+        return {}
+
     def record_metering_data_batch(self, samples):
         """Record the metering data in batch"""
         for s in samples:
@@ -172,7 +254,8 @@ class Connection(object):
     def get_resources(user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
-                      metaquery=None, resource=None, limit=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None):
         """Return an iterable of models.Resource instances.
 
         Iterable items containing resource information.
@@ -186,6 +269,9 @@ class Connection(object):
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
         :param limit: Maximum number of results to return.
+        :param marker: Optional resource_id of the last resource of the
+                       previous page, only the resources following it in
+                       the listing order are returned.
         """
         raise ceilometer.NotImplementedError('Resources not implemented')
 
@@ -209,6 +295,10 @@ class Connection(object):
     def get_samples(sample_filter, limit=None):
         """Return an iterable of model.Sample instances.
 
+        Samples are returned from the newest to the oldest, in an order
+        stable enough for the marker of the filter to resume the iteration
+        after the last sample returned.
+
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
         """
@@ -0,0 +1,205 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Incremental computation of the statistics of the HBase driver.
+
+HBase can not aggregate the samples itself, the driver streams the rows of
+the meter table and feeds them to these helpers, which only keep one
+accumulator per period and group.
+"""
+
+import datetime
+import math
+
+from oslo_utils import timeutils
+import six
+
+import ceilometer
+from ceilometer.i18n import _
+from ceilometer import storage
+from ceilometer.storage import models
+
+GROUPBY_FIELDS = ('user_id', 'project_id', 'resource_id')
+
+STANDARD_AGGREGATES = ('count', 'min', 'max', 'sum', 'avg')
+
+AGGREGATES = STANDARD_AGGREGATES + ('stddev', 'cardinality')
+
+CARDINALITY_FIELDS = ('user_id', 'project_id', 'resource_id')
+
+
+def validate(groupby, aggregate):
+    """Check that the statistics of a query can be computed.
+
+    :raises ceilometer.NotImplementedError: on unsupported groupby fields.
+    :raises storage.StorageBadAggregate: on invalid aggregates.
+    """
+    for group in groupby or []:
+        if group not in GROUPBY_FIELDS:
+            raise ceilometer.NotImplementedError('Unable to group by '
+                                                 'these fields')
+    for a in aggregate or []:
+        if a.func not in AGGREGATES:
+            msg = _('Invalid aggregation function: %s') % a.func
+            raise storage.StorageBadAggregate(msg)
+        if a.func == 'cardinality' and a.param not in CARDINALITY_FIELDS:
+            raise storage.StorageBadAggregate('Bad aggregate: %s.%s'
+                                              % (a.func, a.param))
+
+
+def columns(groupby, aggregate):
+    """Return the meter table columns needed to compute statistics."""
+    fields = set(groupby or [])
+    fields.update(a.param for a in aggregate or []
+                  if a.func == 'cardinality')
+    return (['f:timestamp', 'f:counter_volume', 'f:counter_unit'] +
+            ['f:%s' % f for f in sorted(fields)])
+
+
+class PeriodStatistics(object):
+    """Statistics of the samples of a period and a group."""
+
+    def __init__(self, cardinality=()):
+        self.unit = None
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.duration_start = None
+        self.duration_end = None
+        # NOTE: running mean and sum of squared deviations, Welford's
+        # algorithm, to compute the standard deviation in a single pass
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._distinct = dict((f, set()) for f in cardinality)
+
+    def update(self, entry):
+        """Add a sample, as deserialized from the meter table."""
+        volume = entry['counter_volume']
+        timestamp = entry['timestamp']
+        self.unit = entry['counter_unit']
+        self.count += 1
+        self.sum += volume
+        self.min = volume if self.min is None else min(self.min, volume)
+        self.max = volume if self.max is None else max(self.max, volume)
+        if self.duration_start is None or timestamp < self.duration_start:
+            self.duration_start = timestamp
+        if self.duration_end is None or timestamp > self.duration_end:
+            self.duration_end = timestamp
+        delta = volume - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (volume - self._mean)
+        for field, values in six.iteritems(self._distinct):
+            values.add(entry.get(field))
+
+    @property
+    def avg(self):
+        return self.sum / float(self.count)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self._m2 / self.count)
+
+    def cardinality(self, field):
+        return len(self._distinct[field])
+
+    def to_model(self, period, period_start, period_end, groupby=None,
+                 aggregate=None):
+        """Return the models.Statistics of the accumulated samples."""
+        data = {}
+        if not aggregate:
+            for func in STANDARD_AGGREGATES:
+                data[func] = getattr(self, func)
+        else:
+            data['aggregate'] = {}
+            for a in aggregate:
+                if a.func == 'cardinality':
+                    value = self.cardinality(a.param)
+                else:
+                    value = getattr(self, a.func)
+                key = '%s%s' % (a.func, '/%s' % a.param if a.param else '')
+                data['aggregate'][key] = value
+                if a.func in STANDARD_AGGREGATES:
+                    data[a.func] = value
+        return models.Statistics(
+            unit=self.unit,
+            period=period,
+            period_start=period_start,
+            period_end=period_end,
+            duration=timeutils.delta_seconds(self.duration_start,
+                                             self.duration_end),
+            duration_start=self.duration_start,
+            duration_end=self.duration_end,
+            groupby=groupby,
+            **data)
+
+
+def aggregate_periods(entries, start_time, period, groupby=None,
+                      cardinality=()):
+    """Aggregate samples into period and group buckets.
+
+    :param entries: iterable of samples as deserialized from the meter
+                    table.
+    :param start_time: start of the first period, only used with a period.
+    :param period: length of the periods in seconds, 0 for a single one.
+    :param groupby: fields to group the samples by.
+    :param cardinality: fields whose distinct values are counted.
+    :returns: a dict of PeriodStatistics indexed by the period start, or
+              None without period, and the tuple of the group values.
+    """
+    groupby = groupby or []
+    buckets = {}
+    for entry in entries:
+        period_start = None
+        if period:
+            offset = int(timeutils.delta_seconds(
+                start_time, entry['timestamp']) / period) * period
+            period_start = start_time + datetime.timedelta(0, offset)
+        key = (period_start, tuple(entry.get(g) for g in groupby))
+        stats = buckets.get(key)
+        if stats is None:
+            stats = buckets[key] = PeriodStatistics(cardinality)
+        stats.update(entry)
+    return buckets
+
+
+def to_statistics(buckets, start_time, end_time, period, groupby=None,
+                  aggregate=None):
+    """Return the models.Statistics of buckets ordered by period start.
+
+    :param start_time: start of the single period without period, defaults
+                       to the oldest sample.
+    :param end_time: end of the single period without period, defaults to
+                     the newest sample.
+    """
+    if not buckets:
+        return []
+    if not period:
+        start_time = start_time or min(
+            s.duration_start for s in buckets.values())
+        end_time = end_time or max(s.duration_end for s in buckets.values())
+
+    def sort_key(item):
+        (period_start, groups), stats = item
+        return period_start, [(g is not None, g) for g in groups]
+
+    results = []
+    for (period_start, groups), stats in sorted(buckets.items(),
+                                                key=sort_key):
+        if period:
+            period_end = period_start + datetime.timedelta(0, period)
+        else:
+            period_start, period_end = start_time, end_time
+        results.append(stats.to_model(
+            period or 0, period_start, period_end,
+            dict(zip(groupby, groups)) if groupby else None, aggregate))
+    return results
@@ -31,8 +31,11 @@ class MTable(object):
         self.name = name
         self.families = families
         self._rows_with_ts = {}
+        # Number of calls which would be a Thrift round trip with HBase
+        self.round_trips = 0
 
     def row(self, key, columns=None):
+        self.round_trips += 1
         if key not in self._rows_with_ts:
             return {}
         res = copy.copy(sorted(six.iteritems(
@@ -47,7 +50,15 @@ class MTable(object):
     def rows(self, keys):
         return ((k, self.row(k)) for k in keys)
 
+    def batch(self, timestamp=None, batch_size=None, transaction=False,
+              wal=True):
+        return MBatch(self, timestamp, batch_size)
+
     def put(self, key, data, ts=None):
+        self.round_trips += 1
+        self._put(key, data, ts)
+
+    def _put(self, key, data, ts=None):
         # Note: Now we use 'timestamped' but only for one Resource table.
         # That's why we may put ts='0' in case when ts is None. If it is
         # needed to use 2 types of put in one table ts=0 cannot be used.
@@ -62,6 +73,7 @@ class MTable(object):
                 self._rows_with_ts[key].update({ts: data})
 
     def delete(self, key):
+        self.round_trips += 1
         del self._rows_with_ts[key]
 
     def _get_latest_dict(self, row):
@@ -77,7 +89,8 @@ class MTable(object):
         return data
 
     def scan(self, filter=None, columns=None, row_start=None, row_stop=None,
-             limit=None):
+             limit=None, batch_size=1000):
+        self.round_trips += 1
         columns = columns or []
         sorted_keys = sorted(self._rows_with_ts)
         # copy data between row_start and row_stop into a dict
@@ -243,6 +256,43 @@ class MTable(object):
         return r
 
 
+class MBatch(object):
+    """HappyBase.Batch mock."""
+    def __init__(self, table, timestamp=None, batch_size=None):
+        self.table = table
+        self.timestamp = timestamp
+        self.batch_size = batch_size
+        self._mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.send()
+
+    def send(self):
+        if not self._mutations:
+            return
+        self.table.round_trips += 1
+        for key, data in self._mutations:
+            if data is None:
+                del self.table._rows_with_ts[key]
+            else:
+                self.table._put(key, data, self.timestamp)
+        self._mutations = []
+
+    def _add(self, key, data):
+        self._mutations.append((key, data))
+        if self.batch_size and len(self._mutations) >= self.batch_size:
+            self.send()
+
+    def put(self, key, data, wal=None):
+        self._add(key, data)
+
+    def delete(self, key, columns=None, wal=None):
+        self._add(key, None)
+
+
 class MConnectionPool(object):
     def __init__(self):
         self.conn = MConnection()
@@ -11,15 +11,14 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import datetime
 import operator
 import time
 
 from oslo_log import log
 from oslo_utils import timeutils
 
-import ceilometer
 from ceilometer.storage import base
+from ceilometer.storage.hbase import aggregation as hbase_aggregation
 from ceilometer.storage.hbase import base as hbase_base
 from ceilometer.storage.hbase import migration as hbase_migration
 from ceilometer.storage.hbase import utils as hbase_utils
@@ -36,9 +35,19 @@ AVAILABLE_CAPABILITIES = {
                             'metadata': True}},
     'samples': {'query': {'simple': True,
                           'metadata': True}},
-    'statistics': {'query': {'simple': True,
+    'statistics': {'groupby': True,
+                   'query': {'simple': True,
                              'metadata': True},
-                   'aggregation': {'standard': True}},
+                   'aggregation': {'standard': True,
+                                   'selectable': {
+                                       'max': True,
+                                       'min': True,
+                                       'sum': True,
+                                       'avg': True,
+                                       'count': True,
+                                       'stddev': True,
+                                       'cardinality': True}}
+                   },
 }
 
 
@@ -46,6 +55,10 @@ AVAILABLE_STORAGE_CAPABILITIES = {
     'storage': {'production_ready': True},
 }
 
+# Maximum number of rows sent to HBase in a single Thrift call when
+# recording a batch of samples.
+WRITE_BATCH_SIZE = 1000
+
 
 class Connection(hbase_base.Connection, base.Connection):
     """Put the metering data into a HBase database
@@ -143,13 +156,20 @@ class Connection(hbase_base.Connection, base.Connection):
         :param data: a dictionary such as returned by
           ceilometer.publisher.utils.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
 
-        # We must not record thing.
-        data.pop("monotonic_time", None)
+    def record_metering_data_batch(self, samples):
+        """Record the metering data in batch.
 
-        with self.conn_pool.connection() as conn:
-            resource_table = conn.table(self.RESOURCE_TABLE)
-            meter_table = conn.table(self.METER_TABLE)
+        :param samples: a list of samples dict.
+        """
+        recorded_at = timeutils.utcnow()
+        resources = {}
+        records = []
+        for data in samples:
+            data = dict(data)
+            # We must not record thing.
+            data.pop("monotonic_time", None)
 
             resource_metadata = data.get('resource_metadata', {})
             # Determine the name of new meter
@@ -171,8 +191,14 @@ class Connection(hbase_base.Connection, base.Connection):
             # automatically 'on the top'. It is needed to keep metadata
             # up-to-date: metadata from newest samples is considered as actual.
             ts = int(time.mktime(data['timestamp'].timetuple()) * 1000)
-            resource_table.put(hbase_utils.encode_unicode(data['resource_id']),
-                               resource, ts)
+            # NOTE: the samples of a resource are merged into a single row,
+            # each cell keeping the value and timestamp of the newest sample
+            # writing it, as if the samples had been put one by one.
+            cells = resources.setdefault(
+                hbase_utils.encode_unicode(data['resource_id']), {})
+            for qualifier, value in resource.items():
+                if qualifier not in cells or cells[qualifier][0] <= ts:
+                    cells[qualifier] = (ts, value)
 
             # Rowkey consists of reversed timestamp, meter and a
             # message uuid for purposes of uniqueness
@@ -180,13 +206,35 @@ class Connection(hbase_base.Connection, base.Connection):
                                           data['message_id'])
             record = hbase_utils.serialize_entry(
                 data, **{'source': data['source'], 'rts': rts,
-                         'message': data, 'recorded_at': timeutils.utcnow()})
-            meter_table.put(row, record)
+                         'message': data, 'recorded_at': recorded_at})
+            records.append((row, record))
+
+        # A batch mutation carries a single timestamp, the resource rows
+        # are written by one batch per distinct cell timestamp.
+        resource_puts = {}
+        for row, cells in resources.items():
+            for qualifier, (ts, value) in cells.items():
+                resource_puts.setdefault(ts, {}).setdefault(
+                    row, {})[qualifier] = value
+
+        with self.conn_pool.connection() as conn:
+            resource_table = conn.table(self.RESOURCE_TABLE)
+            for ts, rows in sorted(resource_puts.items()):
+                with resource_table.batch(timestamp=ts,
+                                          batch_size=WRITE_BATCH_SIZE) as b:
+                    for row, cells in rows.items():
+                        b.put(row, cells)
+
+            meter_table = conn.table(self.METER_TABLE)
+            with meter_table.batch(batch_size=WRITE_BATCH_SIZE) as b:
+                for row, record in records:
+                    b.put(row, record)
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
-                      metaquery=None, resource=None, limit=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None):
         """Return an iterable of models.Resource instances
 
         :param user: Optional ID for user that owns the resource.
@@ -199,6 +247,9 @@ class Connection(hbase_base.Connection, base.Connection):
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
         :param limit: Maximum number of results to return.
+        :param marker: Optional resource_id of the last resource of the
+                       previous page, only the resources following it in
+                       the listing order are returned.
         """
         if limit == 0:
             return
@@ -210,11 +261,27 @@ class Connection(hbase_base.Connection, base.Connection):
                                                       end_timestamp,
                                                       end_timestamp_op,
                                                       source, q)
+        row_start = None
+        scan_limit = limit
+        if marker is not None:
+            # NOTE: rows are sorted by resource id, the scan starts at the
+            # marker which is skipped.
+            row_start = hbase_utils.encode_unicode(marker)
+            scan_limit = limit + 1 if limit else limit
+        count = 0
         with self.conn_pool.connection() as conn:
             resource_table = conn.table(self.RESOURCE_TABLE)
             LOG.debug("Query Resource table: %s", q)
             for resource_id, data in resource_table.scan(filter=q,
-                                                         limit=limit):
+                                                         row_start=row_start,
+                                                         limit=scan_limit):
+                if count == limit:
+                    break
+                if (row_start is not None and
+                        hbase_utils.encode_unicode(resource_id) ==
+                        row_start):
+                    continue
+                count += 1
                 f_res, meters, md = hbase_utils.deserialize_entry(
                     data)
                 resource_id = hbase_utils.encode_unicode(resource_id)
@@ -320,38 +387,35 @@ class Connection(hbase_base.Connection, base.Connection):
             q, start, stop, columns = (hbase_utils.
                                        make_sample_query_from_filter
                                        (sample_filter, require_meter=False))
+            marker_row = None
+            scan_limit = limit
+            if sample_filter.marker:
+                # NOTE: rows are sorted by meter, reversed timestamp and
+                # message id, the scan starts at the marker which is skipped.
+                ts_marker, message_id, counter_name = sample_filter.marker
+                marker_row = hbase_utils.prepare_key(
+                    counter_name, hbase_utils.timestamp(ts_marker),
+                    message_id)
+                start = max(start, marker_row) if start else marker_row
+                marker_row = hbase_utils.encode_unicode(marker_row)
+                scan_limit = limit + 1 if limit else limit
             LOG.debug("Query Meter Table: %s", q)
-            gen = meter_table.scan(filter=q, row_start=start, row_stop=stop,
-                                   limit=limit, columns=columns)
-            for ignored, meter in gen:
+            gen = meter_table.scan(
+                filter=q, row_start=start, row_stop=stop, limit=scan_limit,
+                columns=columns,
+                batch_size=self.conf.database.sample_fetch_size)
+            count = 0
+            for row, meter in gen:
+                if hbase_utils.encode_unicode(row) == marker_row:
+                    continue
                 d_meter = hbase_utils.deserialize_entry(meter)[0]
                 d_meter['message']['counter_volume'] = (
                     float(d_meter['message']['counter_volume']))
                 d_meter['message']['recorded_at'] = d_meter['recorded_at']
                 yield models.Sample(**d_meter['message'])
-
-    @staticmethod
-    def _update_meter_stats(stat, meter):
-        """Do the stats calculation on a requested time bucket in stats dict
-
-        :param stats: dict where aggregated stats are kept
-        :param index: time bucket index in stats
-        :param meter: meter record as returned from HBase
-        :param start_time: query start time
-        :param period: length of the time bucket
-        """
-        vol = meter['counter_volume']
-        ts = meter['timestamp']
-        stat.unit = meter['counter_unit']
-        stat.min = min(vol, stat.min or vol)
-        stat.max = max(vol, stat.max)
-        stat.sum = vol + (stat.sum or 0)
-        stat.count += 1
-        stat.avg = (stat.sum / float(stat.count))
-        stat.duration_start = min(ts, stat.duration_start or ts)
-        stat.duration_end = max(ts, stat.duration_end or ts)
-        stat.duration = (timeutils.delta_seconds(stat.duration_start,
-                                                 stat.duration_end))
+                count += 1
+                if count == limit:
+                    break
 
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
@@ -363,78 +427,45 @@ class Connection(hbase_base.Connection, base.Connection):
         .. note::
 
           Due to HBase limitations the aggregations are implemented
-          in the driver itself, therefore this method will be quite slow
-          because of all the Thrift traffic it is going to create.
+          in the driver itself. The rows of the meter in the time range are
+          streamed with only the columns needed and aggregated on the fly,
+          keeping one accumulator per period and group.
         """
-        if groupby:
-            raise ceilometer.NotImplementedError("Group by not implemented.")
-
-        if aggregate:
-            raise ceilometer.NotImplementedError(
-                'Selectable aggregates not implemented')
+        hbase_aggregation.validate(groupby, aggregate)
+        cardinality = [a.param for a in aggregate or []
+                       if a.func == 'cardinality']
 
         with self.conn_pool.connection() as conn:
             meter_table = conn.table(self.METER_TABLE)
             q, start, stop, columns = (hbase_utils.
                                        make_sample_query_from_filter
                                        (sample_filter))
-            # These fields are used in statistics' calculating
-            columns.extend(['f:timestamp', 'f:counter_volume',
-                            'f:counter_unit'])
-            meters = map(hbase_utils.deserialize_entry,
-                         list(meter for (ignored, meter) in
-                              meter_table.scan(
-                                  filter=q, row_start=start,
-                                  row_stop=stop, columns=columns)))
-
-        if sample_filter.start_timestamp:
+
+            def scan(columns):
+                # NOTE: the scan is bounded to the rows of the meter in the
+                # time range, as the row keys hold the reversed timestamp.
+                LOG.debug("Query Meter Table: %s", q)
+                return (hbase_utils.deserialize_entry(meter)[0]
+                        for ignored, meter in meter_table.scan(
+                            filter=q, row_start=start, row_stop=stop,
+                            columns=columns,
+                            batch_size=self.conf.database.sample_fetch_size))
+
             start_time = sample_filter.start_timestamp
-        elif meters:
-            start_time = meters[-1][0]['timestamp']
-        else:
-            start_time = None
-
-        if sample_filter.end_timestamp:
-            end_time = sample_filter.end_timestamp
-        elif meters:
-            end_time = meters[0][0]['timestamp']
-        else:
-            end_time = None
-
-        results = []
-
-        if not period:
-            period = 0
-            period_start = start_time
-            period_end = end_time
-
-        # As our HBase meters are stored as newest-first, we need to iterate
-        # in the reverse order
-        for meter in meters[::-1]:
-            ts = meter[0]['timestamp']
-            if period:
-                offset = int(timeutils.delta_seconds(
-                    start_time, ts) / period) * period
-                period_start = start_time + datetime.timedelta(0, offset)
-
-            if not results or not results[-1].period_start == period_start:
-                if period:
-                    period_end = period_start + datetime.timedelta(
-                        0, period)
-                results.append(
-                    models.Statistics(unit='',
-                                      count=0,
-                                      min=0,
-                                      max=0,
-                                      avg=0,
-                                      sum=0,
-                                      period=period,
-                                      period_start=period_start,
-                                      period_end=period_end,
-                                      duration=None,
-                                      duration_start=None,
-                                      duration_end=None,
-                                      groupby=None)
-                )
-            self._update_meter_stats(results[-1], meter[0])
-        return results
+            if period and not start_time:
+                # NOTE: periods start at the oldest sample, which is the last
+                # row as the meters are stored newest-first.
+                entry = None
+                for entry in scan(columns + ['f:timestamp']):
+                    pass
+                if entry is None:
+                    return []
+                start_time = entry['timestamp']
+
+            buckets = hbase_aggregation.aggregate_periods(
+                scan(columns + hbase_aggregation.columns(groupby, aggregate)),
+                start_time, period, groupby, cardinality)
+
+        return hbase_aggregation.to_statistics(
+            buckets, start_time, sample_filter.end_timestamp, period,
+            groupby, aggregate)
@@ -54,7 +54,8 @@ class Connection(base.Connection):
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
-                      metaquery=None, resource=None, limit=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None):
         """Return an iterable of dictionaries containing resource information.
 
         { 'resource_id': UUID of the resource,
@@ -75,6 +76,9 @@ class Connection(base.Connection):
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
         :param limit: Maximum number of results to return.
+        :param marker: Optional resource_id of the last resource of the
+                       previous page, only the resources following it in
+                       the listing order are returned.
         """
         return []
 
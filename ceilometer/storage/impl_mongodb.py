@@ -21,20 +21,17 @@ import operator
 
 import copy
 import datetime
-import uuid
 
-import bson.code
-import bson.objectid
+import bson.son
 from oslo_log import log
 from oslo_utils import timeutils
 import pymongo
 import six
 
-import ceilometer
-from ceilometer.i18n import _
 from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import models
+from ceilometer.storage.mongo import statistics as mongo_statistics
 from ceilometer.storage.mongo import utils as pymongo_utils
 from ceilometer.storage import pymongo_base
 from ceilometer import utils
@@ -81,58 +78,13 @@ class Connection(pymongo_base.Connection):
                                        AVAILABLE_CAPABILITIES)
     CONNECTION_POOL = pymongo_utils.ConnectionPool()
 
-    STANDARD_AGGREGATES = dict([(a.name, a) for a in [
-        pymongo_utils.SUM_AGGREGATION, pymongo_utils.AVG_AGGREGATION,
-        pymongo_utils.MIN_AGGREGATION, pymongo_utils.MAX_AGGREGATION,
-        pymongo_utils.COUNT_AGGREGATION,
-    ]])
-
-    AGGREGATES = dict([(a.name, a) for a in [
-        pymongo_utils.SUM_AGGREGATION,
-        pymongo_utils.AVG_AGGREGATION,
-        pymongo_utils.MIN_AGGREGATION,
-        pymongo_utils.MAX_AGGREGATION,
-        pymongo_utils.COUNT_AGGREGATION,
-        pymongo_utils.STDDEV_AGGREGATION,
-        pymongo_utils.CARDINALITY_AGGREGATION,
-    ]])
+    STANDARD_AGGREGATES = mongo_statistics.STANDARD_AGGREGATES
+
+    AGGREGATES = mongo_statistics.AGGREGATES
 
     SORT_OPERATION_MAPPING = {'desc': (pymongo.DESCENDING, '$lt'),
                               'asc': (pymongo.ASCENDING, '$gt')}
 
-    MAP_RESOURCES = bson.code.Code("""
-    function () {
-        emit(this.resource_id,
-             {user_id: this.user_id,
-              project_id: this.project_id,
-              source: this.source,
-              first_timestamp: this.timestamp,
-              last_timestamp: this.timestamp,
-              metadata: this.resource_metadata})
-    }""")
-
-    REDUCE_RESOURCES = bson.code.Code("""
-    function (key, values) {
-        var merge = {user_id: values[0].user_id,
-                     project_id: values[0].project_id,
-                     source: values[0].source,
-                     first_timestamp: values[0].first_timestamp,
-                     last_timestamp: values[0].last_timestamp,
-                     metadata: values[0].metadata}
-        values.forEach(function(value) {
-            if (merge.first_timestamp - value.first_timestamp > 0) {
-                merge.first_timestamp = value.first_timestamp;
-                merge.user_id = value.user_id;
-                merge.project_id = value.project_id;
-                merge.source = value.source;
-            } else if (merge.last_timestamp - value.last_timestamp <= 0) {
-                merge.last_timestamp = value.last_timestamp;
-                merge.metadata = value.metadata;
-            }
-        });
-        return merge;
-      }""")
-
     _GENESIS = datetime.datetime(year=datetime.MINYEAR, month=1, day=1)
     _APOCALYPSE = datetime.datetime(year=datetime.MAXYEAR, month=12, day=31,
                                     hour=23, minute=59, second=59)
@@ -157,12 +109,17 @@ class Connection(pymongo_base.Connection):
         if connection_options.get('username'):
             self.db.authenticate(connection_options['username'],
                                  connection_options['password'])
+        self._resources_index_checked = False
 
         # NOTE(jd) Upgrading is just about creating index, so let's do this
         # on connection to be sure at least the TTL is correctly updated if
         # needed.
         self.upgrade()
 
+    def get_pool_stats(self):
+        """Return the timings of the connection pool of the client."""
+        return self.conn.pool_stats.snapshot()
+
     @staticmethod
     def update_ttl(ttl, ttl_index_name, index_field, coll):
         """Update or create time_to_live indexes.
@@ -255,89 +212,63 @@ class Connection(pymongo_base.Connection):
 
         :param samples: a list of samples dict.
         """
-        # Record the updated resource metadata - we use $setOnInsert to
-        # unconditionally insert sample timestamps and resource metadata
-        # (in the update case, this must be conditional on the sample not
-        # being out-of-order)
-
-        # We must not store this
-        samples = copy.deepcopy(samples)
-
+        # Project the samples into the records to insert, the caller owns
+        # the sample dicts and the driver adds a new key '_id'. Only the
+        # metadata is copied as improve_keys modifies it in place.
+        recorded_at = timeutils.utcnow()
+        records = []
         for sample in samples:
-            sample.pop("monotonic_time", None)
-
-        sorted_samples = sorted(
-            copy.deepcopy(samples),
-            key=lambda s: (s['resource_id'], s['timestamp']))
-        res_grouped_samples = itertools.groupby(
-            sorted_samples, key=operator.itemgetter('resource_id'))
-        samples_to_update_resource = []
-        for resource_id, g_samples in res_grouped_samples:
-            g_samples = list(g_samples)
-            g_samples[-1]['meter'] = [{'counter_name': s['counter_name'],
-                                       'counter_type': s['counter_type'],
-                                       'counter_unit': s['counter_unit'],
-                                       } for s in g_samples]
-            g_samples[-1]['last_sample_timestamp'] = g_samples[-1]['timestamp']
-            g_samples[-1]['first_sample_timestamp'] = g_samples[0]['timestamp']
-            samples_to_update_resource.append(g_samples[-1])
-        for sample in samples_to_update_resource:
-            sample['resource_metadata'] = pymongo_utils.improve_keys(
-                sample.pop('resource_metadata'))
-            resource = self.db.resource.find_one_and_update(
-                {'_id': sample['resource_id']},
-                {'$set': {'project_id': sample['project_id'],
-                          'user_id': sample['user_id'],
-                          'source': sample['source'],
+            record = dict(sample)
+            # We must not store this
+            record.pop('monotonic_time', None)
+            record['recorded_at'] = recorded_at
+            record['resource_metadata'] = pymongo_utils.improve_keys(
+                copy.deepcopy(sample['resource_metadata']))
+            records.append(record)
+
+        # Record the updated resource metadata in a single ordered bulk
+        # write. The first update of a resource inserts it if needed and
+        # widens its sample timestamps range with $max/$min, which leave a
+        # null first sample timestamp of a resource document dating from
+        # before we started recording these timestamps untouched. The
+        # metadata is then only updated if the latest sample of the batch
+        # is also the latest sample of the resource (the usual in-order
+        # case).
+        # NOTE: the conditional update is a second operation rather than
+        # an aggregation pipeline update, which requires MongoDB 4.2+ and
+        # pymongo 3.9+.
+        requests = []
+        sorted_records = sorted(
+            records, key=operator.itemgetter('resource_id', 'timestamp'))
+        for resource_id, g_records in itertools.groupby(
+                sorted_records, key=operator.itemgetter('resource_id')):
+            g_records = list(g_records)
+            first, last = g_records[0], g_records[-1]
+            meters = [{'counter_name': r['counter_name'],
+                       'counter_type': r['counter_type'],
+                       'counter_unit': r['counter_unit'],
+                       } for r in g_records]
+            requests.append(pymongo.UpdateOne(
+                {'_id': resource_id},
+                {'$set': {'project_id': last['project_id'],
+                          'user_id': last['user_id'],
+                          'source': last['source'],
                           },
-                 '$setOnInsert': {
-                     'metadata': sample['resource_metadata'],
-                     'first_sample_timestamp': sample['timestamp'],
-                     'last_sample_timestamp': sample['timestamp'],
-                    },
-                 '$addToSet': {
-                     'meter': {'$each': sample['meter']},
-                    },
+                 '$setOnInsert': {'metadata': last['resource_metadata']},
+                 '$max': {'last_sample_timestamp': last['timestamp']},
+                 '$min': {'first_sample_timestamp': first['timestamp']},
+                 '$addToSet': {'meter': {'$each': meters}},
                  },
-                upsert=True,
-                return_document=pymongo.ReturnDocument.AFTER,
-            )
-
-            # only update last sample timestamp if actually later (the usual
-            # in-order case)
-            last_sample_timestamp = resource.get('last_sample_timestamp')
-            if (last_sample_timestamp is None or
-                    last_sample_timestamp <= sample['last_sample_timestamp']):
-                self.db.resource.update_one(
-                    {'_id': sample['resource_id']},
-                    {'$set': {'metadata': sample['resource_metadata'],
-                              'last_sample_timestamp':
-                                  sample['last_sample_timestamp']}}
-                )
-
-            # only update first sample timestamp if actually earlier (
-            # the unusual out-of-order case)
-            # NOTE: a null first sample timestamp is not updated as this
-            # indicates a pre-existing resource document dating from before
-            # we started recording these timestamps in the resource collection
-            first_sample_timestamp = resource.get('first_sample_timestamp')
-            if (first_sample_timestamp is not None and
-                    first_sample_timestamp > sample['first_sample_timestamp']):
-                self.db.resource.update_one(
-                    {'_id': sample['resource_id']},
-                    {'$set': {'first_sample_timestamp':
-                              sample['first_sample_timestamp']}}
-                )
-
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.deepcopy(samples)
-        for s in record:
-            s['recorded_at'] = timeutils.utcnow()
-            s['resource_metadata'] = pymongo_utils.improve_keys(
-                s.pop('resource_metadata'))
-        self.db.meter.insert_many(record)
+                upsert=True))
+            requests.append(pymongo.UpdateOne(
+                {'_id': resource_id,
+                 'last_sample_timestamp': last['timestamp']},
+                {'$set': {'metadata': last['resource_metadata']}}))
+        if requests:
+            self.db.resource.bulk_write(requests, ordered=True)
+
+        if records:
+            self.db.meter.insert_many(records)
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
@@ -368,10 +299,52 @@ class Connection(pymongo_base.Connection):
 
         return sort_instructions, operation
 
+    @staticmethod
+    def _apply_marker(collection, query, sort_instructions, marker):
+        """Restrict a resource query to the resources after a marker."""
+        sort_instructions.append(('_id', sort_instructions[-1][1]))
+        if marker is None:
+            return
+        last = collection.find_one({'_id': marker})
+        if last is None:
+            raise storage.StorageBadMarker('Unknown marker: %s' % marker)
+        query.update(pymongo_utils.make_keyset_query(sort_instructions,
+                                                     last))
+
+    @staticmethod
+    def _make_resources_pipeline(query):
+        """Return the aggregation pipeline grouping samples by resource.
+
+        The samples are sorted by timestamp so that the owner and source of a
+        resource come from its first sample, and its metadata from its last
+        one.
+        """
+        return [{'$match': query},
+                {'$sort': {'timestamp': 1}},
+                {'$group': {'_id': '$resource_id',
+                            'user_id': {'$first': '$user_id'},
+                            'project_id': {'$first': '$project_id'},
+                            'source': {'$first': '$source'},
+                            'first_sample_timestamp': {'$min': '$timestamp'},
+                            'last_sample_timestamp': {'$max': '$timestamp'},
+                            'metadata': {'$last': '$resource_metadata'}}}]
+
+    def _check_resources_index(self):
+        """Warn once if the meter collection misses the pipeline index."""
+        if self._resources_index_checked:
+            return
+        self._resources_index_checked = True
+        if not pymongo_utils.index_covers(self.db.meter, ['timestamp']):
+            LOG.warning('No index of the meter collection starts with the '
+                        'sample timestamp, listing resources in a time range '
+                        'will scan all the samples. Run ceilometer-upgrade '
+                        'to create it.')
+
     def _get_time_constrained_resources(self, query,
                                         start_timestamp, start_timestamp_op,
                                         end_timestamp, end_timestamp_op,
-                                        metaquery, resource, limit):
+                                        metaquery, resource, limit,
+                                        marker=None):
         """Return an iterable of models.Resource instances
 
         Items are constrained by sample timestamp.
@@ -382,6 +355,7 @@ class Connection(pymongo_base.Connection):
         :param end_timestamp_op: end time operator, like lt, le.
         :param metaquery: dict with metadata to match on.
         :param resource: resource filter.
+        :param marker: resource_id of the last resource of the previous page.
         """
         if resource is not None:
             query['resource_id'] = resource
@@ -390,59 +364,56 @@ class Connection(pymongo_base.Connection):
         query.update(dict(('resource_' + k, v)
                           for (k, v) in six.iteritems(metaquery)))
 
-        # FIXME(dhellmann): This may not perform very well,
-        # but doing any better will require changing the database
-        # schema and that will need more thought than I have time
-        # to put into it today.
-        # Look for resources matching the above criteria and with
-        # samples in the time range we care about, then change the
-        # resource query to return just those resources by id.
+        # Look for the samples matching the above criteria in the time
+        # range we care about and group them by resource on the server.
         ts_range = pymongo_utils.make_timestamp_range(start_timestamp,
                                                       end_timestamp,
                                                       start_timestamp_op,
                                                       end_timestamp_op)
         if ts_range:
             query['timestamp'] = ts_range
+        self._check_resources_index()
 
-        sort_keys = base._handle_sort_key('resource')
+        keys = base._handle_sort_key('resource')
+        sort_keys = ['last_sample_timestamp' if i == 'timestamp' else i
+                     for i in keys]
         sort_instructions = self._build_sort_instructions(sort_keys)[0]
+        sort_instructions.append(('_id', sort_instructions[-1][1]))
+
+        pipeline = self._make_resources_pipeline(query)
+        if marker is not None:
+            marker_query = dict(query, resource_id=marker)
+            last = list(self._get_results(self.db.meter.aggregate(
+                self._make_resources_pipeline(marker_query))))
+            if not last:
+                raise storage.StorageBadMarker('Unknown marker: %s' % marker)
+            pipeline.append({'$match': pymongo_utils.make_keyset_query(
+                sort_instructions, last[0])})
+        pipeline.append({'$sort': bson.son.SON(sort_instructions)})
+        if limit is not None:
+            pipeline.append({'$limit': limit})
 
-        # use a unique collection name for the results collection,
-        # as result post-sorting (as oppposed to reduce pre-sorting)
-        # is not possible on an inline M-R
-        out = 'resource_list_%s' % uuid.uuid4()
-        self.db.meter.map_reduce(self.MAP_RESOURCES,
-                                 self.REDUCE_RESOURCES,
-                                 out=out,
-                                 sort={'resource_id': 1},
-                                 query=query)
-
-        try:
-            if limit is not None:
-                results = self.db[out].find(sort=sort_instructions,
-                                            limit=limit)
-            else:
-                results = self.db[out].find(sort=sort_instructions)
-            for r in results:
-                resource = r['value']
-                yield models.Resource(
-                    resource_id=r['_id'],
-                    user_id=resource['user_id'],
-                    project_id=resource['project_id'],
-                    first_sample_timestamp=resource['first_timestamp'],
-                    last_sample_timestamp=resource['last_timestamp'],
-                    source=resource['source'],
-                    metadata=pymongo_utils.unquote_keys(resource['metadata']))
-        finally:
-            self.db[out].drop()
-
-    def _get_floating_resources(self, query, metaquery, resource, limit):
+        results = self.db.meter.aggregate(pipeline,
+                                          **self._make_aggregation_params())
+        for r in self._get_results(results):
+            yield models.Resource(
+                resource_id=r['_id'],
+                user_id=r['user_id'],
+                project_id=r['project_id'],
+                first_sample_timestamp=r['first_sample_timestamp'],
+                last_sample_timestamp=r['last_sample_timestamp'],
+                source=r['source'],
+                metadata=pymongo_utils.unquote_keys(r['metadata']))
+
+    def _get_floating_resources(self, query, metaquery, resource, limit,
+                                marker=None):
         """Return an iterable of models.Resource instances
 
         Items are unconstrained by timestamp.
         :param query: project/user/source query
         :param metaquery: dict with metadata to match on.
         :param resource: resource filter.
+        :param marker: resource_id of the last resource of the previous page.
         """
         if resource is not None:
             query['_id'] = resource
@@ -454,6 +425,7 @@ class Connection(pymongo_base.Connection):
         sort_keys = ['last_sample_timestamp' if i == 'timestamp' else i
                      for i in keys]
         sort_instructions = self._build_sort_instructions(sort_keys)[0]
+        self._apply_marker(self.db.resource, query, sort_instructions, marker)
 
         if limit is not None:
             results = self.db.resource.find(query, sort=sort_instructions,
@@ -476,7 +448,8 @@ class Connection(pymongo_base.Connection):
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
-                      metaquery=None, resource=None, limit=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None):
         """Return an iterable of models.Resource instances
 
         :param user: Optional ID for user that owns the resource.
@@ -489,6 +462,9 @@ class Connection(pymongo_base.Connection):
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
         :param limit: Maximum number of results to return.
+        :param marker: Optional resource_id of the last resource of the
+                       previous page, only the resources following it in
+                       the listing order are returned.
         """
         if limit == 0:
             return
@@ -509,42 +485,10 @@ class Connection(pymongo_base.Connection):
                                                         end_timestamp,
                                                         end_timestamp_op,
                                                         metaquery, resource,
-                                                        limit)
+                                                        limit, marker)
         else:
             return self._get_floating_resources(query, metaquery, resource,
-                                                limit)
-
-    @staticmethod
-    def _make_period_dict(period, first_ts):
-        """Create a period field for _id of grouped fields.
-
-        :param period: Period duration in seconds
-        :param first_ts: First timestamp for first period
-        :return:
-        """
-        if period >= 0:
-            period_unique_dict = {
-                "period_start":
-                    {
-                        "$divide": [
-                            {"$subtract": [
-                                {"$subtract": ["$timestamp",
-                                               first_ts]},
-                                {"$mod": [{"$subtract": ["$timestamp",
-                                                         first_ts]},
-                                          period * 1000]
-                                 }
-                            ]},
-                            period * 1000
-                        ]
-                    }
-
-            }
-        else:
-            # Note(ityaptin) Hack for older MongoDB versions (2.4.+ and older).
-            # Since 2.6+ we could use $literal operator
-            period_unique_dict = {"$period_start": {"$add": [0, 0]}}
-        return period_unique_dict
+                                                limit, marker)
 
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
@@ -553,149 +497,26 @@ class Connection(pymongo_base.Connection):
         Items are containing meter statistics described by the query
         parameters. The filter must have a meter value set.
         """
-        # NOTE(zqfan): We already have checked at API level, but
-        # still leave it here in case of directly storage calls.
-        if aggregate:
-            for a in aggregate:
-                if a.func not in self.AGGREGATES:
-                    msg = _('Invalid aggregation function: %s') % a.func
-                    raise storage.StorageBadAggregate(msg)
-
-        if (groupby and set(groupby) -
-            set(['user_id', 'project_id', 'resource_id', 'source',
-                 'resource_metadata.instance_type'])):
-            raise ceilometer.NotImplementedError(
-                "Unable to group by these fields")
+        mongo_statistics.validate(groupby, aggregate, self.version)
         q = pymongo_utils.make_query_from_filter(sample_filter)
 
-        group_stage = {}
-        project_stage = {
-            "unit": "$_id.unit",
-            "name": "$_id.name",
-            "first_timestamp": "$first_timestamp",
-            "last_timestamp": "$last_timestamp",
-            "period_start": "$_id.period_start",
-        }
-
-        # Add timestamps to $group stage
-        group_stage.update({"first_timestamp": {"$min": "$timestamp"},
-                            "last_timestamp": {"$max": "$timestamp"}})
-
-        # Define a _id field for grouped documents
-        unique_group_field = {"name": "$counter_name",
-                              "unit": "$counter_unit"}
-
         # Define a first timestamp for periods
         if sample_filter.start_timestamp:
             first_timestamp = sample_filter.start_timestamp
         else:
-            first_timestamp_cursor = self.db.meter.find(
-                limit=1, sort=[('timestamp',
-                                pymongo.ASCENDING)])
-            if first_timestamp_cursor.count():
-                first_timestamp = first_timestamp_cursor[0]['timestamp']
-            else:
-                first_timestamp = utils.EPOCH_TIME
-
-        # Add a start_period field to unique identifier of grouped documents
-        if period:
-            period_dict = self._make_period_dict(period,
-                                                 first_timestamp)
-            unique_group_field.update(period_dict)
-
-        # Add a groupby fields to unique identifier of grouped documents
-        if groupby:
-            unique_group_field.update(dict((field.replace(".", "/"),
-                                            "$%s" % field)
-                                      for field in groupby))
-
-        group_stage.update({"_id": unique_group_field})
-
-        self._compile_aggregate_stages(aggregate, group_stage, project_stage)
-
-        # Aggregation stages list. It's work one by one and uses documents
-        # from previous stages.
-        aggregation_query = [{'$match': q},
-                             {"$sort": {"timestamp": 1}},
-                             {"$group": group_stage},
-                             {"$sort": {"_id.period_start": 1}},
-                             {"$project": project_stage}]
-
-        # results is dict in pymongo<=2.6.3 and CommandCursor in >=3.0
+            first = self.db.meter.find_one(
+                sort=[('timestamp', pymongo.ASCENDING)],
+                projection={'_id': False, 'timestamp': True})
+            first_timestamp = (first['timestamp'] if first
+                               else utils.EPOCH_TIME)
+
+        aggregation_query = mongo_statistics.pipeline(
+            q, first_timestamp, period, groupby, aggregate, self.version)
         results = self.db.meter.aggregate(aggregation_query,
-                                          **self._make_aggregation_params())
-        return [self._stats_result_to_model(point, groupby, aggregate,
-                                            period, first_timestamp)
-                for point in self._get_results(results)]
-
-    def _stats_result_aggregates(self, result, aggregate):
-        stats_args = {}
-        for attr, func in Connection.STANDARD_AGGREGATES.items():
-            if attr in result:
-                stats_args.update(func.finalize(result,
-                                                version_array=self.version))
-
-        if aggregate:
-            stats_args['aggregate'] = {}
-            for agr in aggregate:
-                stats_args['aggregate'].update(
-                    Connection.AGGREGATES[agr.func].finalize(
-                        result, agr.param, self.version))
-        return stats_args
-
-    def _stats_result_to_model(self, result, groupby, aggregate, period,
-                               first_timestamp):
-        if period is None:
-            period = 0
-        first_timestamp = pymongo_utils.from_unix_timestamp(first_timestamp)
-        stats_args = self._stats_result_aggregates(result, aggregate)
-
-        stats_args['unit'] = result['unit']
-        stats_args['duration'] = (result["last_timestamp"] -
-                                  result["first_timestamp"]).total_seconds()
-        stats_args['duration_start'] = result['first_timestamp']
-        stats_args['duration_end'] = result['last_timestamp']
-        stats_args['period'] = period
-        start = result.get("period_start", 0) * period
-
-        stats_args['period_start'] = (first_timestamp +
-                                      datetime.timedelta(seconds=start))
-        stats_args['period_end'] = (first_timestamp +
-                                    datetime.timedelta(seconds=start + period)
-                                    if period else result['last_timestamp'])
-
-        stats_args['groupby'] = (
-            dict((g, result['_id'].get(g.replace(".", "/")))
-                 for g in groupby) if groupby else None)
-        return models.Statistics(**stats_args)
-
-    def _compile_aggregate_stages(self, aggregate, group_stage, project_stage):
-        if not aggregate:
-            for aggregation in Connection.STANDARD_AGGREGATES.values():
-                group_stage.update(
-                    aggregation.group(version_array=self.version)
-                )
-                project_stage.update(
-                    aggregation.project(
-                        version_array=self.version
-                    )
-                )
-        else:
-            for description in aggregate:
-                aggregation = Connection.AGGREGATES.get(description.func)
-                if aggregation:
-                    if not aggregation.validate(description.param):
-                        raise storage.StorageBadAggregate(
-                            'Bad aggregate: %s.%s' % (description.func,
-                                                      description.param))
-                    group_stage.update(
-                        aggregation.group(description.param,
-                                          version_array=self.version)
-                    )
-                    project_stage.update(
-                        aggregation.project(description.param,
-                                            version_array=self.version)
-                    )
+                                          **self._make_statistics_params())
+        return mongo_statistics.to_statistics(self._get_results(results),
+                                              period, groupby, aggregate,
+                                              self.version)
 
     @staticmethod
     def _get_results(results):
@@ -708,3 +529,14 @@ class Connection(pymongo_base.Connection):
         if self.version >= pymongo_utils.COMPLETE_AGGREGATE_COMPATIBLE_VERSION:
             return {"allowDiskUse": True}
         return {}
+
+    def _make_statistics_params(self):
+        params = self._make_aggregation_params()
+        if self.version >= pymongo_utils.COMPLETE_AGGREGATE_COMPATIBLE_VERSION:
+            # NOTE: read the statistics as they are computed instead of
+            # receiving all of them in the first batch.
+            params['batchSize'] = self.conf.database.sample_fetch_size
+            max_time = self.conf.database.mongodb_statistics_max_time
+            if max_time:
+                params['maxTimeMS'] = int(max_time * 1000)
+        return params
@@ -14,19 +14,31 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import calendar
+import copy
 import datetime
 import hashlib
+import math
+import operator
 import os
+import threading
+import time
+import uuid
 
+import cachetools
+from concurrent import futures
 from oslo_db import api
 from oslo_db import exception as dbexc
 from oslo_db.sqlalchemy import session as db_session
 from oslo_log import log
 from oslo_serialization import jsonutils
+from oslo_utils import excutils
 from oslo_utils import timeutils
 import six
 import sqlalchemy as sa
 from sqlalchemy import and_
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
 from sqlalchemy import distinct
 from sqlalchemy import func
 from sqlalchemy.orm import aliased
@@ -37,12 +49,55 @@ from ceilometer.i18n import _
 from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import models as api_models
+from ceilometer.storage import rollup
+from ceilometer.storage.sqlalchemy import json_metadata
 from ceilometer.storage.sqlalchemy import models
+from ceilometer.storage.sqlalchemy import partitions
 from ceilometer.storage.sqlalchemy import utils as sql_utils
 from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Maximum number of values bound in a single IN clause, SQLite refuses
+# statements with more than 999 parameters.
+BATCH_IN_SIZE = 500
+
+# Interval in seconds between two reports of the id caches hit rates.
+ID_CACHE_REPORT_INTERVAL = 300
+
+# Number of rows fetched at once when listing resources.
+RESOURCES_YIELD_PER = 100
+
+# Dialects supporting the upserts maintaining the resource summary table.
+RESOURCE_SUMMARY_DIALECTS = ('mysql', 'postgresql')
+
+# Number of samples read at once when filling the rollups.
+ROLLUP_FILL_SIZE = 10000
+
+# Number of resources whose flat metadata are filled at once.
+FLAT_METADATA_FILL_SIZE = 1000
+
+# Statements recording a sample, built once with bound parameters so that
+# their compiled form is reused from the statement cache of the driver.
+SELECT_METER_ID = sa.select([models.Meter.id]).where(sa.and_(
+    models.Meter.name == sa.bindparam('name'),
+    models.Meter.type == sa.bindparam('type'),
+    models.Meter.unit == sa.bindparam('unit')))
+SELECT_RESOURCE_ID = sa.select([models.Resource.internal_id]).where(sa.and_(
+    models.Resource.resource_id == sa.bindparam('resource_id'),
+    models.Resource.user_id == sa.bindparam('user_id'),
+    models.Resource.project_id == sa.bindparam('project_id'),
+    models.Resource.source_id == sa.bindparam('source_id'),
+    models.Resource.metadata_hash == sa.bindparam('metadata_hash')))
+INSERT_METER = models.Meter.__table__.insert()
+INSERT_RESOURCE = models.Resource.__table__.insert()
+INSERT_SAMPLE = models.Sample.__table__.insert()
+INSERT_METADATA = dict((_model, _model.__table__.insert())
+                       for _model in set(sql_utils.META_TYPE_MAP.values()))
+PREPARED_STATEMENTS = ([SELECT_METER_ID, SELECT_RESOURCE_ID, INSERT_METER,
+                        INSERT_RESOURCE, INSERT_SAMPLE] +
+                       list(INSERT_METADATA.values()))
+
 
 STANDARD_AGGREGATES = dict(
     avg=func.avg(models.Sample.volume).label('avg'),
@@ -52,6 +107,18 @@ STANDARD_AGGREGATES = dict(
     count=func.count(models.Sample.volume).label('count')
 )
 
+# Standard aggregates computed from the rollups of samples.
+ROLLUP_AGGREGATES = dict(
+    avg=(func.sum(models.SampleRollup.sum) /
+         func.sum(models.SampleRollup.count)).label('avg'),
+    sum=func.sum(models.SampleRollup.sum).label('sum'),
+    min=func.min(models.SampleRollup.min).label('min'),
+    max=func.max(models.SampleRollup.max).label('max'),
+    # NOTE: MySQL returns the sum of integers as a decimal
+    count=cast(func.sum(models.SampleRollup.count),
+               sa.Integer).label('count')
+)
+
 UNPARAMETERIZED_AGGREGATES = dict(
     stddev=func.stddev_pop(models.Sample.volume).label('stddev')
 )
@@ -67,6 +134,40 @@ PARAMETERIZED_AGGREGATES = dict(
     )
 )
 
+
+def _mysql_period_offset(start, column=models.Sample.timestamp):
+    # NOTE: timestamps are stored as DECIMAL(20, 6) unix times on MySQL
+    ts = sa.type_coerce(column, sa.Numeric(20, 6))
+    return func.floor((ts - utils.dt_to_decimal(start)) * 1000000)
+
+
+def _postgresql_period_offset(start, column=models.Sample.timestamp):
+    elapsed = sa.extract('epoch', column - start)
+    return cast(func.round(elapsed * 1000000), sa.BigInteger)
+
+
+def _sqlite_period_offset(start, column=models.Sample.timestamp):
+    # NOTE: timestamps are stored as 'YYYY-MM-DD HH:MM:SS.ffffff' strings,
+    # strftime rounds fractional seconds to milliseconds so the microseconds
+    # are stripped before and added back separately.
+    ts = sa.type_coerce(column, sa.String)
+    seconds = cast(func.strftime('%s', func.substr(ts, 1, 19)), sa.Integer)
+    micros = cast(func.substr(ts, 21, 6), sa.Integer)
+    return ((seconds - calendar.timegm(start.utctimetuple())) * 1000000
+            + micros - start.microsecond)
+
+
+# Expressions computing the number of microseconds elapsed between a start
+# and a timestamp column, by default the one of samples, used to compute
+# periodic statistics in a single query. Other dialects fall back to one
+# query per period.
+PERIOD_OFFSET_EXPRESSIONS = {
+    'mysql': _mysql_period_offset,
+    'postgresql': _postgresql_period_offset,
+    'sqlite': _sqlite_period_offset,
+}
+
+
 AVAILABLE_CAPABILITIES = {
     'meters': {'query': {'simple': True,
                          'metadata': True}},
@@ -96,12 +197,14 @@ AVAILABLE_STORAGE_CAPABILITIES = {
 }
 
 
-def apply_metaquery_filter(session, query, metaquery):
+def apply_metaquery_filter(session, query, metaquery, flat_metadata=False):
     """Apply provided metaquery filter to existing query.
 
     :param session: session used for original query
     :param query: Query instance
     :param metaquery: dict with metadata to match on.
+    :param flat_metadata: If true, filter on the flat metadata column of
+                          the resources instead of the metadata tables.
     """
     for k, value in six.iteritems(metaquery):
         key = k[9:]  # strip out 'metadata.' prefix
@@ -112,6 +215,10 @@ def apply_metaquery_filter(session, query, metaquery):
                 'Query on %(key)s is of %(value)s '
                 'type and is not supported' %
                 {"key": k, "value": type(value)})
+        if flat_metadata:
+            query = query.filter(json_metadata.compare(
+                models.Resource.flat_metadata, key, operator.eq, value,
+                session.bind.dialect))
         else:
             meta_alias = aliased(_model)
             on_clause = and_(models.Resource.internal_id == meta_alias.id,
@@ -126,7 +233,8 @@ def apply_metaquery_filter(session, query, metaquery):
     return query
 
 
-def make_query_from_filter(session, query, sample_filter, require_meter=True):
+def make_query_from_filter(session, query, sample_filter, require_meter=True,
+                           prune_partitions=False, flat_metadata=False):
     """Return a query dictionary based on the settings in the filter.
 
     :param session: session used for original query
@@ -134,6 +242,10 @@ def make_query_from_filter(session, query, sample_filter, require_meter=True):
     :param sample_filter: SampleFilter instance
     :param require_meter: If true and the filter does not have a meter,
                           raise an error.
+    :param prune_partitions: If true, also filter on the partition key of
+                             the sample table partitioned on MySQL.
+    :param flat_metadata: If true, filter the metadata on the flat metadata
+                          column of the resources.
     """
 
     if sample_filter.meter:
@@ -155,6 +267,8 @@ def make_query_from_filter(session, query, sample_filter, require_meter=True):
             query = query.filter(models.Sample.timestamp <= ts_end)
         else:
             query = query.filter(models.Sample.timestamp < ts_end)
+    if prune_partitions:
+        query = query.filter(*partitions.key_conditions(sample_filter))
     if sample_filter.user:
         if sample_filter.user == 'None':
             sample_filter.user = None
@@ -170,14 +284,33 @@ def make_query_from_filter(session, query, sample_filter, require_meter=True):
     if sample_filter.message_id:
         query = query.filter(
             models.Sample.message_id == sample_filter.message_id)
+    if sample_filter.marker:
+        # NOTE: the redundant bound on the timestamp lets the timestamp
+        # index delimit the rows following the marker.
+        ts_marker, message_id = sample_filter.marker[:2]
+        query = query.filter(models.Sample.timestamp <= ts_marker)
+        query = query.filter(sa.or_(
+            models.Sample.timestamp < ts_marker,
+            models.Sample.message_id > message_id))
 
     if sample_filter.metaquery:
         query = apply_metaquery_filter(session, query,
-                                       sample_filter.metaquery)
+                                       sample_filter.metaquery,
+                                       flat_metadata=flat_metadata)
 
     return query
 
 
+# NOTE: the exception filter of oslo.db raises the translated error and
+# engine listeners can not be inserted before it, so the start time of the
+# failed statements is dropped by a listener of the Engine class, which
+# runs before the listeners of the instances.
+@sa.event.listens_for(sa.engine.Engine, 'handle_error')
+def _drop_query_start_time(context):
+    if context.connection is not None:
+        context.connection.info.pop('query_start_time', None)
+
+
 class Connection(base.Connection):
     """Put the data into a SQLAlchemy database.
 
@@ -211,6 +344,15 @@ class Connection(base.Connection):
               message_signature: message signature
               message_id: message uuid
               }
+        - sample_rollup
+          - the samples downsampled over fixed resolutions
+          - { resolution: period length in seconds
+              meter_id: meter id            (->meter.id)
+              resource_id: resource id      (->resource.internal_id)
+              period_start: datetime
+              count, sum, min, max: statistics of the volumes
+              first_timestamp, last_timestamp: datetime
+              }
     """
     CAPABILITIES = utils.update_nested(base.Connection.CAPABILITIES,
                                        AVAILABLE_CAPABILITIES)
@@ -231,6 +373,100 @@ class Connection(base.Connection):
         for opt in storage.OPTS:
             options.pop(opt.name, None)
         self._engine_facade = db_session.EngineFacade(url, **options)
+        self._compiled_queries = base.CompiledQueryCache(
+            self.conf.database.complex_query_cache_size)
+
+        db_conf = self.conf.database
+        self._pool_stats = base.PoolStatistics()
+        engine = self._engine_facade.get_engine()
+        self._watch_engine(engine)
+        self._statement_cache = None
+        self._recording_engine = engine
+        if (db_conf.sql_statement_cache and
+                not sql_utils.StatementCache.supported):
+            LOG.info("sql_statement_cache is not supported with SQLAlchemy "
+                     "%s, ignoring it", sa.__version__)
+        elif db_conf.sql_statement_cache:
+            self._statement_cache = sql_utils.StatementCache(
+                PREPARED_STATEMENTS)
+            self._recording_engine = engine.execution_options(
+                compiled_cache=self._statement_cache)
+        self._id_cache_lock = threading.Lock()
+        self._id_caches = {}
+        self._id_cache_stats = {}
+        for kind, size in (('meter', db_conf.sql_meter_cache_size),
+                           ('resource', db_conf.sql_resource_cache_size)):
+            self._id_caches[kind] = (
+                cachetools.TTLCache(size, db_conf.sql_id_cache_ttl)
+                if size else None)
+            self._id_cache_stats[kind] = dict(hits=0, misses=0)
+        self._id_cache_reported = time.time()
+        self._resource_summary_warned = False
+        self._rollup_resolutions = rollup.parse_resolutions(
+            db_conf.sql_rollup_resolutions)
+        self._partitions_warned = False
+        self._expire_workers_warned = False
+        self._partitioned = None
+        self._json_metadata = None
+
+    def _watch_engine(self, engine):
+        """Time the connection checkouts and statements of the engine."""
+        stats = self._pool_stats
+
+        # NOTE: the pool has no event sent before a checkout, so its checkout
+        # methods are wrapped to measure the time spent waiting for a
+        # connection. Engine.connect() checks out with unique_connection
+        # before SQLAlchemy 1.4, which removed it.
+        def timed(checkout):
+            def timed_checkout():
+                start = time.time()
+                try:
+                    return checkout()
+                finally:
+                    stats.record('checkout', time.time() - start)
+            return timed_checkout
+
+        pool = engine.pool
+        pool.connect = timed(pool.connect)
+        if hasattr(pool, 'unique_connection'):
+            pool.unique_connection = timed(pool.unique_connection)
+
+        # NOTE: conn.info lives as long as the DBAPI connection, a failed
+        # statement must not leave anything behind there.
+        @sa.event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters,
+                                  context, executemany):
+            conn.info['query_start_time'] = time.time()
+
+        @sa.event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters,
+                                 context, executemany):
+            start = conn.info.pop('query_start_time', None)
+            if start is not None:
+                stats.record('statement', time.time() - start)
+
+    def warm_up(self, count):
+        """Open connections to the database ahead of the first requests."""
+        engine = self._engine_facade.get_engine()
+        if isinstance(engine.pool, sa.pool.QueuePool):
+            count = min(count, engine.pool.size())
+        connections = []
+        try:
+            for __ in six.moves.range(count):
+                connections.append(engine.connect())
+        finally:
+            for conn in connections:
+                conn.close()
+        LOG.info("Opened %d database connections", len(connections))
+
+    def get_pool_stats(self):
+        """Return the size, usage and timings of the connection pool."""
+        stats = self._pool_stats.snapshot()
+        pool = self._engine_facade.get_engine().pool
+        if isinstance(pool, sa.pool.QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0))
+        return stats
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
@@ -252,29 +488,524 @@ class Connection(base.Connection):
         else:
             migration.db_sync(engine, path)
 
+        if self._use_resource_summary():
+            self._refresh_resource_summary()
+        self._fill_rollups()
+        if self._use_partitions():
+            self._maintain_partitions()
+        if self._use_json_metadata():
+            self._fill_flat_metadata()
+            self._index_metadata_keys()
+
     def clear(self):
         engine = self._engine_facade.get_engine()
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
         engine.dispose()
+        self._invalidate_id_caches()
+
+    def _use_resource_summary(self):
+        if not self.conf.database.sql_resource_summary:
+            return False
+        dialect = self._engine_facade.get_engine().dialect.name
+        if dialect not in RESOURCE_SUMMARY_DIALECTS:
+            if not self._resource_summary_warned:
+                LOG.warning("sql_resource_summary is not supported on %s, "
+                            "ignoring it", dialect)
+                self._resource_summary_warned = True
+            return False
+        return True
+
+    def _use_partitions(self):
+        if self.conf.database.sql_sample_partitioning == 'none':
+            return False
+        dialect = self._engine_facade.get_engine().dialect.name
+        if dialect not in partitions.DIALECTS:
+            if not self._partitions_warned:
+                LOG.warning("sql_sample_partitioning is not supported on %s, "
+                            "ignoring it", dialect)
+                self._partitions_warned = True
+            return False
+        return True
+
+    def _use_json_metadata(self):
+        if self.conf.database.sql_metadata_store != 'json':
+            return False
+        if self._json_metadata is None:
+            engine = self._engine_facade.get_engine()
+            self._json_metadata = json_metadata.supported(engine)
+            if not self._json_metadata:
+                LOG.warning("sql_metadata_store json is not supported on "
+                            "%s, ignoring it", engine.dialect.name)
+        return self._json_metadata
+
+    def _fill_flat_metadata(self):
+        """Fill the flat metadata of the resources created without it."""
+        res = models.Resource.__table__
+        engine = self._engine_facade.get_engine()
+        total = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    sa.select([res.c.internal_id, res.c.resource_metadata])
+                    .where(res.c.flat_metadata.is_(None))
+                    .order_by(res.c.internal_id)
+                    .limit(FLAT_METADATA_FILL_SIZE)).fetchall()
+                if not rows:
+                    break
+                conn.execute(
+                    res.update()
+                    .where(res.c.internal_id == sa.bindparam('_id'))
+                    .values(flat_metadata=sa.bindparam('_flat')),
+                    [{'_id': r.internal_id,
+                      '_flat': self._flat_metadata(r.resource_metadata)}
+                     for r in rows])
+            total += len(rows)
+        if total:
+            LOG.info("Filled the flat metadata of %d resources", total)
+
+    def _index_metadata_keys(self):
+        """Create and drop indexes to match the indexed metadata keys."""
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            create, drop = json_metadata.plan(
+                json_metadata.list_indexes(conn),
+                self.conf.database.sql_metadata_indexed_keys)
+            for statement in (
+                    json_metadata.drop_statements(conn.dialect, drop) +
+                    json_metadata.create_statements(conn.dialect, create)):
+                conn.execute(statement)
+        if create:
+            LOG.info("Indexed metadata keys %s", create)
+
+    def _prune_partitions(self):
+        """Tell whether queries filter on the partition key of samples."""
+        if self._partitioned is None:
+            engine = self._engine_facade.get_engine()
+            self._partitioned = (engine.dialect.name == 'mysql' and
+                                 self._use_partitions() and
+                                 bool(partitions.list_partitions(engine)))
+        return self._partitioned
+
+    def _maintain_partitions(self, expire_before=None):
+        """Partition the sample table and create and drop its partitions.
+
+        The table is partitioned the first time, the samples recorded so far
+        being kept in a legacy partition. Partitions are then created ahead
+        of time and the ones only holding samples older than expire_before
+        are dropped.
+
+        :returns: the names of the partitions dropped.
+        """
+        period = self.conf.database.sql_sample_partitioning
+        engine = self._engine_facade.get_engine()
+        now = timeutils.utcnow()
+        with engine.begin() as conn:
+            existing = partitions.list_partitions(conn)
+            if not existing:
+                sample = models.Sample.__table__
+                newest = conn.execute(
+                    sa.select([func.max(sample.c.timestamp)])).scalar()
+                boundary = partitions.next_period(max(newest or now, now),
+                                                  period)
+                LOG.info("Partitioning the sample table by %s, samples "
+                         "before %s are kept in the %s partition", period,
+                         boundary, partitions.LEGACY)
+                foreign_keys = [fk['name'] for fk in
+                                sa.inspect(conn).get_foreign_keys(
+                                    partitions.TABLE)]
+                for statement in partitions.partition_statements(
+                        conn.dialect, boundary, foreign_keys):
+                    conn.execute(statement)
+                existing = partitions.list_partitions(conn)
+            create, drop = partitions.plan(
+                existing, period, now,
+                self.conf.database.sql_sample_partitions_ahead,
+                expire_before)
+            for statement in (partitions.drop_statements(conn.dialect, drop) +
+                              partitions.create_statements(conn.dialect,
+                                                           create)):
+                conn.execute(statement)
+        if create:
+            LOG.info("Created partitions of the sample table up to %s",
+                     create[-1][1])
+        return drop
+
+    @staticmethod
+    def _update_resource_summary(conn, rows):
+        """Merge first and last sample timestamps into the summary table.
+
+        :param rows: dicts of resource_id, first_sample_timestamp,
+                     last_sample_timestamp and last_internal_id
+        """
+        summary = models.ResourceSummary.__table__
+        if conn.dialect.name == 'mysql':
+            stmt = mysql.insert(summary)
+            # NOTE: stmt.inserted is rendered as VALUES() of the assigned
+            # column when used inside a CASE, so spell VALUES() explicitly.
+            new = dict((c.name, sa.literal_column('VALUES(%s)' % c.name))
+                       for c in summary.c)
+        else:
+            stmt = postgresql.insert(summary)
+            new = dict((c.name, stmt.excluded[c.name]) for c in summary.c)
+        # NOTE: MySQL evaluates the assignments in order, so the last
+        # internal id must be updated before the last timestamp.
+        values = [
+            ('last_internal_id', sa.case(
+                [(new['last_sample_timestamp'] >=
+                  summary.c.last_sample_timestamp,
+                  new['last_internal_id'])],
+                else_=summary.c.last_internal_id)),
+            ('first_sample_timestamp', func.least(
+                summary.c.first_sample_timestamp,
+                new['first_sample_timestamp'])),
+            ('last_sample_timestamp', func.greatest(
+                summary.c.last_sample_timestamp,
+                new['last_sample_timestamp'])),
+        ]
+        if conn.dialect.name == 'mysql':
+            stmt = stmt.on_duplicate_key_update(values)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[summary.c.resource_id], set_=dict(values))
+        # NOTE: a stable order limits deadlocks between concurrent writers
+        conn.execute(stmt, sorted(rows, key=lambda r: r['resource_id']))
+
+    @staticmethod
+    def _summary_rows(entries):
+        """Aggregate (resource_id, timestamp, internal_id) into summary rows.
+        """
+        rows = {}
+        for resource_id, timestamp, internal_id in entries:
+            row = rows.get(resource_id)
+            if row is None:
+                rows[resource_id] = dict(resource_id=resource_id,
+                                         first_sample_timestamp=timestamp,
+                                         last_sample_timestamp=timestamp,
+                                         last_internal_id=internal_id)
+                continue
+            if timestamp < row['first_sample_timestamp']:
+                row['first_sample_timestamp'] = timestamp
+            if timestamp >= row['last_sample_timestamp']:
+                row['last_sample_timestamp'] = timestamp
+                row['last_internal_id'] = internal_id
+        return list(rows.values())
+
+    def _refresh_resource_summary(self, before=None):
+        """Recompute the summary of resources.
+
+        :param before: only recompute resources whose first sample is older
+                       than this timestamp, all of them otherwise.
+        """
+        summary = models.ResourceSummary
+        session = self._engine_facade.get_session()
+        with session.begin():
+            stale = session.query(summary)
+            if before is not None:
+                stale = stale.filter(summary.first_sample_timestamp < before)
+            stale.delete(synchronize_session=False)
+
+            latest = self._latest_samples_query(session,
+                                                storage.SampleFilter())
+            query = (session.query(latest.c.resource_id,
+                                   latest.c.min_timestamp,
+                                   latest.c.max_timestamp,
+                                   models.Sample.resource_id)
+                     .select_from(latest)
+                     .join(models.Sample,
+                           models.Sample.id == latest.c.sample_id)
+                     .filter(~latest.c.resource_id.in_(
+                         session.query(summary.resource_id))))
+            session.execute(summary.__table__.insert().from_select(
+                ['resource_id', 'first_sample_timestamp',
+                 'last_sample_timestamp', 'last_internal_id'],
+                query.statement))
+
+    @staticmethod
+    def _update_rollups(conn, rows):
+        """Merge downsampled samples into the rollup table.
+
+        :param rows: a dict as returned by rollup.aggregate with
+                     (meter_id, resource internal id) keys
+        """
+        table = models.SampleRollup.__table__
+        values = sorted(
+            (dict(resolution=resolution, meter_id=key[0],
+                  resource_id=key[1], period_start=start, count=row[0],
+                  sum=row[1], min=row[2], max=row[3],
+                  first_timestamp=row[4], last_timestamp=row[5])
+             for (resolution, key, start), row in rows.items()),
+            # NOTE: a stable order limits deadlocks between concurrent
+            # writers
+            key=lambda v: (v['resolution'], v['meter_id'], v['resource_id'],
+                           v['period_start']))
+        if not values:
+            return
+
+        if conn.dialect.name in ('mysql', 'postgresql'):
+            if conn.dialect.name == 'mysql':
+                stmt = mysql.insert(table)
+                quote = conn.dialect.identifier_preparer.quote
+                new = dict((c.name, sa.literal_column(
+                    'VALUES(%s)' % quote(c.name))) for c in table.c)
+            else:
+                stmt = postgresql.insert(table)
+                new = dict((c.name, stmt.excluded[c.name]) for c in table.c)
+            merged = [
+                ('count', table.c.count + new['count']),
+                ('sum', table.c.sum + new['sum']),
+                ('min', func.least(table.c.min, new['min'])),
+                ('max', func.greatest(table.c.max, new['max'])),
+                ('first_timestamp', func.least(table.c.first_timestamp,
+                                               new['first_timestamp'])),
+                ('last_timestamp', func.greatest(table.c.last_timestamp,
+                                                 new['last_timestamp'])),
+            ]
+            if conn.dialect.name == 'mysql':
+                stmt = stmt.on_duplicate_key_update(merged)
+            else:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(table.primary_key.columns),
+                    set_=dict(merged))
+            conn.execute(stmt, values)
+            return
+
+        # NOTE: other dialects have no upsert, update the existing rollups
+        # one by one and insert the missing ones.
+        for v in values:
+            result = conn.execute(
+                table.update()
+                .where(and_(table.c.resolution == v['resolution'],
+                            table.c.meter_id == v['meter_id'],
+                            table.c.resource_id == v['resource_id'],
+                            table.c.period_start == v['period_start']))
+                .values(count=table.c.count + v['count'],
+                        sum=table.c.sum + v['sum'],
+                        min=sa.case([(table.c.min > v['min'], v['min'])],
+                                    else_=table.c.min),
+                        max=sa.case([(table.c.max < v['max'], v['max'])],
+                                    else_=table.c.max),
+                        first_timestamp=sa.case(
+                            [(table.c.first_timestamp > v['first_timestamp'],
+                              v['first_timestamp'])],
+                            else_=table.c.first_timestamp),
+                        last_timestamp=sa.case(
+                            [(table.c.last_timestamp < v['last_timestamp'],
+                              v['last_timestamp'])],
+                            else_=table.c.last_timestamp)))
+            if not result.rowcount:
+                conn.execute(table.insert(), v)
+
+    def _record_rollups(self, conn, entries):
+        """Downsample (meter_id, internal_id, timestamp, volume) entries."""
+        if self._rollup_resolutions:
+            self._update_rollups(conn, rollup.aggregate(
+                (((m_id, res_id), timestamp, volume)
+                 for m_id, res_id, timestamp, volume in entries),
+                self._rollup_resolutions))
+
+    def _rollup_samples(self, conn, last_id, resolutions, *criteria):
+        """Add a chunk of samples to the rollups of some resolutions.
+
+        :param last_id: only samples with a greater id are read.
+        :param criteria: additional criteria on the samples.
+        :returns: the id of the last sample of the chunk, None if there is
+                  no sample left.
+        """
+        sample = models.Sample.__table__
+        rows = conn.execute(
+            sa.select([sample.c.id, sample.c.meter_id, sample.c.resource_id,
+                       sample.c.timestamp, sample.c.volume])
+            .where(and_(sample.c.id > last_id, *criteria))
+            .order_by(sample.c.id)
+            .limit(ROLLUP_FILL_SIZE)).fetchall()
+        if not rows:
+            return None
+        self._update_rollups(conn, rollup.aggregate(
+            (((r.meter_id, r.resource_id), r.timestamp, r.volume)
+             for r in rows), resolutions))
+        return rows[-1].id
+
+    def _fill_rollups(self):
+        """Synchronise the rollup table with the configured resolutions.
+
+        Rollups of resolutions which are no longer configured are removed
+        and the ones of resolutions without any rollup yet are computed from
+        the existing samples, each chunk of samples in its own transaction.
+        """
+        table = models.SampleRollup.__table__
+        sample = models.Sample.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            stale = table.delete()
+            if self._rollup_resolutions:
+                stale = stale.where(
+                    ~table.c.resolution.in_(self._rollup_resolutions))
+            conn.execute(stale)
+            existing = set(r for r, in conn.execute(
+                sa.select([table.c.resolution]).distinct()))
+            missing = [r for r in self._rollup_resolutions
+                       if r not in existing]
+            if not missing:
+                return
+            # NOTE: samples recorded from now on are added to the rollups by
+            # the collectors configured with the new resolutions.
+            max_id = conn.execute(
+                sa.select([func.max(sample.c.id)])).scalar()
+        if max_id is None:
+            return
+        LOG.info("Filling rollups of resolutions %s", missing)
+        last_id = 0
+        try:
+            while last_id is not None:
+                with engine.begin() as conn:
+                    last_id = self._rollup_samples(conn, last_id, missing,
+                                                   sample.c.id <= max_id)
+        except Exception:
+            # NOTE: partially filled resolutions would not be filled again
+            with excutils.save_and_reraise_exception():
+                with engine.begin() as conn:
+                    conn.execute(table.delete().where(
+                        table.c.resolution.in_(missing)))
+
+    def _expire_rollups(self, end):
+        """Remove the expired rollups and rebuild the ones straddling end.
+
+        The rollups of the period holding the expiry time are computed
+        again from the samples left, so that they do not account for the
+        expired ones.
+        """
+        table = models.SampleRollup.__table__
+        sample = models.Sample.__table__
+        engine = self._engine_facade.get_engine()
+        for resolution in self._rollup_resolutions:
+            start = rollup.period_start(end, resolution)
+            with engine.begin() as conn:
+                conn.execute(table.delete()
+                             .where(table.c.resolution == resolution)
+                             .where(table.c.period_start <= start))
+                last_id = 0
+                while last_id is not None:
+                    last_id = self._rollup_samples(
+                        conn, last_id, [resolution],
+                        sample.c.timestamp >= start,
+                        sample.c.timestamp <
+                        start + datetime.timedelta(seconds=resolution))
+
+    def _id_cache(self, kind):
+        # NOTE: MySQL does not support foreign keys on partitioned tables, a
+        # cached id removed by an expirer running in another process would
+        # not make the insertion of samples fail and would be left dangling.
+        if (self._use_partitions() and
+                self._engine_facade.get_engine().dialect.name == 'mysql'):
+            return None
+        return self._id_caches[kind]
+
+    def _get_cached_ids(self, kind, keys):
+        """Return the ids of the keys found in the id cache of a kind."""
+        cache = self._id_cache(kind)
+        if cache is None:
+            return {}
+        found = {}
+        with self._id_cache_lock:
+            for key in keys:
+                value = cache.get(key)
+                if value is not None:
+                    found[key] = value
+            stats = self._id_cache_stats[kind]
+            stats['hits'] += len(found)
+            stats['misses'] += len(keys) - len(found)
+        return found
+
+    def _set_cached_ids(self, kind, ids):
+        cache = self._id_cache(kind)
+        if cache is None or not ids:
+            return
+        with self._id_cache_lock:
+            cache.update(ids)
+
+    def _invalidate_id_caches(self):
+        with self._id_cache_lock:
+            for cache in self._id_caches.values():
+                if cache is not None:
+                    cache.clear()
+
+    def get_id_cache_stats(self):
+        """Return the size, hits, misses and hit rate of the id caches."""
+        result = {}
+        with self._id_cache_lock:
+            for kind, stats in self._id_cache_stats.items():
+                lookups = stats['hits'] + stats['misses']
+                cache = self._id_caches[kind]
+                result[kind] = dict(
+                    stats,
+                    size=len(cache) if cache is not None else 0,
+                    hit_rate=(float(stats['hits']) / lookups
+                              if lookups else 0.0))
+        return result
+
+    def _report_id_cache_stats(self):
+        now = time.time()
+        if now - self._id_cache_reported < ID_CACHE_REPORT_INTERVAL:
+            return
+        self._id_cache_reported = now
+        for kind, stats in sorted(self.get_id_cache_stats().items()):
+            LOG.info("%(kind)s id cache: %(size)d entries, %(hits)d hits, "
+                     "%(misses)d misses, %(rate).1f%% hit rate",
+                     dict(stats, kind=kind, rate=stats['hit_rate'] * 100))
+        stats = self.get_pool_stats()
+        LOG.info("Database connections: %(checkouts)d checkouts, "
+                 "%(avg).1f ms average wait, %(max).1f ms longest wait; "
+                 "%(statements)d statements, %(stmt_avg).1f ms average, "
+                 "%(stmt_max).1f ms longest",
+                 dict(stats, avg=stats['checkout_time_avg'] * 1000,
+                      max=stats['checkout_time_max'] * 1000,
+                      stmt_avg=stats['statement_time_avg'] * 1000,
+                      stmt_max=stats['statement_time_max'] * 1000))
+
+    @staticmethod
+    def _metadata_hash(rmeta):
+        m_hash = jsonutils.dumps(rmeta, sort_keys=True)
+        if six.PY3:
+            m_hash = m_hash.encode('utf-8')
+        return hashlib.md5(m_hash).hexdigest()
+
+    @staticmethod
+    def _metadata_rows(meta_map, internal_id, rmeta):
+        """Add the queryable metadata rows of a resource to meta_map."""
+        if not rmeta or not isinstance(rmeta, dict):
+            return
+        for key, v in utils.dict_to_keyval(rmeta):
+            try:
+                _model = sql_utils.META_TYPE_MAP[type(v)]
+                if meta_map.get(_model) is None:
+                    meta_map[_model] = []
+                meta_map[_model].append(
+                    {'id': internal_id, 'meta_key': key, 'value': v})
+            except KeyError:
+                LOG.warning(_("Unknown metadata type. Key "
+                              "(%s) will not be queryable."), key)
+
+    @staticmethod
+    def _flat_metadata(rmeta):
+        """Return the queryable metadata of a resource as a flat dict."""
+        meta_map = {}
+        Connection._metadata_rows(meta_map, None, rmeta)
+        return dict((row['meta_key'], row['value'])
+                    for rows in meta_map.values() for row in rows)
 
     @staticmethod
     def _create_meter(conn, name, type, unit):
-        # TODO(gordc): implement lru_cache to improve performance
         try:
-            meter = models.Meter.__table__
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
             with trans:
-                meter_row = conn.execute(
-                    sa.select([meter.c.id])
-                    .where(sa.and_(meter.c.name == name,
-                                   meter.c.type == type,
-                                   meter.c.unit == unit))).first()
+                meter_row = conn.execute(SELECT_METER_ID, name=name,
+                                         type=type, unit=unit).first()
                 meter_id = meter_row[0] if meter_row else None
                 if meter_id is None:
-                    result = conn.execute(meter.insert(), name=name,
+                    result = conn.execute(INSERT_METER, name=name,
                                           type=type, unit=unit)
                     meter_id = result.inserted_primary_key[0]
         except dbexc.DBDuplicateEntry:
@@ -285,56 +1016,40 @@ class Connection(base.Connection):
 
     @staticmethod
     def _create_resource(conn, res_id, user_id, project_id, source_id,
-                         rmeta):
-        # TODO(gordc): implement lru_cache to improve performance
+                         rmeta, m_hash=None, flat_metadata=False):
         try:
-            res = models.Resource.__table__
-            m_hash = jsonutils.dumps(rmeta, sort_keys=True)
-            if six.PY3:
-                m_hash = m_hash.encode('utf-8')
-            m_hash = hashlib.md5(m_hash).hexdigest()
+            if m_hash is None:
+                m_hash = Connection._metadata_hash(rmeta)
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
             with trans:
                 res_row = conn.execute(
-                    sa.select([res.c.internal_id])
-                    .where(sa.and_(res.c.resource_id == res_id,
-                                   res.c.user_id == user_id,
-                                   res.c.project_id == project_id,
-                                   res.c.source_id == source_id,
-                                   res.c.metadata_hash == m_hash))).first()
+                    SELECT_RESOURCE_ID, resource_id=res_id, user_id=user_id,
+                    project_id=project_id, source_id=source_id,
+                    metadata_hash=m_hash).first()
                 internal_id = res_row[0] if res_row else None
                 if internal_id is None:
-                    result = conn.execute(res.insert(), resource_id=res_id,
-                                          user_id=user_id,
-                                          project_id=project_id,
-                                          source_id=source_id,
-                                          resource_metadata=rmeta,
-                                          metadata_hash=m_hash)
+                    result = conn.execute(
+                        INSERT_RESOURCE, resource_id=res_id, user_id=user_id,
+                        project_id=project_id, source_id=source_id,
+                        resource_metadata=rmeta, metadata_hash=m_hash,
+                        flat_metadata=(Connection._flat_metadata(rmeta)
+                                       if flat_metadata else None))
                     internal_id = result.inserted_primary_key[0]
-                    if rmeta and isinstance(rmeta, dict):
-                        meta_map = {}
-                        for key, v in utils.dict_to_keyval(rmeta):
-                            try:
-                                _model = sql_utils.META_TYPE_MAP[type(v)]
-                                if meta_map.get(_model) is None:
-                                    meta_map[_model] = []
-                                meta_map[_model].append(
-                                    {'id': internal_id, 'meta_key': key,
-                                     'value': v})
-                            except KeyError:
-                                LOG.warning(_("Unknown metadata type. Key "
-                                              "(%s) will not be queryable."),
-                                            key)
-                        for _model in meta_map.keys():
-                            conn.execute(_model.__table__.insert(),
-                                         meta_map[_model])
+                    meta_map = {}
+                    if not flat_metadata:
+                        Connection._metadata_rows(meta_map, internal_id,
+                                                  rmeta)
+                    for _model in meta_map.keys():
+                        conn.execute(INSERT_METADATA[_model],
+                                     meta_map[_model])
 
         except dbexc.DBDuplicateEntry:
             # retry function to pick up duplicate committed object
             internal_id = Connection._create_resource(
-                conn, res_id, user_id, project_id, source_id, rmeta)
+                conn, res_id, user_id, project_id, source_id, rmeta, m_hash,
+                flat_metadata)
 
         return internal_id
 
@@ -350,84 +1065,455 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.publisher.utils.meter_message_from_counter
         """
-        engine = self._engine_facade.get_engine()
-        with engine.begin() as conn:
+        meter_key = (data['counter_name'], data['counter_type'],
+                     data['counter_unit'])
+        res_key = (data['resource_id'], data['user_id'], data['project_id'],
+                   data['source'],
+                   self._metadata_hash(data['resource_metadata']))
+        m_id = self._get_cached_ids('meter', [meter_key]).get(meter_key)
+        res_id = self._get_cached_ids('resource', [res_key]).get(res_key)
+
+        try:
+            self._record_sample(data, meter_key, m_id, res_key, res_id)
+        except dbexc.DBReferenceError:
+            # NOTE: a cached id may belong to a definition removed by an
+            # expirer running in another process, retry without the cache.
+            if m_id is None and res_id is None:
+                raise
+            self._invalidate_id_caches()
+            self._record_sample(data, meter_key, None, res_key, None)
+        self._report_id_cache_stats()
+
+    def _record_sample(self, data, meter_key, m_id, res_key, res_id):
+        with self._recording_engine.begin() as conn:
             # Record the raw data for the sample.
-            m_id = self._create_meter(conn,
-                                      data['counter_name'],
-                                      data['counter_type'],
-                                      data['counter_unit'])
-            res_id = self._create_resource(conn,
-                                           data['resource_id'],
-                                           data['user_id'],
-                                           data['project_id'],
-                                           data['source'],
-                                           data['resource_metadata'])
-            sample = models.Sample.__table__
-            conn.execute(sample.insert(), meter_id=m_id,
+            new_m_id = new_res_id = None
+            if m_id is None:
+                m_id = new_m_id = self._create_meter(conn, *meter_key)
+            if res_id is None:
+                res_id = new_res_id = self._create_resource(
+                    conn, data['resource_id'], data['user_id'],
+                    data['project_id'], data['source'],
+                    data['resource_metadata'], res_key[4],
+                    self._use_json_metadata())
+            conn.execute(INSERT_SAMPLE, meter_id=m_id,
                          resource_id=res_id,
                          timestamp=data['timestamp'],
                          volume=data['counter_volume'],
                          message_signature=data['message_signature'],
                          message_id=data['message_id'])
+            if self._use_resource_summary():
+                self._update_resource_summary(conn, self._summary_rows(
+                    [(data['resource_id'], data['timestamp'], res_id)]))
+            self._record_rollups(conn, [(m_id, res_id, data['timestamp'],
+                                         data['counter_volume'])])
+        # NOTE: only cache ids once they are committed
+        if new_m_id is not None:
+            self._set_cached_ids('meter', {meter_key: new_m_id})
+        if new_res_id is not None:
+            self._set_cached_ids('resource', {res_key: new_res_id})
+
+    @staticmethod
+    def _chunks(values, size=BATCH_IN_SIZE):
+        values = list(values)
+        for i in six.moves.range(0, len(values), size):
+            yield values[i:i + size]
+
+    @staticmethod
+    def _select_meters(conn, keys):
+        """Return the ids of the existing meters among keys.
+
+        :param keys: a set of (name, type, unit) tuples
+        """
+        meter = models.Meter.__table__
+        found = {}
+        for names in Connection._chunks(set(k[0] for k in keys)):
+            rows = conn.execute(
+                sa.select([meter.c.id, meter.c.name, meter.c.type,
+                           meter.c.unit])
+                .where(meter.c.name.in_(names)))
+            for row in rows:
+                key = (row.name, row.type, row.unit)
+                if key in keys:
+                    found[key] = row.id
+        return found
+
+    @staticmethod
+    def _create_meters(conn, keys):
+        """Resolve the ids of the meters of a batch, creating missing ones.
+
+        :param keys: a set of (name, type, unit) tuples
+        """
+        meter_ids = Connection._select_meters(conn, keys)
+        missing = keys.difference(meter_ids)
+        if not missing:
+            return meter_ids
+        meter = models.Meter.__table__
+        try:
+            trans = conn.begin_nested()
+            if conn.dialect.name == 'sqlite':
+                trans = conn.begin()
+            with trans:
+                conn.execute(meter.insert(),
+                             [dict(name=name, type=type, unit=unit)
+                              for name, type, unit in missing])
+        except dbexc.DBDuplicateEntry:
+            # NOTE: another writer created some of these meters in the
+            # meantime, fall back to the one by one path which copes with it
+            for key in missing:
+                meter_ids[key] = Connection._create_meter(conn, *key)
+        else:
+            meter_ids.update(Connection._select_meters(conn, missing))
+        return meter_ids
+
+    @staticmethod
+    def _select_resources(conn, keys):
+        """Return the internal ids of the existing resources among keys.
+
+        :param keys: a set of (resource_id, user_id, project_id, source_id,
+                     metadata_hash) tuples
+        """
+        res = models.Resource.__table__
+        found = {}
+        for res_ids in Connection._chunks(set(k[0] for k in keys)):
+            rows = conn.execute(
+                sa.select([res.c.internal_id, res.c.resource_id,
+                           res.c.user_id, res.c.project_id, res.c.source_id,
+                           res.c.metadata_hash])
+                .where(res.c.resource_id.in_(res_ids))
+                .order_by(res.c.internal_id))
+            for row in rows:
+                key = (row.resource_id, row.user_id, row.project_id,
+                       row.source_id, row.metadata_hash)
+                if key in keys:
+                    found.setdefault(key, row.internal_id)
+        return found
+
+    @staticmethod
+    def _create_resources(conn, resources, flat_metadata=False):
+        """Resolve the ids of the resources of a batch, creating missing ones.
+
+        :param resources: a dict of resource metadata indexed by
+                          (resource_id, user_id, project_id, source_id,
+                          metadata_hash) tuples
+        :param flat_metadata: if true, store the queryable metadata in the
+                              flat metadata column instead of the metadata
+                              tables.
+        """
+        keys = set(resources)
+        internal_ids = Connection._select_resources(conn, keys)
+        missing = [k for k in keys if k not in internal_ids]
+        if not missing:
+            return internal_ids
+
+        res = models.Resource.__table__
+        trans = conn.begin_nested()
+        if conn.dialect.name == 'sqlite':
+            trans = conn.begin()
+        with trans:
+            # NOTE: executemany does not return the generated primary keys,
+            # so rows are inserted with a unique placeholder hash which is
+            # used to read their ids back before setting the real hash.
+            tokens = {}
+            rows = []
+            for key in missing:
+                token = uuid.uuid4().hex
+                tokens[token] = key
+                rows.append(dict(resource_id=key[0], user_id=key[1],
+                                 project_id=key[2], source_id=key[3],
+                                 resource_metadata=resources[key],
+                                 metadata_hash=token,
+                                 flat_metadata=(
+                                     Connection._flat_metadata(resources[key])
+                                     if flat_metadata else None)))
+            conn.execute(res.insert(), rows)
+
+            inserted = {}
+            for chunk in Connection._chunks(tokens):
+                for row in conn.execute(
+                        sa.select([res.c.internal_id, res.c.metadata_hash])
+                        .where(res.c.metadata_hash.in_(chunk))):
+                    inserted[tokens[row.metadata_hash]] = row.internal_id
+
+            conn.execute(res.update()
+                         .where(res.c.internal_id == sa.bindparam('_id'))
+                         .values(metadata_hash=sa.bindparam('_hash')),
+                         [{'_id': internal_id, '_hash': key[4]}
+                          for key, internal_id in inserted.items()])
+
+            meta_map = {}
+            for key, internal_id in inserted.items():
+                if not flat_metadata:
+                    Connection._metadata_rows(meta_map, internal_id,
+                                              resources[key])
+            for _model in meta_map.keys():
+                conn.execute(_model.__table__.insert(), meta_map[_model])
+
+        internal_ids.update(inserted)
+        return internal_ids
+
+    @api.wrap_db_retry(retry_interval=10, max_retries=10,
+                       retry_on_deadlock=True)
+    def record_metering_data_batch(self, samples):
+        """Record the metering data in batch.
+
+        Meters and resources of the whole batch are resolved with a few bulk
+        queries, and all samples are inserted with a single executemany.
+        """
+        if not samples:
+            return
+        meters = set()
+        resources = {}
+        sample_keys = []
+        for data in samples:
+            meter_key = (data['counter_name'], data['counter_type'],
+                         data['counter_unit'])
+            rmeta = data['resource_metadata']
+            res_key = (data['resource_id'], data['user_id'],
+                       data['project_id'], data['source'],
+                       self._metadata_hash(rmeta))
+            meters.add(meter_key)
+            resources.setdefault(res_key, rmeta)
+            sample_keys.append((meter_key, res_key))
+
+        cached_meters = self._get_cached_ids('meter', meters)
+        cached_resources = self._get_cached_ids('resource', list(resources))
+        try:
+            self._record_batch(samples, sample_keys, meters, resources,
+                               cached_meters, cached_resources)
+        except dbexc.DBReferenceError:
+            # NOTE: a cached id may belong to a definition removed by an
+            # expirer running in another process, retry without the cache.
+            if not cached_meters and not cached_resources:
+                raise
+            self._invalidate_id_caches()
+            self._record_batch(samples, sample_keys, meters, resources,
+                               {}, {})
+        self._report_id_cache_stats()
+
+    def _record_batch(self, samples, sample_keys, meters, resources,
+                      meter_ids, internal_ids):
+        missing_meters = meters.difference(meter_ids)
+        missing_resources = dict((k, v) for k, v in resources.items()
+                                 if k not in internal_ids)
+        with self._recording_engine.begin() as conn:
+            new_meter_ids = new_internal_ids = {}
+            if missing_meters:
+                new_meter_ids = self._create_meters(conn, missing_meters)
+            if missing_resources:
+                new_internal_ids = self._create_resources(
+                    conn, missing_resources, self._use_json_metadata())
+            meter_ids = dict(meter_ids)
+            meter_ids.update(new_meter_ids)
+            internal_ids = dict(internal_ids)
+            internal_ids.update(new_internal_ids)
+            conn.execute(INSERT_SAMPLE, [
+                dict(meter_id=meter_ids[meter_key],
+                     resource_id=internal_ids[res_key],
+                     timestamp=data['timestamp'],
+                     volume=data['counter_volume'],
+                     message_signature=data['message_signature'],
+                     message_id=data['message_id'])
+                for data, (meter_key, res_key) in zip(samples, sample_keys)])
+            if self._use_resource_summary():
+                self._update_resource_summary(conn, self._summary_rows(
+                    (data['resource_id'], data['timestamp'],
+                     internal_ids[res_key])
+                    for data, (__, res_key) in zip(samples, sample_keys)))
+            self._record_rollups(conn, (
+                (meter_ids[meter_key], internal_ids[res_key],
+                 data['timestamp'], data['counter_volume'])
+                for data, (meter_key, res_key) in zip(samples, sample_keys)))
+        # NOTE: only cache ids once they are committed
+        self._set_cached_ids('meter', new_meter_ids)
+        self._set_cached_ids('resource', new_internal_ids)
+
+    def _delete_in_chunks(self, name, select_chunk, delete_chunk):
+        """Delete rows in transactions of at most sql_expire_chunk_size rows.
+
+        :param name: name of the rows, used to log the progress.
+        :param select_chunk: callable returning the query of the (id, key)
+                             of the rows to delete ordered by key, given a
+                             session and the key of the last row deleted,
+                             or None.
+        :param delete_chunk: callable deleting the rows of a list of ids in
+                             a session and returning their number.
+        :returns: the number of rows deleted.
+        """
+        chunk_size = self.conf.database.sql_expire_chunk_size
+        interval = self.conf.database.sql_expire_chunk_interval
+        session = self._engine_facade.get_session()
+        total = 0
+        last = None
+        while True:
+            with session.begin():
+                rows = select_chunk(session, last).limit(chunk_size).all()
+                if rows:
+                    total += delete_chunk(session, [r[0] for r in rows])
+            if not rows:
+                break
+            last = rows[-1][1]
+            LOG.info("%(total)d %(name)s removed from database so far",
+                     {'total': total, 'name': name})
+            if len(rows) < chunk_size:
+                break
+            if interval:
+                time.sleep(interval)
+        return total
+
+    def _expire_samples(self, start, end):
+        """Delete the samples of a time slice, oldest first.
+
+        :param start: start of the slice, included, or None.
+        :param end: end of the slice, excluded.
+        """
+        def select_chunk(session, last):
+            query = (session.query(models.Sample.id, models.Sample.timestamp)
+                     .filter(models.Sample.timestamp < end))
+            if start is not None:
+                query = query.filter(models.Sample.timestamp >= start)
+            return query.order_by(models.Sample.timestamp)
+
+        def delete_chunk(session, ids):
+            return (session.query(models.Sample)
+                    .filter(models.Sample.id.in_(ids))
+                    .delete(synchronize_session=False))
+
+        return self._delete_in_chunks('samples', select_chunk, delete_chunk)
+
+    def _expire_workers(self):
+        workers = self.conf.database.sql_expire_workers
+        if workers == 1:
+            return workers
+        engine = self._engine_facade.get_engine()
+        # NOTE: SQLite serializes writers and single connection pools share
+        # their connection between threads, concurrent deletes would fail.
+        single = (sa.pool.SingletonThreadPool, sa.pool.StaticPool)
+        if engine.dialect.name == 'sqlite' or isinstance(engine.pool, single):
+            if not self._expire_workers_warned:
+                LOG.warning("sql_expire_workers is not supported on %s, "
+                            "expiring samples in a single thread",
+                            engine.dialect.name)
+                self._expire_workers_warned = True
+            return 1
+        return workers
+
+    def _expiry_slices(self, end, workers):
+        """Split the expired samples into workers time slices."""
+        if workers > 1:
+            session = self._engine_facade.get_session()
+            oldest = session.query(func.min(models.Sample.timestamp)).scalar()
+            if oldest is not None and oldest < end:
+                step = (end - oldest) / workers
+                bounds = [oldest + step * i for i in range(1, workers)]
+                return list(zip([None] + bounds, bounds + [end]))
+        return [(None, end)]
+
+    @staticmethod
+    def _select_unused(column, relation):
+        """Return a select_chunk of _delete_in_chunks for unused rows."""
+        def select_chunk(session, last):
+            query = (session.query(column, column)
+                     .filter(~relation.any()))
+            if last is not None:
+                query = query.filter(column > last)
+            return query.order_by(column)
+        return select_chunk
+
+    @staticmethod
+    def _delete_meters(session, ids):
+        meters = (session.query(models.Meter)
+                  .filter(models.Meter.id.in_(ids))
+                  .filter(~models.Meter.samples.any()))
+        rows = meters.delete(synchronize_session=False)
+        # remove rollups of the meters removed
+        (session.query(models.SampleRollup)
+         .filter(models.SampleRollup.meter_id.in_(ids))
+         .filter(~models.SampleRollup.meter_id.in_(
+             session.query(models.Meter.id)
+             .filter(models.Meter.id.in_(ids)).subquery()))
+         .delete(synchronize_session=False))
+        return rows
+
+    @staticmethod
+    def _delete_resources(session, ids):
+        resources = models.Resource
+        # mark resources with no matching samples for delete
+        (session.query(resources)
+         .filter(resources.internal_id.in_(ids))
+         .filter(~resources.samples.any())
+         .update({resources.metadata_hash: "delete_" +
+                  cast(resources.internal_id, sa.String)},
+                 synchronize_session=False))
+        marked = (session.query(resources.internal_id)
+                  .filter(resources.internal_id.in_(ids))
+                  .filter(resources.metadata_hash.like('delete_%')))
+        # remove metadata and rollups of resources marked for delete
+        for table in [models.MetaText, models.MetaBigInt,
+                      models.MetaFloat, models.MetaBool]:
+            (session.query(table)
+             .filter(table.id.in_(marked.subquery()))
+             .delete(synchronize_session=False))
+        (session.query(models.SampleRollup)
+         .filter(models.SampleRollup.resource_id.in_(marked.subquery()))
+         .delete(synchronize_session=False))
+        return marked.delete(synchronize_session=False)
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
-        Clearing occurs according to the time-to-live.
+        Clearing occurs according to the time-to-live. The partitions of the
+        sample table, when partitioned, only holding expired samples are
+        dropped. Rows are then deleted in chunks of sql_expire_chunk_size
+        rows, each in its own transaction, so that the tables are never
+        locked for long and an interrupted expiry resumes where it stopped.
+        The expired samples are split into sql_expire_workers time slices
+        deleted in parallel.
         :param ttl: Number of seconds to keep records for.
         """
-        # Prevent database deadlocks from occurring by
-        # using separate transaction for each delete
-        session = self._engine_facade.get_session()
-        with session.begin():
-            end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
-            sample_q = (session.query(models.Sample)
-                        .filter(models.Sample.timestamp < end))
-            rows = sample_q.delete()
-            LOG.info("%d samples removed from database", rows)
+        end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+        if self._use_partitions():
+            dropped = self._maintain_partitions(expire_before=end)
+            if dropped:
+                LOG.info("Dropped expired partitions %s of the sample table",
+                         ', '.join(dropped))
+        slices = self._expiry_slices(end, self._expire_workers())
+        if len(slices) == 1:
+            rows = self._expire_samples(*slices[0])
+        else:
+            with futures.ThreadPoolExecutor(
+                    max_workers=len(slices)) as executor:
+                rows = sum(executor.map(lambda s: self._expire_samples(*s),
+                                        slices))
+        LOG.info("%d samples removed from database", rows)
 
-        if not self.conf.database.sql_expire_samples_only:
-            with session.begin():
-                # remove Meter definitions with no matching samples
-                (session.query(models.Meter)
-                 .filter(~models.Meter.samples.any())
-                 .delete(synchronize_session=False))
+        if self._use_resource_summary():
+            self._refresh_resource_summary(before=end)
 
-            with session.begin():
-                resource_q = (session.query(models.Resource.internal_id)
-                              .filter(~models.Resource.samples.any()))
-                # mark resource with no matching samples for delete
-                resource_q.update({models.Resource.metadata_hash: "delete_"
-                                  + cast(models.Resource.internal_id,
-                                         sa.String)},
-                                  synchronize_session=False)
-
-            # remove metadata of resources marked for delete
-            for table in [models.MetaText, models.MetaBigInt,
-                          models.MetaFloat, models.MetaBool]:
-                with session.begin():
-                    resource_q = (session.query(models.Resource.internal_id)
-                                  .filter(models.Resource.metadata_hash
-                                          .like('delete_%')))
-                    resource_subq = resource_q.subquery()
-                    (session.query(table)
-                     .filter(table.id.in_(resource_subq))
-                     .delete(synchronize_session=False))
-
-            # remove resource marked for delete
-            with session.begin():
-                resource_q = (session.query(models.Resource.internal_id)
-                              .filter(models.Resource.metadata_hash
-                                      .like('delete_%')))
-                resource_q.delete(synchronize_session=False)
+        self._expire_rollups(end)
+
+        if not self.conf.database.sql_expire_samples_only:
+            # remove Meter definitions with no matching samples
+            self._delete_in_chunks(
+                'meters',
+                self._select_unused(models.Meter.id, models.Meter.samples),
+                self._delete_meters)
+            # remove resources with no matching samples and their metadata
+            self._delete_in_chunks(
+                'resources',
+                self._select_unused(models.Resource.internal_id,
+                                    models.Resource.samples),
+                self._delete_resources)
+            # NOTE: removed meters and resources may be cached
+            self._invalidate_id_caches()
             LOG.info("Expired residual resource and"
                      " meter definition data")
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
-                      metaquery=None, resource=None, limit=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None):
         """Return an iterable of api_models.Resource instances
 
         :param user: Optional ID for user that owns the resource.
@@ -440,6 +1526,9 @@ class Connection(base.Connection):
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
         :param limit: Maximum number of results to return.
+        :param marker: Optional resource_id of the last resource of the
+                       previous page, only the resources following it in
+                       the listing order are returned.
         """
         if limit == 0:
             return
@@ -454,65 +1543,107 @@ class Connection(base.Connection):
                                         resource=resource)
 
         session = self._engine_facade.get_session()
-        # get list of resource_ids
-        has_timestamp = start_timestamp or end_timestamp
-        # NOTE: When sql_expire_samples_only is enabled, there will be some
-        #       resources without any sample, in such case we should use inner
-        #       join on sample table to avoid wrong result.
-        if self.conf.database.sql_expire_samples_only or has_timestamp:
-            res_q = session.query(distinct(models.Resource.resource_id)).join(
-                models.Sample,
-                models.Sample.resource_id == models.Resource.internal_id)
+        if (self._use_resource_summary() and not (
+                user or project or source or start_timestamp or
+                end_timestamp or metaquery)):
+            summary = models.ResourceSummary
+            query = (session.query(models.Resource.resource_id,
+                                   models.Resource.user_id,
+                                   models.Resource.project_id,
+                                   models.Resource.source_id,
+                                   models.Resource.resource_metadata,
+                                   summary.first_sample_timestamp
+                                   .label('min_timestamp'),
+                                   summary.last_sample_timestamp
+                                   .label('max_timestamp'))
+                     .select_from(summary)
+                     .join(models.Resource,
+                           models.Resource.internal_id ==
+                           summary.last_internal_id))
+            if resource:
+                query = query.filter(summary.resource_id == resource)
+            if marker:
+                query = query.filter(summary.resource_id > marker)
+            query = query.order_by(summary.resource_id)
+            query = query.limit(limit) if limit else query
         else:
-            res_q = session.query(distinct(models.Resource.resource_id))
-        res_q = make_query_from_filter(session, res_q, s_filter,
-                                       require_meter=False)
-        res_q = res_q.limit(limit) if limit else res_q
-        for res_id in res_q.all():
-
-            # get max and min sample timestamp value
-            min_max_q = (session.query(func.max(models.Sample.timestamp)
-                                       .label('max_timestamp'),
-                                       func.min(models.Sample.timestamp)
-                                       .label('min_timestamp'))
-                                .join(models.Resource,
-                                      models.Resource.internal_id ==
-                                      models.Sample.resource_id)
-                                .filter(models.Resource.resource_id ==
-                                        res_id[0]))
-
-            min_max_q = make_query_from_filter(session, min_max_q, s_filter,
-                                               require_meter=False)
-
-            min_max = min_max_q.first()
-
-            # get resource details for latest sample
-            res_q = (session.query(models.Resource.resource_id,
+            latest = self._latest_samples_query(
+                session, s_filter, limit, marker,
+                prune_partitions=self._prune_partitions(),
+                flat_metadata=self._use_json_metadata())
+            query = (session.query(models.Resource.resource_id,
                                    models.Resource.user_id,
                                    models.Resource.project_id,
                                    models.Resource.source_id,
-                                   models.Resource.resource_metadata)
-                            .join(models.Sample,
-                                  models.Sample.resource_id ==
-                                  models.Resource.internal_id)
-                            .filter(models.Sample.timestamp ==
-                                    min_max.max_timestamp)
-                            .filter(models.Resource.resource_id ==
-                                    res_id[0])
-                            .order_by(models.Sample.id.desc()).limit(1))
-
-            res = res_q.first()
-
+                                   models.Resource.resource_metadata,
+                                   latest.c.min_timestamp,
+                                   latest.c.max_timestamp)
+                     .select_from(latest)
+                     .join(models.Sample,
+                           models.Sample.id == latest.c.sample_id)
+                     .join(models.Resource,
+                           models.Resource.internal_id ==
+                           models.Sample.resource_id)
+                     .order_by(latest.c.resource_id))
+
+        for res in query.yield_per(RESOURCES_YIELD_PER):
             yield api_models.Resource(
                 resource_id=res.resource_id,
                 project_id=res.project_id,
-                first_sample_timestamp=min_max.min_timestamp,
-                last_sample_timestamp=min_max.max_timestamp,
+                first_sample_timestamp=res.min_timestamp,
+                last_sample_timestamp=res.max_timestamp,
                 source=res.source_id,
                 user_id=res.user_id,
                 metadata=res.resource_metadata
             )
 
+    @staticmethod
+    def _latest_samples_query(session, s_filter, limit=None, marker=None,
+                              prune_partitions=False, flat_metadata=False):
+        """Return a subquery of the first and last sample of resources.
+
+        The subquery yields, for each resource id matching the filter and
+        following the marker, the min_timestamp and max_timestamp of its
+        matching samples and the sample_id of its latest sample at
+        max_timestamp, the one with the highest id when several share that
+        timestamp. The limit applies to the first resource ids.
+        """
+        agg = (session.query(models.Resource.resource_id
+                             .label('resource_id'),
+                             func.min(models.Sample.timestamp)
+                             .label('min_timestamp'),
+                             func.max(models.Sample.timestamp)
+                             .label('max_timestamp'))
+               .join(models.Sample,
+                     models.Sample.resource_id == models.Resource.internal_id))
+        agg = make_query_from_filter(session, agg, s_filter,
+                                     require_meter=False,
+                                     prune_partitions=prune_partitions,
+                                     flat_metadata=flat_metadata)
+        if marker:
+            agg = agg.filter(models.Resource.resource_id > marker)
+        agg = agg.group_by(models.Resource.resource_id)
+        if limit:
+            agg = agg.order_by(models.Resource.resource_id).limit(limit)
+        agg = agg.subquery()
+
+        latest_resource = aliased(models.Resource)
+        latest_sample = aliased(models.Sample)
+        return (session.query(agg.c.resource_id,
+                              agg.c.min_timestamp,
+                              agg.c.max_timestamp,
+                              func.max(latest_sample.id).label('sample_id'))
+                .select_from(agg)
+                .join(latest_resource,
+                      latest_resource.resource_id == agg.c.resource_id)
+                .join(latest_sample,
+                      and_(latest_sample.resource_id ==
+                           latest_resource.internal_id,
+                           latest_sample.timestamp == agg.c.max_timestamp))
+                .group_by(agg.c.resource_id, agg.c.min_timestamp,
+                          agg.c.max_timestamp)
+                .subquery())
+
     def get_meters(self, user=None, project=None, resource=None, source=None,
                    metaquery=None, limit=None, unique=False):
         """Return an iterable of api_models.Meter instances
@@ -563,8 +1694,9 @@ class Connection(base.Connection):
             .join(models.Meter, models.Meter.id == models.Sample.meter_id)
             .join(models.Resource,
                   models.Resource.internal_id == models.Sample.resource_id))
-        query_sample = make_query_from_filter(session, query_sample, s_filter,
-                                              require_meter=False)
+        query_sample = make_query_from_filter(
+            session, query_sample, s_filter, require_meter=False,
+            flat_metadata=self._use_json_metadata())
 
         query_sample = query_sample.limit(limit) if limit else query_sample
 
@@ -589,9 +1721,10 @@ class Connection(base.Connection):
                     source=row.source_id,
                     user_id=row.user_id)
 
-    @staticmethod
-    def _retrieve_samples(query):
-        samples = query.all()
+    def _retrieve_samples(self, query):
+        # NOTE: yield_per streams the rows from a server side cursor where
+        # the database driver supports it.
+        samples = query.yield_per(self.conf.database.sample_fetch_size)
 
         for s in samples:
             # Remove the id generated by the database when
@@ -639,9 +1772,11 @@ class Connection(base.Connection):
             models.Meter, models.Meter.id == models.Sample.meter_id).join(
             models.Resource,
             models.Resource.internal_id == models.Sample.resource_id).order_by(
-            models.Sample.timestamp.desc())
-        query = make_query_from_filter(session, query, sample_filter,
-                                       require_meter=False)
+            models.Sample.timestamp.desc(), models.Sample.message_id)
+        query = make_query_from_filter(
+            session, query, sample_filter, require_meter=False,
+            prune_partitions=self._prune_partitions(),
+            flat_metadata=self._use_json_metadata())
         if limit:
             query = query.limit(limit)
         return self._retrieve_samples(query)
@@ -668,24 +1803,28 @@ class Connection(base.Connection):
             models.Meter, models.Meter.id == models.Sample.meter_id).join(
             models.Resource,
             models.Resource.internal_id == models.Sample.resource_id)
-        transformer = sql_utils.QueryTransformer(models.FullSample, query,
-                                                 dialect=engine.dialect.name)
+        transformer = sql_utils.QueryTransformer(
+            models.FullSample, query, dialect=engine.dialect.name,
+            flat_metadata=self._use_json_metadata())
         if filter_expr is not None:
-            transformer.apply_filter(filter_expr)
+            transformer.apply_compiled_filter(
+                self._compiled_queries.get_or_compile(
+                    filter_expr, transformer.compile_filter,
+                    transformer.flat_metadata))
 
         transformer.apply_options(orderby, limit)
         return self._retrieve_samples(transformer.get_query())
 
     @staticmethod
-    def _get_aggregate_functions(aggregate):
+    def _get_aggregate_functions(aggregate, standard=STANDARD_AGGREGATES):
         if not aggregate:
-            return [f for f in STANDARD_AGGREGATES.values()]
+            return [f for f in standard.values()]
 
         functions = []
 
         for a in aggregate:
-            if a.func in STANDARD_AGGREGATES:
-                functions.append(STANDARD_AGGREGATES[a.func])
+            if a.func in standard:
+                functions.append(standard[a.func])
             elif a.func in UNPARAMETERIZED_AGGREGATES:
                 functions.append(UNPARAMETERIZED_AGGREGATES[a.func])
             elif a.func in PARAMETERIZED_AGGREGATES['compute']:
@@ -703,17 +1842,41 @@ class Connection(base.Connection):
 
         return functions
 
-    def _make_stats_query(self, sample_filter, groupby, aggregate):
+    def _make_stats_query(self, sample_filter, groupby, aggregate,
+                          resolution=None):
+        """Return the statistics query of samples or of their rollups.
 
-        select = [
-            func.min(models.Sample.timestamp).label('tsmin'),
-            func.max(models.Sample.timestamp).label('tsmax'),
-            models.Meter.unit
-        ]
-        select.extend(self._get_aggregate_functions(aggregate))
+        :param resolution: if set, compute the statistics from the rollups
+                           of this resolution, the time range of the filter
+                           must be aligned on it.
+        """
+        if resolution:
+            source = models.SampleRollup
+            select = [
+                func.min(source.first_timestamp).label('tsmin'),
+                func.max(source.last_timestamp).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(self._get_aggregate_functions(aggregate,
+                                                        ROLLUP_AGGREGATES))
+        else:
+            source = models.Sample
+            select = [
+                func.min(models.Sample.timestamp).label('tsmin'),
+                func.max(models.Sample.timestamp).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(self._get_aggregate_functions(aggregate))
 
         session = self._engine_facade.get_session()
 
+        flat_metadata = self._use_json_metadata()
+        if flat_metadata:
+            instance_type = json_metadata.text_of(
+                models.Resource.flat_metadata, 'instance_type',
+                session.bind.dialect)
+        else:
+            instance_type = models.MetaText.value
         if groupby:
             group_attributes = []
             for g in groupby:
@@ -721,22 +1884,27 @@ class Connection(base.Connection):
                     group_attributes.append(getattr(models.Resource, g))
                 else:
                     group_attributes.append(
-                        getattr(models.MetaText, 'value')
+                        instance_type
                         .label('resource_metadata.instance_type'))
 
             select.extend(group_attributes)
 
         query = (
             session.query(*select)
+            .select_from(source)
             .join(models.Meter,
-                  models.Meter.id == models.Sample.meter_id)
+                  models.Meter.id == source.meter_id)
             .join(models.Resource,
-                  models.Resource.internal_id == models.Sample.resource_id)
+                  models.Resource.internal_id == source.resource_id)
             .group_by(models.Meter.unit))
 
         if groupby:
             for g in groupby:
-                if g == 'resource_metadata.instance_type':
+                if g != 'resource_metadata.instance_type':
+                    continue
+                if flat_metadata:
+                    query = query.filter(instance_type.isnot(None))
+                else:
                     query = query.join(
                         models.MetaText,
                         models.Resource.internal_id == models.MetaText.id)
@@ -744,7 +1912,22 @@ class Connection(base.Connection):
                         models.MetaText.meta_key == 'instance_type')
             query = query.group_by(*group_attributes)
 
-        return make_query_from_filter(session, query, sample_filter)
+        if resolution:
+            query = query.filter(source.resolution == resolution)
+            if sample_filter.start_timestamp:
+                query = query.filter(
+                    source.period_start >= sample_filter.start_timestamp)
+            if sample_filter.end_timestamp:
+                query = query.filter(
+                    source.period_start < sample_filter.end_timestamp)
+            sample_filter = copy.copy(sample_filter)
+            sample_filter.start_timestamp = None
+            sample_filter.end_timestamp = None
+
+        return make_query_from_filter(
+            session, query, sample_filter,
+            prune_partitions=not resolution and self._prune_partitions(),
+            flat_metadata=flat_metadata)
 
     @staticmethod
     def _stats_result_aggregates(result, aggregate):
@@ -785,6 +1968,10 @@ class Connection(base.Connection):
 
         Items are containing meter statistics described by the query
         parameters. The filter must have a meter value set.
+
+        Statistics are computed from the coarsest rollup of samples whose
+        resolution fits the period and time range, from the samples
+        otherwise.
         """
         if groupby:
             for group in groupby:
@@ -793,10 +1980,18 @@ class Connection(base.Connection):
                     raise ceilometer.NotImplementedError('Unable to group by '
                                                          'these fields')
 
+        resolution = rollup.choose_resolution(
+            self._rollup_resolutions, sample_filter, period, aggregate)
+        if resolution:
+            column = models.SampleRollup.period_start
+        else:
+            column = models.Sample.timestamp
+
         if not period:
             for res in self._make_stats_query(sample_filter,
                                               groupby,
-                                              aggregate):
+                                              aggregate,
+                                              resolution):
                 if res.count:
                     yield self._stats_result_to_model(res, 0,
                                                       res.tsmin, res.tsmax,
@@ -807,24 +2002,38 @@ class Connection(base.Connection):
         if not (sample_filter.start_timestamp and sample_filter.end_timestamp):
             res = self._make_stats_query(sample_filter,
                                          None,
-                                         aggregate).first()
+                                         aggregate,
+                                         resolution).first()
             if not res:
                 # NOTE(liusheng):The 'res' may be NoneType, because no
                 # sample has found with sample filter(s).
                 return
 
-        query = self._make_stats_query(sample_filter, groupby, aggregate)
+        start = sample_filter.start_timestamp or res.tsmin
+        end = sample_filter.end_timestamp or res.tsmax
+        query = self._make_stats_query(sample_filter, groupby, aggregate,
+                                       resolution)
+        dialect = self._engine_facade.get_engine().dialect.name
+        if dialect in PERIOD_OFFSET_EXPRESSIONS:
+            results = self._get_period_statistics(
+                query, dialect, start, end, period, groupby, aggregate,
+                column)
+        else:
+            results = self._iter_period_statistics(
+                query, start, end, period, groupby, aggregate, column)
+        for r in results:
+            yield r
+
+    def _iter_period_statistics(self, query, start, end, period, groupby,
+                                aggregate, column=models.Sample.timestamp):
         # HACK(jd) This is an awful method to compute stats by period, but
         # since we're trying to be SQL agnostic we have to write portable
         # code, so here it is, admire! We're going to do one request to get
         # stats by period. We would like to use GROUP BY, but there's no
         # portable way to manipulate timestamp in SQL, so we can't.
-        for period_start, period_end in base.iter_period(
-                sample_filter.start_timestamp or res.tsmin,
-                sample_filter.end_timestamp or res.tsmax,
-                period):
-            q = query.filter(models.Sample.timestamp >= period_start)
-            q = q.filter(models.Sample.timestamp < period_end)
+        for period_start, period_end in base.iter_period(start, end, period):
+            q = query.filter(column >= period_start)
+            q = q.filter(column < period_end)
             for r in q.all():
                 if r.count:
                     yield self._stats_result_to_model(
@@ -836,3 +2045,44 @@ class Connection(base.Connection):
                         groupby=groupby,
                         aggregate=aggregate
                     )
+
+    def _get_period_statistics(self, query, dialect, start, end, period,
+                               groupby, aggregate,
+                               column=models.Sample.timestamp):
+        """Compute the statistics of all periods with a single query.
+
+        Samples are grouped by the index of the period they belong to,
+        computed with integer arithmetic on the microseconds elapsed since
+        the start so periods boundaries match the ones of iter_period.
+
+        :param column: the timestamp column of the queried rows.
+        """
+        periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                / float(period)))
+        if periods <= 0:
+            return
+        increment = datetime.timedelta(seconds=period)
+        period_us = int(period * 1000000)
+        offset = PERIOD_OFFSET_EXPRESSIONS[dialect](start, column)
+        if dialect == 'mysql':
+            bucket = offset.op('DIV')(period_us)
+        else:
+            bucket = offset / period_us
+        bucket = bucket.label('period_index')
+
+        query = (query.add_columns(bucket)
+                 .filter(column >= start)
+                 .filter(column < start + increment * periods)
+                 .group_by(bucket)
+                 .order_by(bucket))
+        for r in query:
+            if r.count:
+                period_start = start + increment * int(r.period_index)
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=int(period),
+                    period_start=period_start,
+                    period_end=period_start + increment,
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
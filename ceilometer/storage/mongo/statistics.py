@@ -0,0 +1,183 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Aggregation pipeline computing the statistics of the MongoDB driver.
+
+The samples matching a query are narrowed to the fields the statistics
+need, bucketed by period and grouped by MongoDB, which also computes the
+aggregates, the durations and the bounds of the periods. The driver only
+turns the resulting documents into models while reading the cursor.
+"""
+
+import ceilometer
+from ceilometer.i18n import _
+from ceilometer import storage
+from ceilometer.storage import models
+from ceilometer.storage.mongo import utils as pymongo_utils
+
+GROUPBY_FIELDS = ('user_id', 'project_id', 'resource_id', 'source',
+                  'resource_metadata.instance_type')
+
+STANDARD_AGGREGATES = dict([(a.name, a) for a in [
+    pymongo_utils.SUM_AGGREGATION, pymongo_utils.AVG_AGGREGATION,
+    pymongo_utils.MIN_AGGREGATION, pymongo_utils.MAX_AGGREGATION,
+    pymongo_utils.COUNT_AGGREGATION,
+]])
+
+AGGREGATES = dict([(a.name, a) for a in [
+    pymongo_utils.SUM_AGGREGATION,
+    pymongo_utils.AVG_AGGREGATION,
+    pymongo_utils.MIN_AGGREGATION,
+    pymongo_utils.MAX_AGGREGATION,
+    pymongo_utils.COUNT_AGGREGATION,
+    pymongo_utils.STDDEV_AGGREGATION,
+    pymongo_utils.CARDINALITY_AGGREGATION,
+]])
+
+# Accumulators of the $group stage and fields of the last $project stage of
+# each combination of aggregates and server version
+_aggregate_stages = {}
+
+
+def validate(groupby, aggregate, version):
+    """Check that the statistics of a query can be computed.
+
+    :raises ceilometer.NotImplementedError: on unsupported groupby fields.
+    :raises storage.StorageBadAggregate: on invalid aggregates.
+    """
+    # NOTE(zqfan): We already have checked at API level, but
+    # still leave it here in case of directly storage calls.
+    for a in aggregate or []:
+        if a.func not in AGGREGATES:
+            msg = _('Invalid aggregation function: %s') % a.func
+            raise storage.StorageBadAggregate(msg)
+    if groupby and set(groupby) - set(GROUPBY_FIELDS):
+        raise ceilometer.NotImplementedError(
+            "Unable to group by these fields")
+    for a in aggregate or []:
+        if not AGGREGATES[a.func].validate(a.param, version_array=version):
+            raise storage.StorageBadAggregate('Bad aggregate: %s.%s'
+                                              % (a.func, a.param))
+
+
+def _compile_aggregate_stages(aggregate, version):
+    key = (tuple((a.func, a.param) for a in aggregate or []),
+           tuple(version[:2]))
+    stages = _aggregate_stages.get(key)
+    if stages is None:
+        group_stage = {}
+        project_stage = {}
+        if not aggregate:
+            for aggregation in STANDARD_AGGREGATES.values():
+                group_stage.update(aggregation.group(version_array=version))
+                project_stage.update(
+                    aggregation.project(version_array=version))
+        else:
+            for a in aggregate:
+                aggregation = AGGREGATES[a.func]
+                group_stage.update(aggregation.group(a.param,
+                                                     version_array=version))
+                project_stage.update(
+                    aggregation.project(a.param, version_array=version))
+        stages = _aggregate_stages[key] = (group_stage, project_stage)
+    return stages
+
+
+def pipeline(query, first_timestamp, period, groupby, aggregate, version):
+    """Return the aggregation pipeline computing statistics.
+
+    :param query: the query matching the samples.
+    :param first_timestamp: the start of the first period.
+    :param period: the duration of the periods in seconds, if any.
+    :param groupby: the fields the statistics are grouped by.
+    :param aggregate: the aggregates computed, the standard ones if empty.
+    :param version: the version array of the MongoDB server.
+    """
+    aggregate_group, aggregate_project = _compile_aggregate_stages(aggregate,
+                                                                   version)
+    # NOTE: only keep the fields used by the $group stage, so that it is
+    # fed small documents instead of whole samples with their metadata.
+    fields = {"_id": 0, "timestamp": 1, "counter_name": 1,
+              "counter_unit": 1, "counter_volume": 1}
+    fields.update((field, 1) for field in groupby or [])
+    fields.update((a.param, 1) for a in aggregate or []
+                  if a.func == 'cardinality')
+
+    group_id = {"name": "$counter_name", "unit": "$counter_unit"}
+    group_id.update((field.replace(".", "/"), "$%s" % field)
+                    for field in groupby or [])
+
+    project_stage = {
+        "unit": "$_id.unit",
+        "duration_start": "$first_timestamp",
+        "duration_end": "$last_timestamp",
+        "duration": {"$divide": [{"$subtract": ["$last_timestamp",
+                                                "$first_timestamp"]},
+                                 1000]},
+    }
+    if period:
+        # Milliseconds between the first timestamp and the start of the
+        # period of the sample
+        offset = {"$subtract": ["$timestamp", first_timestamp]}
+        fields["period_start"] = {
+            "$subtract": [offset, {"$mod": [offset, period * 1000]}]}
+        group_id["period_start"] = "$period_start"
+        project_stage["period_start"] = {
+            "$add": [first_timestamp, "$_id.period_start"]}
+        project_stage["period_end"] = {
+            "$add": [first_timestamp, "$_id.period_start", period * 1000]}
+    else:
+        project_stage["period_start"] = {"$add": [first_timestamp, 0]}
+        project_stage["period_end"] = "$last_timestamp"
+    project_stage.update(aggregate_project)
+
+    group_stage = {"_id": group_id,
+                   "first_timestamp": {"$min": "$timestamp"},
+                   "last_timestamp": {"$max": "$timestamp"}}
+    group_stage.update(aggregate_group)
+
+    return [{"$match": query},
+            {"$project": fields},
+            {"$group": group_stage},
+            {"$sort": {"_id.period_start": 1}},
+            {"$project": project_stage}]
+
+
+def _aggregates(result, aggregate, version):
+    stats_args = {}
+    for attr, func in STANDARD_AGGREGATES.items():
+        if attr in result:
+            stats_args.update(func.finalize(result, version_array=version))
+
+    if aggregate:
+        stats_args['aggregate'] = {}
+        for a in aggregate:
+            stats_args['aggregate'].update(
+                AGGREGATES[a.func].finalize(result, a.param, version))
+    return stats_args
+
+
+def to_statistics(results, period, groupby, aggregate, version):
+    """Yield the models.Statistics of the documents returned by pipeline."""
+    for result in results:
+        stats_args = _aggregates(result, aggregate, version)
+        stats_args.update(
+            unit=result['unit'],
+            period=period or 0,
+            period_start=result['period_start'],
+            period_end=result['period_end'],
+            duration=result['duration'],
+            duration_start=result['duration_start'],
+            duration_end=result['duration_end'],
+            groupby=(dict((g, result['_id'].get(g.replace(".", "/")))
+                          for g in groupby) if groupby else None))
+        yield models.Statistics(**stats_args)
@@ -16,6 +16,7 @@
 """
 
 import datetime
+import threading
 import time
 import weakref
 
@@ -26,7 +27,13 @@ import pymongo.errors
 import six
 from six.moves.urllib import parse
 
+try:
+    from pymongo import monitoring
+except ImportError:
+    monitoring = None
+
 from ceilometer.i18n import _
+from ceilometer.storage import base
 
 ERROR_INDEX_WITH_DIFFERENT_SPEC_ALREADY_EXISTS = 86
 
@@ -34,6 +41,7 @@ LOG = log.getLogger(__name__)
 
 MINIMUM_COMPATIBLE_MONGODB_VERSION = [2, 4]
 COMPLETE_AGGREGATE_COMPATIBLE_VERSION = [2, 6]
+STDDEV_POP_COMPATIBLE_VERSION = [3, 2]
 
 FINALIZE_FLOAT_LAMBDA = lambda result, param=None: float(result)
 FINALIZE_INT_LAMBDA = lambda result, param=None: int(result)
@@ -102,6 +110,11 @@ def make_query_from_filter(sample_filter, require_meter=True):
         q['source'] = sample_filter.source
     if sample_filter.message_id:
         q['message_id'] = sample_filter.message_id
+    if sample_filter.marker:
+        ts_marker, message_id = sample_filter.marker[:2]
+        q['$or'] = [{'timestamp': {'$lt': ts_marker}},
+                    {'timestamp': ts_marker,
+                     'message_id': {'$gt': message_id}}]
 
     # so the samples call metadata resource_metadata, so we convert
     # to that.
@@ -111,6 +124,41 @@ def make_query_from_filter(sample_filter, require_meter=True):
     return q
 
 
+def make_keyset_query(sort_instructions, marker):
+    """Return a query matching the documents sorted after a marker.
+
+    :param sort_instructions: (key, direction) pairs the documents are sorted
+                              by, the last key must be unique.
+    :param marker: the document the previous page ended with.
+    """
+    clauses = []
+    for i, (key, direction) in enumerate(sort_instructions):
+        clause = dict((k, marker.get(k)) for k, __ in sort_instructions[:i])
+        value = marker.get(key)
+        if direction == pymongo.ASCENDING:
+            # NOTE: null values are sorted first
+            clause[key] = {'$gt': value} if value is not None else {
+                '$ne': None}
+        elif value is not None:
+            clause[key] = {'$not': {'$gte': value}}
+        else:
+            continue
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def index_covers(collection, keys):
+    """Tell whether an index of a collection starts with some keys.
+
+    :param collection: the collection whose indexes are checked.
+    :param keys: the leading keys an index must have, in order.
+    """
+    for index in collection.index_information().values():
+        if [k for k, __ in index['key'][:len(keys)]] == list(keys):
+            return True
+    return False
+
+
 def quote_key(key, reverse=False):
     """Prepare key for storage data in MongoDB.
 
@@ -181,6 +229,79 @@ def unquote_keys(data):
     return data
 
 
+def _listener(name):
+    # NOTE: pymongo sends command events since 3.1 and connection pool
+    # events since 3.9, the timers of the missing ones are not registered.
+    return getattr(monitoring, name, object)
+
+
+class CommandTimer(_listener('CommandListener')):
+    """Record the duration of the commands run by a client."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.stats.record('statement', event.duration_micros / 1000000.0)
+
+    def failed(self, event):
+        self.stats.record('statement', event.duration_micros / 1000000.0)
+
+
+class CheckoutTimer(_listener('ConnectionPoolListener')):
+    """Record the time spent waiting for the sockets of a client."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.time()
+
+    def connection_checked_out(self, event):
+        self.stats.record('checkout', time.time() - self._local.start)
+
+    def connection_check_out_failed(self, event):
+        self.stats.record('checkout', time.time() - self._local.start)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def _timers(stats):
+    """Return the event listeners supported by pymongo recording stats."""
+    timers = []
+    if hasattr(monitoring, 'CommandListener'):
+        timers.append(CommandTimer(stats))
+    if hasattr(monitoring, 'ConnectionPoolListener'):
+        timers.append(CheckoutTimer(stats))
+    return timers
+
+
 class ConnectionPool(object):
 
     def __init__(self):
@@ -208,8 +329,13 @@ class ConnectionPool(object):
 
     @staticmethod
     def _mongo_connect(conf, url):
+        stats = base.PoolStatistics()
+        listeners = _timers(stats)
+        options = {'event_listeners': listeners} if listeners else {}
         try:
-            return MongoProxy(conf, pymongo.MongoClient(url))
+            client = MongoProxy(conf, pymongo.MongoClient(url, **options))
+            client.pool_stats = stats
+            return client
         except pymongo.errors.ConnectionFailure as e:
             LOG.warning(_('Unable to connect to the database server: '
                         '%(errmsg)s.') % {'errmsg': e})
@@ -540,22 +666,26 @@ COUNT_AGGREGATION = Aggregation(
                                FINALIZE_INT_LAMBDA))
 STDDEV_AGGREGATION = Aggregation(
     "stddev",
-    AggregationFields(MINIMUM_COMPATIBLE_MONGODB_VERSION,
-                      {"std_square": {
-                          "$sum": {
-                              "$multiply": ["$counter_volume",
-                                            "$counter_volume"]
-                          }},
-                       "std_count": {"$sum": 1},
-                       "std_sum": {"$sum": "$counter_volume"}},
-                      {"stddev": {
-                          "count": "$std_count",
-                          "sum": "$std_sum",
-                          "square_sum": "$std_square"}},
-                      lambda stddev: ((stddev['square_sum']
-                                       * stddev['count']
-                                       - stddev["sum"] ** 2) ** 0.5
-                                      / stddev['count'])))
+    # $stdDevPop operator available only in MongoDB 3.2+
+    [AggregationFields(STDDEV_POP_COMPATIBLE_VERSION,
+                       {"stddev": {"$stdDevPop": "$counter_volume"}},
+                       {"stddev": "$stddev"}),
+     AggregationFields(MINIMUM_COMPATIBLE_MONGODB_VERSION,
+                       {"std_square": {
+                           "$sum": {
+                               "$multiply": ["$counter_volume",
+                                             "$counter_volume"]
+                           }},
+                        "std_count": {"$sum": 1},
+                        "std_sum": {"$sum": "$counter_volume"}},
+                       {"stddev": {
+                           "count": "$std_count",
+                           "sum": "$std_sum",
+                           "square_sum": "$std_square"}},
+                       lambda stddev: ((stddev['square_sum']
+                                        * stddev['count']
+                                        - stddev["sum"] ** 2) ** 0.5
+                                       / stddev['count']))])
 
 CARDINALITY_AGGREGATION = Aggregation(
     "cardinality",
@@ -13,6 +13,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """Common functions for MongoDB backend."""
+import copy
+
 import pymongo
 
 from ceilometer.storage import base
@@ -45,6 +47,11 @@ class Connection(base.Connection):
         AVAILABLE_STORAGE_CAPABILITIES,
     )
 
+    def __init__(self, conf, url):
+        super(Connection, self).__init__(conf, url)
+        self._compiled_queries = base.CompiledQueryCache(
+            conf.database.complex_query_cache_size)
+
     def get_meters(self, user=None, project=None, resource=None, source=None,
                    metaquery=None, limit=None, unique=False):
         """Return an iterable of models.Meter instances
@@ -131,7 +138,8 @@ class Connection(base.Connection):
                                                  require_meter=False)
 
         return self._retrieve_samples(q,
-                                      [("timestamp", pymongo.DESCENDING)],
+                                      [("timestamp", pymongo.DESCENDING),
+                                       ("message_id", pymongo.ASCENDING)],
                                       limit)
 
     def query_samples(self, filter_expr=None, orderby=None, limit=None):
@@ -143,18 +151,24 @@ class Connection(base.Connection):
         if orderby is not None:
             orderby_filter = transformer.transform_orderby(orderby)
         if filter_expr is not None:
-            query_filter = transformer.transform_filter(filter_expr)
+            # NOTE: the transformation modifies the filter
+            query_filter = self._compiled_queries.get_or_compile(
+                filter_expr,
+                lambda f: transformer.transform_filter(copy.deepcopy(f)))
 
         return self._retrieve_samples(query_filter, orderby_filter, limit)
 
     def _retrieve_samples(self, query, orderby, limit):
+        batch_size = self.conf.database.sample_fetch_size
         if limit is not None:
             samples = self.db.meter.find(query,
                                          limit=limit,
-                                         sort=orderby)
+                                         sort=orderby,
+                                         batch_size=batch_size)
         else:
             samples = self.db.meter.find(query,
-                                         sort=orderby)
+                                         sort=orderby,
+                                         batch_size=batch_size)
 
         for s in samples:
             # Remove the ObjectId generated by the database when
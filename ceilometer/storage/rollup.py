@@ -0,0 +1,131 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Helpers to downsample samples into rollups of fixed resolutions.
+
+A rollup holds the count, sum, min and max of the volumes and the first
+and last timestamps of the samples of a meter and a resource falling into
+a period of a given resolution. Periods are aligned on the epoch so that a
+rollup row can be shared by all the statistics queries whose periods and
+boundaries are multiples of its resolution.
+"""
+
+import calendar
+import datetime
+
+import six
+
+
+RESOLUTION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Aggregates which can be computed from the rollups.
+AGGREGATES = ('count', 'sum', 'min', 'max', 'avg', 'cardinality')
+
+
+def parse_resolution(value):
+    """Return the number of seconds of a resolution such as 300, 5m or 1d.
+
+    :raises ValueError: if the resolution is malformed or not positive.
+    """
+    value = six.text_type(value).strip()
+    multiplier = RESOLUTION_UNITS.get(value[-1:].lower())
+    if multiplier is None:
+        seconds = int(value)
+    else:
+        seconds = int(value[:-1]) * multiplier
+    if seconds <= 0:
+        raise ValueError('Rollup resolution must be positive: %s' % value)
+    return seconds
+
+
+def parse_resolutions(values):
+    """Return the sorted unique resolutions in seconds of a list."""
+    return sorted(set(parse_resolution(v) for v in values or []))
+
+
+def _epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def period_start(timestamp, resolution):
+    """Return the start of the period of a resolution holding a timestamp."""
+    seconds = _epoch(timestamp)
+    return timestamp.replace(microsecond=0) - datetime.timedelta(
+        seconds=seconds % resolution)
+
+
+def is_aligned(timestamp, resolution):
+    """Tell whether a timestamp is a period boundary of a resolution."""
+    return not timestamp.microsecond and not _epoch(timestamp) % resolution
+
+
+def aggregate(entries, resolutions):
+    """Downsample samples into rollup rows.
+
+    :param entries: iterable of (key, timestamp, volume) tuples, key
+                    identifying the meter and resource of the sample.
+    :param resolutions: resolutions in seconds.
+    :returns: a dict of [count, sum, min, max, first timestamp, last
+              timestamp] lists indexed by (resolution, key, period start).
+    """
+    rows = {}
+    for key, timestamp, volume in entries:
+        # NOTE: statistics ignore samples without volume
+        if volume is None:
+            continue
+        for resolution in resolutions:
+            index = (resolution, key, period_start(timestamp, resolution))
+            row = rows.get(index)
+            if row is None:
+                rows[index] = [1, volume, volume, volume, timestamp,
+                               timestamp]
+                continue
+            row[0] += 1
+            row[1] += volume
+            row[2] = min(row[2], volume)
+            row[3] = max(row[3], volume)
+            row[4] = min(row[4], timestamp)
+            row[5] = max(row[5], timestamp)
+    return rows
+
+
+def choose_resolution(resolutions, sample_filter, period=None,
+                      aggregate=None):
+    """Return the coarsest resolution able to answer a statistics query.
+
+    A resolution fits when the period and the time range boundaries of the
+    filter are multiples of it, so that no rollup straddles two periods or
+    a boundary. Queries on a single sample or requesting aggregates which
+    can not be computed from rollups return None, as do periodic queries
+    without start timestamp, whose periods start at the first sample.
+    """
+    if not resolutions or sample_filter.message_id:
+        return None
+    if aggregate and any(a.func not in AGGREGATES for a in aggregate):
+        return None
+    start = sample_filter.start_timestamp
+    end = sample_filter.end_timestamp
+    if start and sample_filter.start_timestamp_op == 'gt':
+        return None
+    if end and sample_filter.end_timestamp_op == 'le':
+        return None
+    if period and not start:
+        return None
+    for resolution in sorted(resolutions, reverse=True):
+        if period and period % resolution:
+            continue
+        if start and not is_aligned(start, resolution):
+            continue
+        if end and not is_aligned(end, resolution):
+            continue
+        return resolution
+    return None
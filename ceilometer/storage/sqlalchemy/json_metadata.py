@@ -0,0 +1,190 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Helpers to query the metadata of resources from a single JSON column.
+
+The queryable metadata of a resource are stored in its flat_metadata column
+as a JSON object holding the same keys and values as the rows of the
+metadata tables, such as {"image.name": "cirros", "tags[0]": "web"}, so a
+metaquery on a key only reads the resource table. The keys of the allowlist
+are indexed: PostgreSQL and SQLite index the expressions extracting them,
+MySQL indexes a generated column holding their text value, which it uses
+for string equalities.
+"""
+
+import hashlib
+import json
+import operator
+
+from oslo_db import exception as dbexc
+import six
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+DIALECTS = ('mysql', 'postgresql', 'sqlite')
+
+TABLE = 'resource'
+
+COLUMN = 'flat_metadata'
+
+INDEX_PREFIX = 'ix_resource_meta_'
+
+# Generated columns holding the indexed keys on MySQL
+COLUMN_PREFIX = 'meta_'
+
+# Length of the indexed text values on MySQL
+INDEXED_LENGTH = 255
+
+# Operators comparing the JSON values of the keys, the other ones, such as
+# regular expressions, apply to their text.
+COMPARISONS = (operator.eq, operator.ne, operator.lt, operator.le,
+               operator.gt, operator.ge)
+
+
+def supported(engine):
+    """Tell whether the database can query JSON documents."""
+    if engine.dialect.name not in DIALECTS:
+        return False
+    if engine.dialect.name != 'sqlite':
+        return True
+    # NOTE: the JSON functions of SQLite are an optional extension
+    try:
+        engine.execute(sa.text("SELECT json('{}')"))
+    except (sa.exc.DBAPIError, dbexc.DBError):
+        return False
+    return True
+
+
+def _literal(dialect, value):
+    return sa.literal_column(sa.String().literal_processor(dialect)(value))
+
+
+def _path(dialect, key):
+    if dialect.name == 'postgresql':
+        return _literal(dialect, key)
+    return _literal(dialect, '$."%s"' % key.replace('\\', '\\\\')
+                    .replace('"', '\\"'))
+
+
+def value_of(column, key, dialect):
+    """Return the JSON value of a key of the flat metadata."""
+    if dialect.name == 'postgresql':
+        return sa.cast(column, postgresql.JSONB).op('->')(
+            _path(dialect, key))
+    return sa.func.json_extract(column, _path(dialect, key))
+
+
+def text_of(column, key, dialect):
+    """Return the text value of a key of the flat metadata."""
+    if dialect.name == 'postgresql':
+        return sa.cast(column, postgresql.JSONB).op('->>')(
+            _path(dialect, key))
+    if dialect.name == 'mysql':
+        return sa.func.json_unquote(value_of(column, key, dialect))
+    return value_of(column, key, dialect)
+
+
+def index_expression(column, key, dialect):
+    """Return the expression indexing a key of the flat metadata."""
+    if dialect.name == 'mysql':
+        return sa.func.left(text_of(column, key, dialect), INDEXED_LENGTH)
+    return value_of(column, key, dialect)
+
+
+def compare(column, key, op, value, dialect):
+    """Return the condition comparing a key of the flat metadata to a value.
+
+    A missing key compares as NULL, like a missing row of the metadata
+    tables.
+    """
+    if op not in COMPARISONS:
+        return op(text_of(column, key, dialect), value)
+    if dialect.name == 'sqlite':
+        return op(value_of(column, key, dialect), value)
+    if value is None:
+        # NOTE: a JSON null is not a SQL NULL on MySQL and PostgreSQL
+        if dialect.name == 'postgresql':
+            return op(text_of(column, key, dialect), value)
+        return op(sa.func.nullif(sa.func.json_type(
+            value_of(column, key, dialect)), 'NULL'), value)
+    encoded = json.dumps(value)
+    if dialect.name == 'postgresql':
+        return op(value_of(column, key, dialect),
+                  sa.cast(sa.literal(encoded), postgresql.JSONB))
+    condition = op(value_of(column, key, dialect),
+                   sa.func.json_extract(encoded, '$'))
+    if op is operator.eq and isinstance(value, six.string_types):
+        # NOTE: MySQL only uses the generated column of an indexed key for
+        # an expression identical to the one defining it.
+        condition = sa.and_(index_expression(column, key, dialect) ==
+                            value[:INDEXED_LENGTH], condition)
+    return condition
+
+
+def index_name(key):
+    if isinstance(key, six.text_type):
+        key = key.encode('utf-8')
+    return INDEX_PREFIX + hashlib.md5(key).hexdigest()[:12]
+
+
+def list_indexes(conn):
+    """Return the names of the indexes of metadata keys."""
+    if conn.dialect.name == 'mysql':
+        query = ("SELECT index_name FROM information_schema.statistics "
+                 "WHERE table_schema = DATABASE() AND table_name = :table")
+    elif conn.dialect.name == 'postgresql':
+        query = "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    else:
+        query = ("SELECT name FROM sqlite_master "
+                 "WHERE type = 'index' AND tbl_name = :table")
+    return set(name for name, in conn.execute(sa.text(query), table=TABLE)
+               if name.startswith(INDEX_PREFIX))
+
+
+def plan(existing, keys):
+    """Return the keys to index and the names of the indexes to drop."""
+    wanted = dict((index_name(key), key) for key in keys)
+    create = sorted(key for name, key in wanted.items()
+                    if name not in existing)
+    drop = sorted(name for name in existing if name not in wanted)
+    return create, drop
+
+
+def create_statements(dialect, keys):
+    """Return the statements indexing metadata keys."""
+    q = dialect.identifier_preparer.quote
+    statements = []
+    for key in keys:
+        name = index_name(key)
+        expression = str(index_expression(sa.column(COLUMN), key, dialect)
+                         .compile(dialect=dialect,
+                                  compile_kwargs={'literal_binds': True}))
+        if dialect.name == 'mysql':
+            column = COLUMN_PREFIX + name[len(INDEX_PREFIX):]
+            statements.append(
+                'ALTER TABLE %s ADD COLUMN %s VARCHAR(%d) AS (%s) VIRTUAL, '
+                'ADD INDEX %s (%s)' % (q(TABLE), q(column), INDEXED_LENGTH,
+                                       expression, q(name), q(column)))
+        else:
+            statements.append('CREATE INDEX %s ON %s ((%s))' % (
+                q(name), q(TABLE), expression))
+    return statements
+
+
+def drop_statements(dialect, names):
+    """Return the statements dropping indexes of metadata keys."""
+    q = dialect.identifier_preparer.quote
+    if dialect.name == 'mysql':
+        return ['ALTER TABLE %s DROP COLUMN %s' % (
+            q(TABLE), q(COLUMN_PREFIX + name[len(INDEX_PREFIX):]))
+            for name in names]
+    return ['DROP INDEX %s' % q(name) for name in names]
@@ -0,0 +1,30 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+# Add table summarizing first and last sample timestamps of resources
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    resource_summary = sa.Table(
+        'resource_summary', meta,
+        sa.Column('resource_id', sa.String(255), primary_key=True),
+        sa.Column('first_sample_timestamp', models.PreciseTimestamp()),
+        sa.Column('last_sample_timestamp', models.PreciseTimestamp()),
+        sa.Column('last_internal_id', sa.Integer),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    resource_summary.create()
@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+# Add table of samples downsampled over fixed resolutions
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    sample_rollup = sa.Table(
+        'sample_rollup', meta,
+        sa.Column('resolution', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('meter_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('resource_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('period_start', models.PreciseTimestamp(),
+                  primary_key=True),
+        sa.Column('count', sa.Integer),
+        sa.Column('sum', sa.Float(53)),
+        sa.Column('min', sa.Float(53)),
+        sa.Column('max', sa.Float(53)),
+        sa.Column('first_timestamp', models.PreciseTimestamp()),
+        sa.Column('last_timestamp', models.PreciseTimestamp()),
+        sa.Index('ix_sample_rollup_meter_period', 'resolution', 'meter_id',
+                 'period_start'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    sample_rollup.create()
@@ -192,6 +192,7 @@ class Resource(Base):
     resource_id = Column(String(255), nullable=False)
     resource_metadata = deferred(Column(JSONEncodedDict()))
     metadata_hash = deferred(Column(String(32)))
+    flat_metadata = deferred(Column(JSONEncodedDict()))
     samples = relationship("Sample", backref="resource")
     meta_text = relationship("MetaText", backref="resource",
                              cascade="all, delete-orphan")
@@ -209,6 +210,43 @@ def before_insert(mapper, connection, target):
     target.metadata_hash = hashlib.md5(metadata).hexdigest()
 
 
+class ResourceSummary(Base):
+    """First and last sample timestamps of each resource.
+
+    Only maintained when [database]/sql_resource_summary is enabled.
+    """
+
+    __tablename__ = 'resource_summary'
+    resource_id = Column(String(255), primary_key=True)
+    first_sample_timestamp = Column(PreciseTimestamp())
+    last_sample_timestamp = Column(PreciseTimestamp())
+    last_internal_id = Column(Integer)
+
+
+class SampleRollup(Base):
+    """Samples of a meter and a resource downsampled over a period.
+
+    Only maintained for the resolutions of [database]/sql_rollup_resolutions.
+    """
+
+    __tablename__ = 'sample_rollup'
+    __table_args__ = (
+        Index('ix_sample_rollup_meter_period', 'resolution', 'meter_id',
+              'period_start'),
+        _COMMON_TABLE_ARGS,
+    )
+    resolution = Column(Integer, primary_key=True, autoincrement=False)
+    meter_id = Column(Integer, primary_key=True, autoincrement=False)
+    resource_id = Column(Integer, primary_key=True, autoincrement=False)
+    period_start = Column(PreciseTimestamp(), primary_key=True)
+    count = Column(Integer)
+    sum = Column(Float(53))
+    min = Column(Float(53))
+    max = Column(Float(53))
+    first_timestamp = Column(PreciseTimestamp())
+    last_timestamp = Column(PreciseTimestamp())
+
+
 class Sample(Base):
     """Metering data."""
 
@@ -248,3 +286,4 @@ class FullSample(object):
     project_id = Resource.project_id
     resource_metadata = Resource.resource_metadata
     internal_id = Resource.internal_id
+    flat_metadata = Resource.flat_metadata
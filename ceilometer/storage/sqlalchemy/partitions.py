@@ -0,0 +1,249 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Helpers to partition the sample table by time ranges.
+
+The sample table is range partitioned on the timestamp of the samples, one
+partition per day or week, starting on Monday. Partitions are named after
+the first day they hold, such as sample_p20160601, and cover the samples up
+to the start of the next partition. The samples recorded before the table
+was partitioned are kept in the sample_legacy partition, and the samples
+newer than the last partition in the sample_default one. Expired samples
+are removed by dropping the partitions they fill.
+
+On PostgreSQL, the table is declaratively partitioned on its timestamp
+column. MySQL only partitions on integer expressions and prunes ranges of
+a column rather than of an expression, so the table is partitioned on a
+generated column holding the epoch of the samples, which the queries also
+filter on.
+"""
+
+import calendar
+import datetime
+import re
+
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+PERIODS = {'day': 1, 'week': 7}
+
+TABLE = 'sample'
+
+PREFIX = 'sample_p'
+
+LEGACY = 'sample_legacy'
+
+DEFAULT = 'sample_default'
+
+# Generated column partitioning the sample table on MySQL
+KEY_COLUMN = 'partition_key'
+
+DIALECTS = ('mysql', 'postgresql')
+
+
+def _epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def period_start(timestamp, period):
+    """Return the start of the day or week of a timestamp."""
+    start = datetime.datetime.combine(timestamp.date(), datetime.time())
+    if period == 'week':
+        start -= datetime.timedelta(days=start.weekday())
+    return start
+
+
+def next_period(timestamp, period):
+    """Return the start of the day or week following a timestamp."""
+    return (period_start(timestamp, period) +
+            datetime.timedelta(days=PERIODS[period]))
+
+
+def partition_name(start):
+    return '%s%s' % (PREFIX, start.strftime('%Y%m%d'))
+
+
+def plan(partitions, period, now, ahead, expire_before=None):
+    """Return the partitions to create and drop.
+
+    Partitions are created from the end of the last one, up to ahead
+    periods after the current one. When the period changes, the existing
+    partitions are kept and the new ones start at the end of the last one.
+
+    :param partitions: a dict of the end of the existing partitions indexed
+                       by name, None for the default one.
+    :param period: day or week.
+    :param now: current time.
+    :param ahead: number of periods following the current one to cover.
+    :param expire_before: drop the partitions whose samples are all older.
+    :returns: a list of (start, end) of the partitions to create, and the
+              sorted names of the partitions to drop.
+    """
+    ends = [end for end in partitions.values() if end is not None]
+    drop = []
+    if expire_before is not None:
+        drop = sorted(name for name, end in partitions.items()
+                      if end is not None and end <= expire_before)
+
+    last = (period_start(now, period) +
+            datetime.timedelta(days=PERIODS[period] * ahead))
+    create = []
+    start = max(ends) if ends else period_start(now, period)
+    while start <= last:
+        end = next_period(start, period)
+        create.append((start, end))
+        start = end
+    return create, drop
+
+
+def parse_bound(dialect_name, bound):
+    """Return the end of a partition from its description in the catalog.
+
+    :param bound: the LESS THAN value of a MySQL partition or the bound
+                  expression of a PostgreSQL one.
+    :returns: the end of the partition, None for the default one.
+    """
+    if dialect_name == 'mysql':
+        if not bound or bound == 'MAXVALUE':
+            return None
+        return datetime.datetime.utcfromtimestamp(int(bound))
+    match = re.search(r"TO \('([^']+)'\)", bound or '')
+    if match is None:
+        return None
+    return datetime.datetime.strptime(match.group(1)[:19],
+                                      '%Y-%m-%d %H:%M:%S')
+
+
+def list_partitions(conn):
+    """Return the end of the partitions of the sample table by name."""
+    if conn.dialect.name == 'mysql':
+        query = ("SELECT partition_name, partition_description "
+                 "FROM information_schema.partitions "
+                 "WHERE table_schema = DATABASE() AND table_name = :table "
+                 "AND partition_name IS NOT NULL")
+    else:
+        query = ("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+                 "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                 "WHERE i.inhparent = CAST(:table AS regclass)")
+    return dict((name, parse_bound(conn.dialect.name, bound))
+                for name, bound in conn.execute(sa.text(query), table=TABLE))
+
+
+def _ddl(element, dialect):
+    return str(element.compile(dialect=dialect))
+
+
+def partition_statements(dialect, boundary, foreign_keys=()):
+    """Return the statements partitioning an existing sample table.
+
+    :param boundary: end of the legacy partition holding the existing
+                     samples.
+    :param foreign_keys: names of the foreign keys of the table, which
+                         MySQL does not support on partitioned tables.
+    """
+    q = dialect.identifier_preparer.quote
+    table = models.Sample.__table__
+    if dialect.name == 'mysql':
+        changes = ['DROP FOREIGN KEY %s' % q(fk) for fk in foreign_keys]
+        changes.extend([
+            'ADD COLUMN %s BIGINT AS (FLOOR(%s)) STORED' % (
+                q(KEY_COLUMN), q('timestamp')),
+            'DROP PRIMARY KEY',
+            'ADD PRIMARY KEY (id, %s)' % q(KEY_COLUMN),
+        ])
+        return [
+            'ALTER TABLE %s %s' % (q(TABLE), ', '.join(changes)),
+            'ALTER TABLE %s PARTITION BY RANGE (%s) '
+            '(PARTITION %s VALUES LESS THAN (%d), '
+            'PARTITION %s VALUES LESS THAN MAXVALUE)' % (
+                q(TABLE), q(KEY_COLUMN), q(LEGACY), _epoch(boundary),
+                q(DEFAULT)),
+        ]
+
+    # NOTE: the existing table becomes the legacy partition of a new
+    # partitioned table, so that no sample is copied.
+    statements = [
+        'ALTER TABLE %s RENAME TO %s' % (q(TABLE), q(LEGACY)),
+        'ALTER INDEX %s RENAME TO %s' % (q('%s_pkey' % TABLE),
+                                         q('%s_pkey' % LEGACY)),
+    ]
+    for index in sorted(table.indexes, key=lambda i: i.name):
+        statements.append('ALTER INDEX %s RENAME TO %s' % (
+            q(index.name), q(index.name.replace(TABLE, LEGACY, 1))))
+    statements.extend([
+        'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (%s)' % (q(TABLE), q(LEGACY), q('timestamp')),
+        'ALTER TABLE %s ADD PRIMARY KEY (id, %s)' % (q(TABLE),
+                                                     q('timestamp')),
+    ])
+    statements.extend(_ddl(sa.schema.CreateIndex(index), dialect)
+                      for index in sorted(table.indexes,
+                                          key=lambda i: i.name))
+    statements.extend(_ddl(sa.schema.AddConstraint(fk), dialect)
+                      for fk in sorted(table.foreign_key_constraints,
+                                       key=lambda fk: fk.column_keys))
+    statements.extend([
+        'ALTER SEQUENCE %s OWNED BY %s.id' % (q('%s_id_seq' % TABLE),
+                                              q(TABLE)),
+        "ALTER TABLE %s ATTACH PARTITION %s "
+        "FOR VALUES FROM (MINVALUE) TO ('%s')" % (
+            q(TABLE), q(LEGACY), boundary.isoformat(' ')),
+        'CREATE TABLE %s PARTITION OF %s DEFAULT' % (q(DEFAULT), q(TABLE)),
+    ])
+    return statements
+
+
+def create_statements(dialect, bounds):
+    """Return the statements creating partitions of (start, end) bounds."""
+    if not bounds:
+        return []
+    q = dialect.identifier_preparer.quote
+    if dialect.name == 'mysql':
+        # NOTE: samples newer than the last partition are moved out of the
+        # default partition.
+        partitions = ['PARTITION %s VALUES LESS THAN (%d)' % (
+            q(partition_name(start)), _epoch(end)) for start, end in bounds]
+        partitions.append('PARTITION %s VALUES LESS THAN MAXVALUE'
+                          % q(DEFAULT))
+        return ['ALTER TABLE %s REORGANIZE PARTITION %s INTO (%s)' % (
+            q(TABLE), q(DEFAULT), ', '.join(partitions))]
+    return ["CREATE TABLE %s PARTITION OF %s FOR VALUES FROM ('%s') "
+            "TO ('%s')" % (q(partition_name(start)), q(TABLE),
+                           start.isoformat(' '), end.isoformat(' '))
+            for start, end in bounds]
+
+
+def drop_statements(dialect, names):
+    """Return the statements dropping partitions."""
+    if not names:
+        return []
+    q = dialect.identifier_preparer.quote
+    if dialect.name == 'mysql':
+        return ['ALTER TABLE %s DROP PARTITION %s' % (
+            q(TABLE), ', '.join(q(name) for name in names))]
+    return ['DROP TABLE %s' % q(name) for name in names]
+
+
+def key_conditions(sample_filter):
+    """Return conditions on the MySQL partition key matching a filter.
+
+    They are redundant with the conditions on the timestamp of the samples
+    but let MySQL prune the partitions outside of the filter time range.
+    """
+    key = sa.literal_column('%s.%s' % (TABLE, KEY_COLUMN), sa.BigInteger)
+    conditions = []
+    if sample_filter.start_timestamp:
+        conditions.append(key >= _epoch(sample_filter.start_timestamp))
+    if sample_filter.end_timestamp:
+        conditions.append(key <= _epoch(sample_filter.end_timestamp))
+    return conditions
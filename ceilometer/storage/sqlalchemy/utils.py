@@ -14,6 +14,7 @@
 import operator
 
 import six
+import sqlalchemy as sa
 from sqlalchemy import and_
 from sqlalchemy import asc
 from sqlalchemy import desc
@@ -22,6 +23,7 @@ from sqlalchemy import or_
 from sqlalchemy.orm import aliased
 
 import ceilometer
+from ceilometer.storage.sqlalchemy import json_metadata
 from ceilometer.storage.sqlalchemy import models
 
 
@@ -35,6 +37,36 @@ if six.PY2:
     META_TYPE_MAP[long] = models.MetaBigInt
 
 
+class StatementCache(object):
+    """compiled_cache execution option keeping some statements only.
+
+    SQLAlchemy caches every statement executed with a compiled_cache,
+    including the ones built for a single execution, such as savepoints.
+    This one only keeps the compiled forms of the given statements, which
+    must live as long as the cache. SQLAlchemy 1.4 changed the keys of the
+    cache and caches compiled statements on its own, this cache is only
+    supported by the earlier versions.
+    """
+
+    supported = tuple(int(part) for part in
+                      sa.__version__.split('.')[:2]) < (1, 4)
+
+    def __init__(self, statements):
+        self._ids = set(id(statement) for statement in statements)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def __setitem__(self, key, compiled):
+        # NOTE: the key is (dialect, statement, parameter names, ...)
+        if id(key[1]) in self._ids:
+            self._cache[key] = compiled
+
+
 class QueryTransformer(object):
     operators = {"=": operator.eq,
                  "<": operator.lt,
@@ -58,10 +90,12 @@ class QueryTransformer(object):
     ordering_functions = {"asc": asc,
                           "desc": desc}
 
-    def __init__(self, table, query, dialect='mysql'):
+    def __init__(self, table, query, dialect='mysql', flat_metadata=False):
         self.table = table
         self.query = query
+        self.joins = []
         self.dialect_name = dialect
+        self.flat_metadata = flat_metadata
 
     def _get_operator(self, op):
         return (self.dialect_operators.get(self.dialect_name, {}).get(op)
@@ -91,14 +125,14 @@ class QueryTransformer(object):
                                                  'operator is not implemented')
         field_name = field_name[len('resource_metadata.'):]
         meta_table = META_TYPE_MAP[type(value)]
+        if self.flat_metadata:
+            return json_metadata.compare(self.table.flat_metadata,
+                                         field_name, op, value,
+                                         self.query.session.bind.dialect)
         meta_alias = aliased(meta_table)
         on_clause = and_(self.table.internal_id == meta_alias.id,
                          meta_alias.meta_key == field_name)
-        # outer join is needed to support metaquery
-        # with or operator on non existent metadata field
-        # see: test_query_non_existing_metadata_with_result
-        # test case.
-        self.query = self.query.outerjoin(meta_alias, on_clause)
+        self.joins.append((meta_alias, on_clause))
         return op(meta_alias.value, value)
 
     def _transform(self, sub_tree):
@@ -109,7 +143,26 @@ class QueryTransformer(object):
             return self._handle_simple_op(operator, nodes)
 
     def apply_filter(self, expression_tree):
+        self.apply_compiled_filter(self.compile_filter(expression_tree))
+
+    def compile_filter(self, expression_tree):
+        """Return the outer joins and the condition of a filter.
+
+        They do not depend on the query, so they can be applied to other
+        queries of the same table with apply_compiled_filter.
+        """
+        self.joins = []
         condition = self._transform(expression_tree)
+        return self.joins, condition
+
+    def apply_compiled_filter(self, compiled):
+        joins, condition = compiled
+        for alias, on_clause in joins:
+            # outer join is needed to support metaquery
+            # with or operator on non existent metadata field
+            # see: test_query_non_existing_metadata_with_result
+            # test case.
+            self.query = self.query.outerjoin(alias, on_clause)
         self.query = self.query.filter(condition)
 
     def apply_options(self, orderby, limit):
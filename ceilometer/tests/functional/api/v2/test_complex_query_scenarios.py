@@ -17,8 +17,10 @@
 
 import datetime
 
+import mock
 from oslo_utils import timeutils
 
+from ceilometer.api.controllers.v2 import query
 from ceilometer.publisher import utils
 from ceilometer import sample
 from ceilometer.tests.functional.api import v2 as tests_api
@@ -310,3 +312,40 @@ class TestQueryMetersController(tests_api.FunctionalTest):
         self.CONF.set_override('default_api_return_limit', 1, group='api')
         data = self.post_json(self.url, params={})
         self.assertEqual(1, len(data.json))
+
+    def test_validated_query_cached(self):
+        query._validated_queries.clear()
+        filter_expr = '{"AND": [{"=": {"metadata.tag": "self.sample"}}, ' \
+                      '{">=": {"timestamp": "2012-07-02T10:41:00"}}]}'
+        with mock.patch.object(query.ValidatedComplexQuery,
+                               '_validate_filter') as validate_filter:
+            first = self.post_json(self.url,
+                                   params={"filter": filter_expr,
+                                           "orderby": '[{"volume": "ASC"}]'})
+            second = self.post_json(self.url,
+                                    params={"filter": filter_expr,
+                                            "orderby": '[{"volume": "ASC"}]'})
+            self.assertEqual(1, validate_filter.call_count)
+            self.assertEqual(first.json, second.json)
+            self.assertEqual([2, 3], [s['volume'] for s in first.json])
+
+            data = self.post_json(self.url,
+                                  params={"filter": filter_expr},
+                                  headers=non_admin_header)
+            self.assertEqual(2, validate_filter.call_count)
+            self.assertEqual([], data.json)
+
+            data = self.post_json(self.url,
+                                  params={"filter":
+                                          '{"=": {"project_id": '
+                                          '"project-id2"}}'},
+                                  expect_errors=True,
+                                  headers=non_admin_header)
+            self.assertEqual(401, data.status_int)
+            data = self.post_json(self.url,
+                                  params={"filter":
+                                          '{"=": {"project_id": '
+                                          '"project-id2"}}'},
+                                  expect_errors=True,
+                                  headers=non_admin_header)
+            self.assertEqual(401, data.status_int)
@@ -136,6 +136,38 @@ class TestListMetersRestriction(v2.FunctionalTest):
         data = self.get_json('/samples')
         self.assertEqual(3, len(data))
 
+    def _get_pages(self, path):
+        pages = []
+        url = self.PATH_PREFIX + path
+        while url:
+            response = self.app.get(url)
+            pages.append(response.json)
+            link = response.headers.get('Link')
+            url = link and link[1:link.index('>')]
+        return pages
+
+    def test_sample_pages(self):
+        pages = self._get_pages('/samples?limit=4')
+        self.assertEqual([4] * 6 + [1], [len(p) for p in pages])
+        ids = [s['id'] for p in pages for s in p]
+        self.assertEqual(25, len(set(ids)))
+        self.assertEqual([s['id'] for s in self.get_json('/samples?limit=42')],
+                         ids)
+
+    def test_old_sample_pages(self):
+        pages = self._get_pages('/meters/volume.size0?limit=2&q.field='
+                                'resource_id&q.value=resource-id')
+        self.assertEqual([2, 2, 1], [len(p) for p in pages])
+        self.assertEqual([9, 8, 7, 6, 5],
+                         [s['counter_volume'] for p in pages for s in p])
+
+    def test_sample_invalid_marker(self):
+        for marker in ('garbage', 'WyJhIl0'):
+            resp = self.get_json('/samples?marker=%s' % marker,
+                                 expect_errors=True, status=400)
+            self.assertEqual('Invalid marker',
+                             resp.json['error_message']['faultstring'])
+
 
 class TestListMeters(v2.FunctionalTest):
 
@@ -584,3 +584,13 @@ class TestListResourcesRestriction(v2.FunctionalTest):
     def test_resource_default_limit(self):
         data = self.get_json('/resources')
         self.assertEqual(10, len(data))
+
+    def test_resource_pages(self):
+        response = self.app.get(self.PATH_PREFIX + '/resources?limit=8')
+        ids = [r['resource_id'] for r in response.json]
+        while 'Link' in response.headers:
+            link = response.headers['Link']
+            self.assertTrue(link.endswith('>; rel="next"'))
+            response = self.app.get(link[1:link.index('>')])
+            ids.extend(r['resource_id'] for r in response.json)
+        self.assertEqual(sorted('resource-id%s' % i for i in range(20)), ids)
@@ -154,3 +154,32 @@ class TestListSamples(v2.FunctionalTest):
              ('tag', 'self.sample'),
              ],
             list(sorted(six.iteritems(sample['resource_metadata']))))
+
+    def test_streamed(self):
+        paths = ['/meters/instance', '/samples', '/resources']
+        expected = [self.app.get(self.PATH_PREFIX + path).body
+                    for path in paths]
+        self.CONF.set_override('stream_listings', True, group='api')
+        self.app = self._make_app()
+        for path, body in zip(paths, expected):
+            response = self.app.get(self.PATH_PREFIX + path)
+            self.assertEqual(body, response.body)
+            self.assertEqual('application/json', response.content_type)
+
+        response = self.app.get(self.PATH_PREFIX + '/samples',
+                                params={'limit': 1})
+        self.assertEqual(1, len(response.json))
+        self.assertNotIn('Link', response.headers)
+        response = self.app.get(self.PATH_PREFIX + '/meters/instance',
+                                params={'q.field': 'project_id',
+                                        'q.value': 'no-such-project'})
+        self.assertEqual([], response.json)
+
+    def test_streamed_storage_error(self):
+        self.CONF.set_override('stream_listings', True, group='api')
+        self.app = self._make_app()
+        with mock.patch.object(self.conn, 'get_samples',
+                               side_effect=RuntimeError('boom')):
+            response = self.app.get(self.PATH_PREFIX + '/samples',
+                                    expect_errors=True)
+        self.assertEqual(500, response.status_int)
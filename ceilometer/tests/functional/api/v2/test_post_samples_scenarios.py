@@ -25,6 +25,7 @@ from oslo_utils import fileutils
 from oslo_utils import timeutils
 import six
 
+from ceilometer import storage
 from ceilometer.tests.functional.api import v2
 
 
@@ -372,3 +373,57 @@ class TestPostSamples(v2.FunctionalTest):
 
             s['monotonic_time'] = None
             self.assertEqual(s, self.published[0][x])
+
+    def _samples(self, count, **kwargs):
+        samples = [{'counter_name': 'apples',
+                    'counter_type': 'gauge',
+                    'counter_unit': 'instance',
+                    'counter_volume': i,
+                    'resource_id': 'bd9431c1-8d69-4ad3-803a-8d4a6b89fd36',
+                    'project_id': '35b17138-b364-4e6a-a131-8f3099c5be68',
+                    'user_id': 'efd87807-12d2-4b38-9c70-5f5c2ac427ff',
+                    'timestamp': '2016-06-01T00:%02d:00' % i,
+                    'resource_metadata': {'nest.name1': 'value%d' % i}}
+                   for i in range(count)]
+        for s in samples:
+            s.update(kwargs)
+        return samples
+
+    def test_notifications_split(self):
+        self.CONF.set_override('post_samples_batch_size', 2, group='api')
+        data = self.post_json('/meters/apples/', self._samples(5))
+        self.assertEqual(201, data.status_int)
+        self.assertEqual([2, 2, 1], [len(p) for p in self.published])
+        self.assertEqual([m['message_id'] for m in data.json],
+                         [m['message_id'] for p in self.published
+                          for m in p])
+
+    def test_direct(self):
+        self.CONF.set_override('post_samples_batch_size', 2, group='api')
+        with mock.patch.object(
+                self.conn, 'record_metering_data_batch',
+                wraps=self.conn.record_metering_data_batch) as record:
+            data = self.post_json('/meters/apples/?direct=True',
+                                  self._samples(3))
+        self.assertEqual(201, data.status_int)
+        self.assertEqual(0, len(self.published))
+        self.assertEqual([2, 1], [len(c[0][0]) for c in record.call_args_list])
+        for msg in record.call_args_list[0][0][0]:
+            self.assertEqual(datetime.datetime, type(msg['timestamp']))
+        stored = sorted(self.conn.get_samples(storage.SampleFilter(
+            meter='apples')), key=lambda s: s.counter_volume)
+        self.assertEqual([m['message_id'] for m in data.json],
+                         [s.message_id for s in stored])
+        self.assertEqual(datetime.datetime(2016, 6, 1, 0, 2),
+                         stored[2].timestamp)
+        self.assertEqual({'nest': {'name1': 'value2'}},
+                         stored[2].resource_metadata)
+
+    def test_direct_invalid_sample(self):
+        samples = self._samples(3)
+        samples[2]['counter_type'] = 'INVALID_TYPE'
+        data = self.post_json('/meters/apples/?direct=True', samples,
+                              expect_errors=True)
+        self.assertEqual(400, data.status_int)
+        self.assertEqual([], list(self.conn.get_samples(storage.SampleFilter(
+            meter='apples'))))
@@ -16,6 +16,8 @@
 
 import datetime
 
+import mock
+
 from ceilometer.publisher import utils
 from ceilometer import sample
 from ceilometer.tests import db as tests_db
@@ -1691,3 +1693,56 @@ class TestBigValueStatistics(v2.FunctionalTest):
             for name, expected_value in expected_values.items():
                 self.assertIn(name, d)
                 self.assertEqual(expected_value, d[name])
+
+
+class TestStatisticsCache(v2.FunctionalTest):
+    PATH = '/meters/volume.size/statistics'
+
+    def setUp(self):
+        super(TestStatisticsCache, self).setUp()
+        self.CONF.set_override('query_cache_backend', 'memory', group='api')
+        self.app = self._make_app()
+        for i in range(2):
+            s = sample.Sample(
+                'volume.size',
+                'gauge',
+                'GiB',
+                5 + i,
+                'user-id',
+                'project%d' % i,
+                'resource-id',
+                timestamp=datetime.datetime(2012, 9, 25, 10 + i, 30),
+                resource_metadata={},
+                source='source1',
+            )
+            msg = utils.meter_message_from_counter(
+                s, self.CONF.publisher.telemetry_secret,
+            )
+            self.conn.record_metering_data(msg)
+
+    def test_statistics_cached(self):
+        q = [{'field': 'timestamp', 'op': 'lt',
+              'value': '2012-09-26T00:00:00'}]
+        with mock.patch.object(self.conn, 'get_meter_statistics',
+                               wraps=self.conn.get_meter_statistics) as stats:
+            data = self.get_json(self.PATH, q=q)
+            self.assertEqual(data, self.get_json(self.PATH, q=q))
+            self.assertEqual(1, stats.call_count)
+            self.assertEqual(2, data[0]['count'])
+
+            data = self.get_json(self.PATH, q=q, period=3600)
+            self.assertEqual(2, len(data))
+            self.assertEqual(2, stats.call_count)
+
+            data = self.get_json(self.PATH, q=q, headers={
+                'X-Roles': 'Member', 'X-Project-Id': 'project1'})
+            self.assertEqual(1, data[0]['count'])
+            self.assertEqual(3, stats.call_count)
+
+    def test_meters_cached(self):
+        with mock.patch.object(self.conn, 'get_meters',
+                               wraps=self.conn.get_meters) as meters:
+            data = self.get_json('/meters')
+            self.assertEqual(data, self.get_json('/meters'))
+            self.assertEqual(1, meters.call_count)
+            self.assertEqual(1, len(data))
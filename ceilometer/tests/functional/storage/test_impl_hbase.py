@@ -20,6 +20,9 @@
   running the tests. Make sure the Thrift server is running on that server.
 
 """
+import datetime
+import uuid
+
 import mock
 
 
@@ -29,6 +32,10 @@ except ImportError:
     import testtools.testcase
     raise testtools.testcase.TestSkipped("happybase is needed")
 
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
+from ceilometer.storage.hbase import inmemory
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
@@ -55,6 +62,51 @@ class ConnectionTest(tests_db.TestBase):
         self.assertIsInstance(conn.conn_pool, TestConn)
 
 
+@tests_db.run_with('hbase')
+class RecordBatchTest(tests_db.TestBase):
+
+    def _make_sample(self, resource_id, minute, meta):
+        s = sample.Sample('meter-%s' % minute, sample.TYPE_GAUGE, '', minute,
+                          'user-id', 'project-id', resource_id,
+                          timestamp=datetime.datetime(2016, 6, 1, 15, minute),
+                          resource_metadata={'tag': meta}, source='source')
+        return utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret)
+
+    def test_batch_round_trips(self):
+        if not isinstance(self.conn.conn_pool, inmemory.MConnectionPool):
+            self.skipTest('round trips are only counted in memory')
+        tables = self.conn.conn_pool.conn.tables
+        res_a, res_b = str(uuid.uuid4()), str(uuid.uuid4())
+        samples = [self._make_sample(res_a, 2, 'a2'),
+                   self._make_sample(res_b, 1, 'b1'),
+                   self._make_sample(res_a, 1, 'a1'),
+                   self._make_sample(res_b, 2, 'b2')]
+        before = sum(t.round_trips for t in tables.values())
+        self.conn.record_metering_data_batch(samples)
+        # NOTE: one batch per sample timestamp for the resources and one
+        # for the meters, instead of two puts per sample
+        self.assertEqual(3, sum(t.round_trips for t in tables.values()) -
+                         before)
+
+        for resource_id, meta in ((res_a, 'a2'), (res_b, 'b2')):
+            resource = next(self.conn.get_resources(resource=resource_id))
+            self.assertEqual({'tag': meta}, resource.metadata)
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 1),
+                             resource.first_sample_timestamp)
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 2),
+                             resource.last_sample_timestamp)
+            self.assertEqual(2, len(list(self.conn.get_samples(
+                storage.SampleFilter(resource=resource_id)))))
+
+        # A late sample does not override the metadata of the newest one
+        self.conn.record_metering_data(self._make_sample(res_a, 0, 'a0'))
+        resource = next(self.conn.get_resources(resource=res_a))
+        self.assertEqual({'tag': 'a2'}, resource.metadata)
+        self.assertEqual(datetime.datetime(2016, 6, 1, 15, 0),
+                         resource.first_sample_timestamp)
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -68,18 +120,18 @@ class CapabilitiesTest(test_base.BaseTestCase):
             'samples': {'query': {'simple': True,
                                   'metadata': True,
                                   'complex': False}},
-            'statistics': {'groupby': False,
+            'statistics': {'groupby': True,
                            'query': {'simple': True,
                                      'metadata': True},
                            'aggregation': {'standard': True,
                                            'selectable': {
-                                               'max': False,
-                                               'min': False,
-                                               'sum': False,
-                                               'avg': False,
-                                               'count': False,
-                                               'stddev': False,
-                                               'cardinality': False}}
+                                               'max': True,
+                                               'min': True,
+                                               'sum': True,
+                                               'avg': True,
+                                               'count': True,
+                                               'stddev': True,
+                                               'cardinality': True}}
                            },
         }
 
@@ -20,8 +20,12 @@
   server before running the tests.
 
 """
+import datetime
+
+import mock
 
 from ceilometer.storage import impl_mongodb
+from ceilometer.storage.mongo import utils as pymongo_utils
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
 
@@ -76,6 +80,21 @@ class IndexTest(tests_db.TestBase):
         self._test_ttl_index_present(self.conn, 'meter',
                                      'metering_time_to_live')
 
+    def test_resources_pipeline_index(self):
+        self.assertTrue(pymongo_utils.index_covers(self.conn.db.meter,
+                                                   ['timestamp']))
+        self.assertFalse(pymongo_utils.index_covers(self.conn.db.meter,
+                                                    ['timestamp', 'source']))
+        self.conn.db.meter.drop_index('timestamp_idx')
+        with mock.patch.object(impl_mongodb.LOG, 'warning') as warning:
+            list(self.conn.get_resources(
+                start_timestamp=datetime.datetime(2016, 6, 1)))
+            list(self.conn.get_resources(
+                start_timestamp=datetime.datetime(2016, 6, 1)))
+        self.assertEqual(1, warning.call_count)
+        self.assertEqual([], [n for n in self.conn.db.collection_names()
+                              if n.startswith('resource_list_')])
+
 
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
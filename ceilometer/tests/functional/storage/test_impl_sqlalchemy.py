@@ -24,11 +24,16 @@ import warnings
 import mock
 from oslo_db import exception
 from oslo_utils import timeutils
+import sqlalchemy as sa
 
 from ceilometer.publisher import utils
 from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
+from ceilometer.storage.sqlalchemy import json_metadata
 from ceilometer.storage.sqlalchemy import models as sql_models
+from ceilometer.storage.sqlalchemy import partitions
+from ceilometer.storage.sqlalchemy import utils as sql_utils
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
 from ceilometer.tests.functional.storage \
@@ -80,6 +85,847 @@ class RelationshipTest(scenarios.DBTestBase):
         self.assertEqual(set(resource_ids.all()), s)
 
 
+def _make_sample(name, resource_id, metadata, minute):
+    s = sample.Sample(name=name,
+                      type=sample.TYPE_GAUGE,
+                      unit='B',
+                      volume=minute,
+                      user_id='user-id',
+                      project_id='project-id',
+                      resource_id=resource_id,
+                      timestamp=datetime.datetime(2016, 6, 1, 15, minute),
+                      resource_metadata=metadata,
+                      source='test')
+    return utils.meter_message_from_counter(s, 'not-so-secret')
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class BatchRecordingTest(tests_db.TestBase):
+
+    def test_batch_reuses_and_creates_definitions(self):
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-1', {'key': 'v1'}, 0))
+        samples = [
+            _make_sample('meter-a', 'resource-1', {'key': 'v1'}, 1),
+            _make_sample('meter-b', 'resource-1', {'key': 'v1'}, 2),
+            _make_sample('meter-b', 'resource-1', {'key': 'v2'}, 3),
+            _make_sample('meter-b', 'resource-2', {'key': 'v2'}, 4),
+            _make_sample('meter-b', 'resource-2', {'key': 'v2'}, 5),
+        ]
+        self.conn.record_metering_data_batch(samples)
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(6, session.query(sql_models.Sample).count())
+        self.assertEqual(2, session.query(sql_models.Meter).count())
+        self.assertEqual(3, session.query(sql_models.Resource).count())
+        hashes = set(h for h, in session.query(
+            sql_models.Resource.metadata_hash))
+        self.assertEqual(
+            set(impl_sqlalchemy.Connection._metadata_hash({'key': v})
+                for v in ('v1', 'v2')), hashes)
+        self.assertEqual(3, session.query(sql_models.MetaText).count())
+
+        results = list(self.conn.get_samples(storage.SampleFilter(
+            meter='meter-b', metaquery={'metadata.key': 'v2'})))
+        self.assertEqual(3, len(results))
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class SampleStreamingTest(tests_db.TestBase):
+
+    def test_samples_fetched_by_batches(self):
+        self.CONF.set_override('sample_fetch_size', 2, group='database')
+        self.conn.record_metering_data_batch(
+            [_make_sample('meter-a', 'resource-%d' % i, {}, i)
+             for i in range(5)])
+        with mock.patch.object(sa.orm.Query, 'all',
+                               side_effect=AssertionError), \
+                mock.patch.object(sa.orm.Query, 'yield_per', autospec=True,
+                                  side_effect=sa.orm.Query.yield_per) as y:
+            samples = list(self.conn.get_samples(storage.SampleFilter()))
+            queried = list(self.conn.query_samples(
+                orderby=[{'timestamp': 'asc'}]))
+        self.assertEqual([2, 2], [c[0][1] for c in y.call_args_list])
+        self.assertEqual(['resource-%d' % i for i in range(4, -1, -1)],
+                         [s.resource_id for s in samples])
+        self.assertEqual(['resource-%d' % i for i in range(5)],
+                         [s.resource_id for s in queried])
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class ExpiryTest(tests_db.TestBase):
+
+    def setUp(self):
+        super(ExpiryTest, self).setUp()
+        self.CONF.set_override('sql_expire_chunk_size', 2, group='database')
+        self.CONF.set_override('sql_expire_chunk_interval', 0.5,
+                               group='database')
+        self.conn.record_metering_data_batch(
+            [_make_sample('meter-%d' % (i % 2), 'resource-%d' % i,
+                          {'key': 'v%d' % i}, i) for i in range(7)])
+        self.session = self.conn._engine_facade.get_session()
+
+    def _count(self, model):
+        return self.session.query(model).count()
+
+    @mock.patch.object(impl_sqlalchemy.time, 'sleep')
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expire_in_chunks(self, mock_utcnow, mock_sleep):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 15, 7)
+        with mock.patch.object(impl_sqlalchemy.LOG, 'info') as info:
+            self.conn.clear_expired_metering_data(60)
+        self.assertEqual(1, self._count(sql_models.Sample))
+        self.assertEqual(1, self._count(sql_models.Meter))
+        self.assertEqual(1, self._count(sql_models.Resource))
+        self.assertEqual(1, self._count(sql_models.MetaText))
+        # NOTE: 6 samples and 6 resources in full chunks of 2, 1 meter
+        self.assertEqual(6, mock_sleep.call_args_list.count(mock.call(0.5)))
+        self.assertIn(mock.call(mock.ANY, {'total': 6, 'name': 'samples'}),
+                      info.call_args_list)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_resume_interrupted_expiry(self, mock_utcnow):
+        def interrupt(seconds):
+            if seconds == 0.5:
+                raise KeyboardInterrupt()
+
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 15, 7)
+        with mock.patch.object(impl_sqlalchemy.time, 'sleep',
+                               side_effect=interrupt):
+            self.assertRaises(KeyboardInterrupt,
+                              self.conn.clear_expired_metering_data, 60)
+        # NOTE: the oldest samples deleted by committed chunks are gone
+        self.assertEqual([datetime.datetime(2016, 6, 1, 15, i)
+                          for i in range(2, 7)],
+                         sorted(t for t, in self.session.query(
+                             sql_models.Sample.timestamp)))
+        self.assertEqual(7, self._count(sql_models.Resource))
+
+        self.CONF.set_override('sql_expire_chunk_interval', 0,
+                               group='database')
+        self.conn.clear_expired_metering_data(60)
+        self.assertEqual(1, self._count(sql_models.Sample))
+        self.assertEqual(1, self._count(sql_models.Resource))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expire_time_slices(self, mock_utcnow):
+        self.CONF.set_override('sql_expire_workers', 3, group='database')
+        start = datetime.datetime(2016, 6, 1, 15)
+        self.assertEqual(
+            [(None, start + datetime.timedelta(minutes=2)),
+             (start + datetime.timedelta(minutes=2),
+              start + datetime.timedelta(minutes=4)),
+             (start + datetime.timedelta(minutes=4),
+              start + datetime.timedelta(minutes=6))],
+            self.conn._expiry_slices(start + datetime.timedelta(minutes=6),
+                                     3))
+        self.assertEqual([(None, start)],
+                         self.conn._expiry_slices(start, 3))
+        self.assertEqual([(None, start + datetime.timedelta(minutes=6))],
+                         self.conn._expiry_slices(
+                             start + datetime.timedelta(minutes=6), 1))
+        engine = self.conn._engine_facade.get_engine()
+        self.assertEqual(1 if engine.dialect.name == 'sqlite' else 3,
+                         self.conn._expire_workers())
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 15, 7)
+        self.conn.clear_expired_metering_data(60)
+        self.assertEqual(1, self._count(sql_models.Sample))
+        self.assertEqual(1, self._count(sql_models.Resource))
+
+
+@tests_db.run_with('mysql', 'pgsql')
+class PartitioningTest(tests_db.TestBase):
+
+    def setUp(self):
+        super(PartitioningTest, self).setUp()
+        self.CONF.set_override('sql_sample_partitioning', 'day',
+                               group='database')
+        self.CONF.set_override('sql_sample_partitions_ahead', 2,
+                               group='database')
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-1', {}, 0))
+
+    def _partitions(self):
+        engine = self.conn._engine_facade.get_engine()
+        return partitions.list_partitions(engine)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_partition_and_expire(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 16)
+        self.conn.upgrade()
+        self.assertEqual(
+            {partitions.LEGACY: datetime.datetime(2016, 6, 2),
+             partitions.DEFAULT: None,
+             'sample_p20160602': datetime.datetime(2016, 6, 3),
+             'sample_p20160603': datetime.datetime(2016, 6, 4)},
+            self._partitions())
+
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 2, 16)
+        s = _make_sample('meter-a', 'resource-1', {}, 0)
+        s['timestamp'] = datetime.datetime(2016, 6, 2, 15)
+        self.conn.record_metering_data(s)
+        f = storage.SampleFilter(
+            start_timestamp=datetime.datetime(2016, 6, 2))
+        self.assertEqual(1, len(list(self.conn.get_samples(f))))
+
+        self.conn.clear_expired_metering_data(3600)
+        self.assertNotIn(partitions.LEGACY, self._partitions())
+        self.assertIn('sample_p20160604', self._partitions())
+        self.assertEqual(1, len(list(self.conn.get_samples(
+            storage.SampleFilter()))))
+
+    def test_id_caches(self):
+        self.conn.upgrade()
+        self.conn.record_metering_data_batch(
+            [_make_sample('meter-a', 'resource-1', {}, 1)])
+        engine = self.conn._engine_facade.get_engine()
+        sizes = [stats['size'] for stats in
+                 self.conn.get_id_cache_stats().values()]
+        # NOTE: cached ids are not checked by foreign keys on MySQL
+        self.assertEqual([0, 0] if engine.dialect.name == 'mysql'
+                         else [1, 1], sizes)
+
+
+@tests_db.run_with('sqlite')
+class UnsupportedPartitioningTest(tests_db.TestBase):
+
+    def test_partitioning_ignored(self):
+        self.CONF.set_override('sql_sample_partitioning', 'week',
+                               group='database')
+        with mock.patch.object(impl_sqlalchemy.LOG, 'warning') as warning:
+            self.conn.upgrade()
+            self.conn.clear_expired_metering_data(3600)
+        self.assertEqual(1, warning.call_count)
+        self.assertFalse(self.conn._prune_partitions())
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class IdCacheTest(tests_db.TestBase):
+
+    def _record(self, minute, batch=True, **kwargs):
+        s = _make_sample(kwargs.get('name', 'meter-a'),
+                         kwargs.get('resource_id', 'resource-1'),
+                         kwargs.get('metadata', {'key': 'v1'}), minute)
+        if batch:
+            self.conn.record_metering_data_batch([s])
+        else:
+            self.conn.record_metering_data(s)
+
+    def test_steady_state_without_lookup(self):
+        self._record(0)
+        with mock.patch.object(impl_sqlalchemy.Connection, '_select_meters',
+                               side_effect=AssertionError) as meters, \
+                mock.patch.object(impl_sqlalchemy.Connection,
+                                  '_select_resources',
+                                  side_effect=AssertionError) as resources, \
+                mock.patch.object(impl_sqlalchemy.Connection,
+                                  '_create_meter',
+                                  side_effect=AssertionError) as meter, \
+                mock.patch.object(impl_sqlalchemy.Connection,
+                                  '_create_resource',
+                                  side_effect=AssertionError) as resource:
+            self._record(1)
+            self._record(2, batch=False)
+        for m in (meters, resources, meter, resource):
+            self.assertFalse(m.called)
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(3, session.query(sql_models.Sample).count())
+        stats = self.conn.get_id_cache_stats()
+        self.assertEqual(dict(hits=2, misses=1, size=1, hit_rate=2.0 / 3),
+                         stats['meter'])
+        self.assertEqual(dict(hits=2, misses=1, size=1, hit_rate=2.0 / 3),
+                         stats['resource'])
+
+    def test_new_metadata_is_a_new_resource(self):
+        self._record(0)
+        self._record(1, metadata={'key': 'v2'})
+        self._record(2, batch=False, metadata={'key': 'v3'})
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(3, session.query(sql_models.Resource).count())
+        self.assertEqual(3, self.conn.get_id_cache_stats()['resource']['size'])
+
+    def test_rollback_not_cached(self):
+        # NOTE: the meter is created but the transaction is rolled back
+        # when the resource creation fails
+        with mock.patch.object(impl_sqlalchemy.Connection,
+                               '_create_resources',
+                               side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self._record, 0)
+        self.assertEqual(0, self.conn.get_id_cache_stats()['meter']['size'])
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(0, session.query(sql_models.Meter).count())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expire_invalidates_cache(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 2)
+        self._record(0)
+        self.conn.clear_expired_metering_data(60)
+        stats = self.conn.get_id_cache_stats()
+        self.assertEqual(0, stats['meter']['size'])
+        self.assertEqual(0, stats['resource']['size'])
+        self._record(1)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(1, session.query(sql_models.Meter).count())
+        self.assertEqual(1, session.query(sql_models.Resource).count())
+
+    def test_cache_disabled(self):
+        self.CONF.set_override('sql_meter_cache_size', 0, group='database')
+        self.CONF.set_override('sql_resource_cache_size', 0,
+                               group='database')
+        conn = impl_sqlalchemy.Connection(self.CONF, 'sqlite://')
+        conn.upgrade()
+        s = _make_sample('meter-a', 'resource-1', {}, 0)
+        conn.record_metering_data_batch([s])
+        conn.record_metering_data(s)
+        stats = conn.get_id_cache_stats()
+        self.assertEqual(dict(hits=0, misses=0, size=0, hit_rate=0.0),
+                         stats['meter'])
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class ConnectionPoolTest(tests_db.TestBase):
+
+    def test_statement_cache(self):
+        if not sql_utils.StatementCache.supported:
+            self.skipTest('SQLAlchemy caches compiled statements itself')
+        self.CONF.set_override('sql_meter_cache_size', 0, group='database')
+        self.CONF.set_override('sql_resource_cache_size', 0,
+                               group='database')
+        conn = impl_sqlalchemy.Connection(self.CONF, self.db_manager.url)
+        conn.upgrade()
+        conn.record_metering_data(_make_sample('meter-a', 'resource-1',
+                                               {'key': 'v1'}, 0))
+        # NOTE: the meter and resource lookups and inserts, the metadata
+        # and sample inserts
+        self.assertEqual(6, len(conn._statement_cache))
+        conn.record_metering_data(_make_sample('meter-b', 'resource-2',
+                                               {'key': 'v2'}, 1))
+        conn.record_metering_data_batch([
+            _make_sample('meter-c', 'resource-3', {'key': 'v3'}, 2)])
+        self.assertEqual(6, len(conn._statement_cache))
+        session = conn._engine_facade.get_session()
+        self.assertEqual(3, session.query(sql_models.Sample).count())
+        self.assertEqual(3, session.query(sql_models.Meter).count())
+        conn.clear()
+
+    def test_pool_stats(self):
+        stats = self.conn.get_pool_stats()
+        self.conn.record_metering_data(_make_sample('meter-a', 'resource-1',
+                                                    {}, 0))
+        new_stats = self.conn.get_pool_stats()
+        self.assertGreater(new_stats['checkouts'], stats['checkouts'])
+        self.assertGreater(new_stats['statements'], stats['statements'])
+        self.assertGreaterEqual(new_stats['statement_time_max'],
+                                new_stats['statement_time_avg'])
+
+    def test_pool_stats_failed_statement(self):
+        engine = self.conn._engine_facade.get_engine()
+        with engine.connect() as conn:
+            self.assertRaises(exception.DBError, conn.execute,
+                              'SELECT * FROM missing_table')
+            self.assertNotIn('query_start_time', conn.info)
+            conn.execute('SELECT 1')
+            self.assertNotIn('query_start_time', conn.info)
+
+    def test_warm_up(self):
+        checkouts = self.conn.get_pool_stats()['checkouts']
+        self.conn.warm_up(2)
+        self.assertLess(checkouts, self.conn.get_pool_stats()['checkouts'])
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class PeriodStatisticsTest(tests_db.TestBase):
+
+    def setUp(self):
+        super(PeriodStatisticsTest, self).setUp()
+        samples = []
+        start = datetime.datetime(2016, 6, 1, 15, 0)
+        # NOTE: samples on, just before and just after period boundaries
+        for i, seconds in enumerate([0, 59.999999, 60, 60.000001, 179,
+                                     299.5, 300, 301, 899.999999, 900]):
+            s = _make_sample('meter-a', 'resource-%d' % (i % 3), {}, 0)
+            s['counter_volume'] = i
+            s['user_id'] = 'user-%d' % (i % 2)
+            s['timestamp'] = start + datetime.timedelta(seconds=seconds)
+            samples.append(s)
+        self.conn.record_metering_data_batch(samples)
+
+    def _compare(self, sample_filter, period, groupby=None):
+        expected = list(self.conn._iter_period_statistics(
+            self.conn._make_stats_query(sample_filter, groupby, None),
+            sample_filter.start_timestamp, sample_filter.end_timestamp,
+            period, groupby, None))
+        with mock.patch.object(impl_sqlalchemy.Connection,
+                               '_iter_period_statistics') as loop:
+            results = list(self.conn.get_meter_statistics(
+                sample_filter, period=period, groupby=groupby))
+        self.assertFalse(loop.called)
+
+        def key(r):
+            return r.period_start, sorted((r.groupby or {}).items())
+        self.assertEqual([r.as_dict() for r in sorted(expected, key=key)],
+                         [r.as_dict() for r in sorted(results, key=key)])
+        return results
+
+    def test_period_boundaries(self):
+        f = storage.SampleFilter(
+            meter='meter-a',
+            start_timestamp=datetime.datetime(2016, 6, 1, 15, 0),
+            end_timestamp=datetime.datetime(2016, 6, 1, 15, 15))
+        results = self._compare(f, 60)
+        self.assertEqual([2, 2, 1, 1, 2, 1],
+                         [r.count for r in results])
+
+    def test_period_unaligned_start(self):
+        f = storage.SampleFilter(
+            meter='meter-a',
+            start_timestamp=datetime.datetime(2016, 6, 1, 15, 0, 0, 1),
+            end_timestamp=datetime.datetime(2016, 6, 1, 15, 14, 59, 999999))
+        self._compare(f, 7)
+
+    def test_period_groupby(self):
+        f = storage.SampleFilter(
+            meter='meter-a',
+            start_timestamp=datetime.datetime(2016, 6, 1, 14, 59),
+            end_timestamp=datetime.datetime(2016, 6, 1, 16))
+        results = self._compare(f, 300, groupby=['user_id', 'resource_id'])
+        self.assertEqual(10, sum(r.count for r in results))
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class RollupTest(tests_db.TestBase):
+
+    def setUp(self):
+        super(RollupTest, self).setUp()
+        self.CONF.set_override('sql_rollup_resolutions', ['1m', '5m', '1h'],
+                               group='database')
+        self.conn = impl_sqlalchemy.Connection(self.CONF,
+                                               self.db_manager.url)
+        self.conn.upgrade()
+        self.start = datetime.datetime(2016, 6, 1, 15, 0)
+
+    def _samples(self, count=26):
+        samples = []
+        for i in range(count):
+            s = _make_sample('meter-a', 'resource-%d' % (i % 3), {}, 0)
+            s['counter_volume'] = i
+            s['user_id'] = 'user-%d' % (i % 2)
+            s['timestamp'] = self.start + datetime.timedelta(
+                minutes=7 * i, seconds=i, microseconds=i)
+            samples.append(s)
+        return samples
+
+    def _record(self, samples):
+        self.conn.record_metering_data_batch(samples[1:])
+        self.conn.record_metering_data(samples[0])
+
+    def _compare(self, resolution, sample_filter, period=None, groupby=None,
+                 aggregate=None):
+        with mock.patch.object(
+                impl_sqlalchemy.Connection, '_make_stats_query',
+                autospec=True,
+                side_effect=impl_sqlalchemy.Connection._make_stats_query
+        ) as make_query:
+            results = list(self.conn.get_meter_statistics(
+                sample_filter, period=period, groupby=groupby,
+                aggregate=aggregate))
+        self.assertEqual(resolution, make_query.call_args[0][-1])
+
+        resolutions = self.conn._rollup_resolutions
+        self.conn._rollup_resolutions = []
+        try:
+            expected = list(self.conn.get_meter_statistics(
+                sample_filter, period=period, groupby=groupby,
+                aggregate=aggregate))
+        finally:
+            self.conn._rollup_resolutions = resolutions
+
+        def key(r):
+            return r.period_start, sorted((r.groupby or {}).items())
+        self.assertEqual([r.as_dict() for r in sorted(expected, key=key)],
+                         [r.as_dict() for r in sorted(results, key=key)])
+        return results
+
+    def test_statistics_from_rollups(self):
+        self._record(self._samples())
+        end = self.start + datetime.timedelta(hours=3)
+        f = storage.SampleFilter(meter='meter-a', start_timestamp=self.start,
+                                 end_timestamp=end)
+        results = self._compare(3600, f)
+        self.assertEqual(26, results[0].count)
+        self._compare(3600, f, period=7200, groupby=['user_id'])
+        self._compare(300, f, period=600, groupby=['resource_id'])
+        self._compare(60, f, period=420)
+        self._compare(3600, f, aggregate=[
+            mock.Mock(func='cardinality', param='resource_id'),
+            mock.Mock(func='avg', param=None)])
+        self._compare(300, storage.SampleFilter(
+            meter='meter-a', user='user-1',
+            start_timestamp=self.start + datetime.timedelta(minutes=5),
+            end_timestamp=end))
+
+    def test_statistics_from_samples(self):
+        self._record(self._samples())
+        f = storage.SampleFilter(
+            meter='meter-a',
+            start_timestamp=self.start + datetime.timedelta(seconds=1),
+            end_timestamp=self.start + datetime.timedelta(hours=1))
+        self._compare(None, f)
+        f = storage.SampleFilter(meter='meter-a', start_timestamp=self.start)
+        self._compare(None, f, period=90)
+        self._compare(None, storage.SampleFilter(meter='meter-a'),
+                      period=3600)
+
+    def test_fill_on_upgrade(self):
+        self._record(self._samples())
+        session = self.conn._engine_facade.get_session()
+        expected = sorted(
+            (r.resolution, r.meter_id, r.resource_id, r.period_start,
+             r.count, r.sum, r.min, r.max, r.first_timestamp,
+             r.last_timestamp)
+            for r in session.query(sql_models.SampleRollup))
+        session.query(sql_models.SampleRollup).filter(
+            sql_models.SampleRollup.resolution != 300).delete()
+        self.conn.upgrade()
+        self.conn.upgrade()
+        filled = sorted(
+            (r.resolution, r.meter_id, r.resource_id, r.period_start,
+             r.count, r.sum, r.min, r.max, r.first_timestamp,
+             r.last_timestamp)
+            for r in session.query(sql_models.SampleRollup))
+        self.assertEqual(expected, filled)
+
+        self.conn._rollup_resolutions = [60]
+        self.conn.upgrade()
+        self.assertEqual(
+            set([60]), set(r for r, in session.query(
+                sql_models.SampleRollup.resolution).distinct()))
+
+    @mock.patch.object(impl_sqlalchemy, 'ROLLUP_FILL_SIZE', 10)
+    def test_fill_by_chunks(self):
+        self._record(self._samples())
+        session = self.conn._engine_facade.get_session()
+        rollups = sql_models.SampleRollup
+        total = session.query(sa.func.sum(rollups.count)).filter(
+            rollups.resolution == 60)
+        expected = total.scalar()
+        session.query(rollups).filter(rollups.resolution == 60).delete()
+
+        update = self.conn._update_rollups
+        calls = []
+
+        def fail_second_chunk(conn, rows):
+            calls.append(rows)
+            if len(calls) > 1:
+                raise RuntimeError('boom')
+            update(conn, rows)
+
+        with mock.patch.object(self.conn, '_update_rollups',
+                               side_effect=fail_second_chunk):
+            self.assertRaises(RuntimeError, self.conn.upgrade)
+        # NOTE: the rollups of the committed chunk are removed, so that the
+        # resolution is filled again by the next upgrade
+        self.assertEqual(0, session.query(rollups).filter(
+            rollups.resolution == 60).count())
+        self.conn.upgrade()
+        self.assertEqual(expected, total.scalar())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expire_rollups(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 17)
+        samples = self._samples(10)
+        samples[-1]['resource_id'] = 'resource-new'
+        self._record(samples)
+        # NOTE: only the last sample, at 16:03:09, is kept
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 17, 3, 9)
+        self.conn.clear_expired_metering_data(3600)
+
+        session = self.conn._engine_facade.get_session()
+        rows = session.query(sql_models.SampleRollup).all()
+        self.assertEqual(set([(60, 1), (300, 1), (3600, 1)]),
+                         set((r.resolution, r.count) for r in rows))
+        resource_ids = set(i for i, in session.query(
+            sql_models.Resource.internal_id))
+        self.assertEqual(resource_ids, set(r.resource_id for r in rows))
+
+        self.CONF.set_override('sql_expire_samples_only', True,
+                               group='database')
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 17, 30)
+        self.conn.clear_expired_metering_data(3600)
+        # NOTE: the hourly rollup straddling the expiry time is rebuilt
+        # without the expired sample
+        self.assertEqual([], session.query(sql_models.SampleRollup).all())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expire_straddling_rollups(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 18)
+        self._record(self._samples())
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 1, 17, 30)
+        self.conn.clear_expired_metering_data(3600)
+        results = self._compare(3600, storage.SampleFilter(meter='meter-a'))
+        # NOTE: the samples from 16:31:13 on are kept
+        self.assertEqual(26 - 13, results[0].count)
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class ResourceListingTest(tests_db.TestBase):
+
+    def setUp(self):
+        super(ResourceListingTest, self).setUp()
+        samples = []
+        for i in range(10):
+            for minute in range(3):
+                s = _make_sample('meter-a', 'resource-%d' % i,
+                                 {'key': 'v%d' % minute}, minute)
+                s['user_id'] = 'user-%d' % (minute % 2)
+                samples.append(s)
+        self.conn.record_metering_data_batch(samples)
+
+    def _count_statements(self, func, *args, **kwargs):
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            # NOTE: ignore the connection liveness checks of oslo.db
+            if statement != 'SELECT 1':
+                statements.append(statement)
+
+        engine = self.conn._engine_facade.get_engine()
+        sa.event.listen(engine, 'before_cursor_execute', before_execute)
+        try:
+            return func(*args, **kwargs), len(statements)
+        finally:
+            sa.event.remove(engine, 'before_cursor_execute', before_execute)
+
+    def test_single_query(self):
+        resources, count = self._count_statements(
+            lambda: list(self.conn.get_resources()))
+        self.assertEqual(1, count)
+        self.assertEqual(10, len(resources))
+        for r in resources:
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 0),
+                             r.first_sample_timestamp)
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 2),
+                             r.last_sample_timestamp)
+            self.assertEqual({'key': 'v2'}, r.metadata)
+
+    def test_filtered_latest_sample(self):
+        resources = list(self.conn.get_resources(user='user-1'))
+        self.assertEqual(10, len(resources))
+        for r in resources:
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 1),
+                             r.first_sample_timestamp)
+            self.assertEqual(datetime.datetime(2016, 6, 1, 15, 1),
+                             r.last_sample_timestamp)
+            self.assertEqual({'key': 'v1'}, r.metadata)
+        self.assertEqual(3, len(list(self.conn.get_resources(limit=3))))
+
+    def test_resource_summary(self):
+        expected = sorted((r.as_dict() for r in self.conn.get_resources()),
+                          key=lambda r: r['resource_id'])
+        self.CONF.set_override('sql_resource_summary', True,
+                               group='database')
+        with mock.patch.object(impl_sqlalchemy, 'RESOURCE_SUMMARY_DIALECTS',
+                               ('sqlite', 'mysql', 'postgresql')):
+            self.conn._refresh_resource_summary()
+            session = self.conn._engine_facade.get_session()
+            self.assertEqual(
+                10, session.query(sql_models.ResourceSummary).count())
+            with mock.patch.object(impl_sqlalchemy.Connection,
+                                   '_latest_samples_query') as latest:
+                results = sorted(
+                    (r.as_dict() for r in self.conn.get_resources()),
+                    key=lambda r: r['resource_id'])
+                self.assertEqual(
+                    [expected[4]],
+                    [r.as_dict() for r in self.conn.get_resources(
+                        resource='resource-4')])
+            self.assertFalse(latest.called)
+        self.assertEqual(expected, results)
+
+    def test_summary_rows(self):
+        t = datetime.datetime(2016, 6, 1)
+        minute = datetime.timedelta(minutes=1)
+        rows = impl_sqlalchemy.Connection._summary_rows([
+            ('a', t + minute, 1), ('a', t, 2), ('b', t, 3),
+            ('a', t + minute, 4)])
+        self.assertEqual(
+            [dict(resource_id='a', first_sample_timestamp=t,
+                  last_sample_timestamp=t + minute, last_internal_id=4),
+             dict(resource_id='b', first_sample_timestamp=t,
+                  last_sample_timestamp=t, last_internal_id=3)],
+            sorted(rows, key=lambda r: r['resource_id']))
+
+
+@tests_db.run_with('mysql', 'pgsql')
+class ResourceSummaryTest(tests_db.TestBase):
+
+    def test_summary_maintained_at_insert(self):
+        self.CONF.set_override('sql_resource_summary', True,
+                               group='database')
+        self.conn.record_metering_data_batch([
+            _make_sample('meter-a', 'resource-1', {'key': 'v2'}, 2),
+            _make_sample('meter-a', 'resource-2', {'key': 'v1'}, 1)])
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-1', {'key': 'v1'}, 1))
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-2', {'key': 'v3'}, 3))
+        results = sorted((r.as_dict() for r in self.conn.get_resources()),
+                         key=lambda r: r['resource_id'])
+        self.CONF.set_override('sql_resource_summary', False,
+                               group='database')
+        expected = sorted((r.as_dict() for r in self.conn.get_resources()),
+                          key=lambda r: r['resource_id'])
+        self.assertEqual(expected, results)
+        self.assertEqual([{'key': 'v2'}, {'key': 'v3'}],
+                         [r['metadata'] for r in results])
+
+
+@tests_db.run_with('mysql', 'pgsql')
+class ConcurrentBatchRecordingTest(tests_db.TestBase):
+
+    def test_batch_with_concurrently_created_meter(self):
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-1', {}, 0))
+        samples = [_make_sample('meter-a', 'resource-1', {}, 1),
+                   _make_sample('meter-b', 'resource-1', {}, 2)]
+        # NOTE: hide the existing meter from the first lookup as if it was
+        # created by another writer after it.
+        with mock.patch.object(impl_sqlalchemy.Connection, '_select_meters',
+                               side_effect=[{}, {}]):
+            with mock.patch.object(
+                    impl_sqlalchemy.Connection, '_create_meter',
+                    wraps=impl_sqlalchemy.Connection._create_meter) as create:
+                self.conn.record_metering_data_batch(samples)
+        self.assertEqual(2, create.call_count)
+
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(3, session.query(sql_models.Sample).count())
+        self.assertEqual(2, session.query(sql_models.Meter).count())
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class JsonMetadataTest(tests_db.TestBase):
+
+    METADATA = [
+        {'instance_type': 'm1.tiny', 'size': 1, 'ratio': 0.5, 'up': True,
+         'image': {'name': 'cirros'}, 'display.name': 'vm-0'},
+        {'instance_type': 'm1.small', 'size': 2, 'ratio': 1.5, 'up': False,
+         'image': {'name': 'fedora'}, 'tags': ['web', 'db']},
+        {'instance_type': 'm1.small', 'size': 3, 'ratio': 2.5, 'up': True,
+         'image': {'name': 'cirros'}},
+    ]
+
+    def setUp(self):
+        super(JsonMetadataTest, self).setUp()
+        self.CONF.set_override('sql_metadata_store', 'json',
+                               group='database')
+        self.CONF.set_override('sql_metadata_indexed_keys',
+                               ['instance_type', 'image.name'],
+                               group='database')
+        self.conn.upgrade()
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-0', self.METADATA[0], 0))
+        self.conn.record_metering_data_batch([
+            _make_sample('meter-a', 'resource-%d' % i, metadata, i)
+            for i, metadata in enumerate(self.METADATA[1:], 1)])
+
+    def _resource_ids(self, **metaquery):
+        return sorted(r.resource_id for r in self.conn.get_resources(
+            metaquery=dict(('metadata.%s' % k, v)
+                           for k, v in metaquery.items())))
+
+    def test_no_metadata_rows(self):
+        session = self.conn._engine_facade.get_session()
+        for table in (sql_models.MetaText, sql_models.MetaBigInt,
+                      sql_models.MetaFloat, sql_models.MetaBool):
+            self.assertEqual(0, session.query(table).count())
+
+    def test_metaquery(self):
+        self.assertEqual(['resource-1', 'resource-2'],
+                         self._resource_ids(instance_type='m1.small'))
+        self.assertEqual(['resource-2'], self._resource_ids(
+            **{'instance_type': 'm1.small', 'image.name': 'cirros'}))
+        self.assertEqual(['resource-0'],
+                         self._resource_ids(**{'display.name': 'vm-0'}))
+        self.assertEqual(['resource-1'],
+                         self._resource_ids(**{'tags[1]': 'db'}))
+        self.assertEqual(['resource-2'], self._resource_ids(size=3))
+        self.assertEqual(['resource-1'], self._resource_ids(ratio=1.5))
+        self.assertEqual(['resource-0', 'resource-2'],
+                         self._resource_ids(up=True))
+        self.assertEqual([], self._resource_ids(size='3'))
+        self.assertEqual([], self._resource_ids(missing='m1.small'))
+
+        f = storage.SampleFilter(meter='meter-a', metaquery={
+            'metadata.image.name': 'cirros'})
+        self.assertEqual(2, len(list(self.conn.get_samples(f))))
+        self.assertEqual(1, len(list(self.conn.get_meters(
+            metaquery={'metadata.image.name': 'fedora'}))))
+
+    def test_complex_query(self):
+        results = self.conn.query_samples(filter_expr={"and": [
+            {">": {"resource_metadata.size": 1}},
+            {"not": {"=": {"resource_metadata.up": False}}},
+            {"=~": {"resource_metadata.image.name": "cir.*"}}]})
+        self.assertEqual(['resource-2'],
+                         [s.resource_id for s in results])
+        results = self.conn.query_samples(filter_expr={"or": [
+            {"=": {"resource_metadata.display.name": "vm-0"}},
+            {"<=": {"resource_metadata.missing": 0.41}}]})
+        self.assertEqual(['resource-0'],
+                         [s.resource_id for s in results])
+
+    def test_group_by_instance_type(self):
+        results = self.conn.get_meter_statistics(
+            storage.SampleFilter(meter='meter-a'),
+            groupby=['resource_metadata.instance_type'])
+        self.assertEqual(
+            {'m1.tiny': 1, 'm1.small': 2},
+            dict((r.groupby['resource_metadata.instance_type'], r.count)
+                 for r in results))
+
+    def test_fill_existing_resources(self):
+        self.CONF.set_override('sql_metadata_store', 'eav',
+                               group='database')
+        self.conn.record_metering_data(
+            _make_sample('meter-a', 'resource-3', {'instance_type': 'm1.xl'},
+                         3))
+        self.CONF.set_override('sql_metadata_store', 'json',
+                               group='database')
+        self.assertEqual([], self._resource_ids(instance_type='m1.xl'))
+        self.conn.upgrade()
+        self.assertEqual(['resource-3'],
+                         self._resource_ids(instance_type='m1.xl'))
+
+    def test_indexes(self):
+        engine = self.conn._engine_facade.get_engine()
+        self.assertEqual(
+            set(json_metadata.index_name(k)
+                for k in ('instance_type', 'image.name')),
+            json_metadata.list_indexes(engine))
+        self.CONF.set_override('sql_metadata_indexed_keys', ['size'],
+                               group='database')
+        self.conn.upgrade()
+        self.assertEqual(set([json_metadata.index_name('size')]),
+                         json_metadata.list_indexes(engine))
+        self.assertEqual(['resource-1'], self._resource_ids(size=2))
+
+    @tests_db.run_with('sqlite')
+    def test_index_used(self):
+        resource = sql_models.Resource
+        session = self.conn._engine_facade.get_session()
+        query = impl_sqlalchemy.apply_metaquery_filter(
+            session, session.query(resource.internal_id),
+            {'metadata.image.name': 'cirros'}, flat_metadata=True)
+        statement = query.statement.compile(
+            dialect=session.bind.dialect,
+            compile_kwargs={'literal_binds': True})
+        plan = session.execute('EXPLAIN QUERY PLAN %s' % statement).fetchall()
+        self.assertIn(json_metadata.index_name('image.name'),
+                      ' '.join(str(row[-1]) for row in plan))
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
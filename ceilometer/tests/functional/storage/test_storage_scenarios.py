@@ -139,6 +139,19 @@ class ResourceTest(DBTestBase):
             source='test-4'
         ))
 
+    def test_get_resources_by_marker(self):
+        expected = [r.resource_id for r in self.conn.get_resources()]
+        marker = None
+        pages = []
+        while True:
+            results = list(self.conn.get_resources(limit=4, marker=marker))
+            pages.append([r.resource_id for r in results])
+            if len(results) < 4:
+                break
+            marker = results[-1].resource_id
+        self.assertEqual(expected, sum(pages, []))
+        self.assertEqual([4, 4, 2], [len(page) for page in pages])
+
     def test_get_resources(self):
         expected_first_sample_timestamp = datetime.datetime(2012, 7, 2, 10, 39)
         expected_last_sample_timestamp = datetime.datetime(2012, 7, 2, 10, 40)
@@ -395,6 +408,22 @@ class RawSampleTest(DBTestBase):
             source='test-4'
         ))
 
+    def test_get_samples_by_marker(self):
+        f = storage.SampleFilter()
+        expected = [s.message_id for s in self.conn.get_samples(f)]
+        pages = []
+        while True:
+            results = list(self.conn.get_samples(f, limit=3))
+            pages.append([s.message_id for s in results])
+            if len(results) < 3:
+                break
+            last = results[-1]
+            f = storage.SampleFilter(marker=(last.timestamp, last.message_id,
+                                             last.counter_name))
+        self.assertEqual(expected, sum(pages, []))
+        self.assertEqual([3] * (len(expected) // 3) + [len(expected) % 3],
+                         [len(page) for page in pages])
+
     def test_get_sample_counter_volume(self):
         # NOTE(idegtiarov) Because wsme expected a float type of data this test
         # checks type of counter_volume received from database.
@@ -978,6 +1007,26 @@ class ComplexSampleQueryTest(DBTestBase):
             self.assertEqual("meta-value0.81",
                              sample_item.resource_metadata["a_string_key"])
 
+    def test_query_compiled_filter_reused(self):
+        self._create_samples()
+
+        def query(value):
+            filter_expr = {
+                "or": [{"=": {"resource_metadata.a_string_key": value}},
+                       {"not": {">": {"resource_metadata.key_not_exists":
+                                      0.41}}}]}
+            results = list(self.conn.query_samples(filter_expr=filter_expr))
+            self.assertEqual(
+                {"or": [{"=": {"resource_metadata.a_string_key": value}},
+                        {"not": {">": {"resource_metadata.key_not_exists":
+                                       0.41}}}]}, filter_expr)
+            return sorted(s.message_id for s in results)
+
+        first = query("meta-value0.81")
+        self.assertEqual(3, len(first))
+        self.assertEqual(first, query("meta-value0.81"))
+        self.assertEqual(0, len(query("no-such-value")))
+
     def test_query_non_existing_metadata_without_result(self):
         self._create_samples()
 
@@ -2803,3 +2852,29 @@ class TestBatchRecordingMetering(tests_db.TestBase):
         self.assertEqual({'fake_meta': 8}, resources[1].metadata)
         self.assertEqual('resource-1', resources[2].resource_id)
         self.assertEqual({'fake_meta': 7}, resources[2].metadata)
+
+    def test_batch_recording_out_of_order(self):
+        def make_sample(minute, meta):
+            s = sample.Sample(name='sample', type=sample.TYPE_GAUGE,
+                              unit='', volume=minute, user_id='user-id',
+                              project_id='project-id',
+                              resource_id='resource-id',
+                              timestamp=datetime.datetime(2016, 6, 1, 15,
+                                                          minute),
+                              resource_metadata={'fake_meta': meta},
+                              source=None)
+            return utils.meter_message_from_counter(
+                s, self.CONF.publisher.telemetry_secret)
+
+        self.conn.record_metering_data_batch([make_sample(20, 'b'),
+                                              make_sample(30, 'c')])
+        self.conn.record_metering_data_batch([make_sample(10, 'a'),
+                                              make_sample(25, 'd')])
+        resource = next(self.conn.get_resources())
+        self.assertEqual({'fake_meta': 'c'}, resource.metadata)
+        self.assertEqual(datetime.datetime(2016, 6, 1, 15, 10),
+                         resource.first_sample_timestamp)
+        self.assertEqual(datetime.datetime(2016, 6, 1, 15, 30),
+                         resource.last_sample_timestamp)
+        self.assertEqual(4, len(list(self.conn.get_samples(
+            storage.SampleFilter()))))
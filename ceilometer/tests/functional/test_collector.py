@@ -14,6 +14,7 @@
 # under the License.
 
 import socket
+import time
 
 import fixtures
 import mock
@@ -135,7 +136,7 @@ class TestCollector(tests_base.BaseTestCase):
 
         self._verify_udp_socket(udp_socket)
         mock_record = self.mock_dispatcher.record_metering_data
-        mock_record.assert_called_once_with(self.sample)
+        mock_record.assert_called_once_with([self.sample])
 
     def test_udp_socket_ipv6(self):
         self._setup_messaging(False)
@@ -167,7 +168,7 @@ class TestCollector(tests_base.BaseTestCase):
 
         self._verify_udp_socket(udp_socket)
 
-        mock_record.assert_called_once_with(self.sample)
+        mock_record.assert_called_once_with([self.sample])
 
     @staticmethod
     def _raise_error(*args, **kwargs):
@@ -216,9 +217,49 @@ class TestCollector(tests_base.BaseTestCase):
                 self.srv.udp_thread.join(5)
                 self.assertFalse(self.srv.udp_thread.is_alive())
                 self.assertTrue(utils.verify_signature(
-                    self.mock_dispatcher.method_calls[0][1][0],
+                    self.mock_dispatcher.method_calls[0][1][0][0],
                     "not-so-secret"))
 
+    def test_udp_receive_counters(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_receivers', 2, group='collector')
+        bad_sample = dict(self.sample, message_signature='bad')
+        pending = {}
+
+        def _make_socket(data):
+            def recvfrom(size):
+                del pending[sock]
+                if not pending:
+                    self.srv.udp_run = False
+                return msgpack.dumps(data), ('127.0.0.1', 12345)
+
+            sock = mock.Mock()
+            sock.recvfrom = recvfrom
+            pending[sock] = True
+            return sock
+
+        def _select(rlist, wlist, xlist, timeout):
+            ready = [sock for sock in rlist if sock in pending]
+            if not ready:
+                time.sleep(0.01)
+            return ready, [], []
+
+        socks = [_make_socket(self.sample), _make_socket(bad_sample)]
+        with mock.patch('select.select', side_effect=_select):
+            with mock.patch('socket.socket', side_effect=socks):
+                self.srv.run()
+                self.addCleanup(self.srv.terminate)
+                self.srv.udp_thread.join(5)
+                self.assertFalse(self.srv.udp_thread.is_alive())
+
+        for sock in socks:
+            self._verify_udp_socket(sock)
+        mock_record = self.mock_dispatcher.record_metering_data
+        mock_record.assert_called_once_with([self.sample])
+        self.assertEqual({'received': 2, 'decoded': 2,
+                          'invalid_signature': 1, 'dispatched': 1,
+                          'dropped': 0}, self.srv.udp_stats.snapshot())
+
     def _test_collector_requeue(self, listener, batch_listener=False):
 
         self.srv.dispatcher_manager = dispatcher.load_dispatcher_manager()
@@ -70,6 +70,10 @@ class MockHBaseTable(happybase.Table):
         row = self.data_prefix + row
         return super(MockHBaseTable, self).row(row, *args, **kwargs)
 
+    def batch(self, timestamp=None, batch_size=None, transaction=False,
+              wal=True):
+        return MockHBaseBatch(self, timestamp, batch_size, transaction, wal)
+
     def delete(self, row, *args, **kwargs):
         row = self.data_prefix + row
         return super(MockHBaseTable, self).delete(row, *args, **kwargs)
@@ -79,3 +83,14 @@ class MockHBaseTable(happybase.Table):
             return "PrefixFilter(%s) AND %s" % (self.data_prefix, filter)
         else:
             return "PrefixFilter(%s)" % self.data_prefix
+
+
+class MockHBaseBatch(happybase.Batch):
+
+    def put(self, row, *args, **kwargs):
+        row = self._table.data_prefix + row
+        return super(MockHBaseBatch, self).put(row, *args, **kwargs)
+
+    def delete(self, row, *args, **kwargs):
+        row = self._table.data_prefix + row
+        return super(MockHBaseBatch, self).delete(row, *args, **kwargs)
@@ -0,0 +1,105 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+import mock
+from oslo_utils import timeutils
+import testtools
+
+from ceilometer.api import cache
+from ceilometer import service
+from ceilometer import storage
+from ceilometer.tests import base
+
+
+class TestQueryCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestQueryCache, self).setUp()
+        self.CONF = service.prepare_service([], [])
+        self.compute = mock.Mock(side_effect=lambda: [self.compute.call_count])
+
+    def _cache(self, backend):
+        self.CONF.set_override('query_cache_backend', backend, group='api')
+        return cache.QueryCache(self.CONF)
+
+    def test_key(self):
+        f = storage.SampleFilter(meter='cpu', project='p1',
+                                 start_timestamp='2016-06-01T00:00:00',
+                                 metaquery={'metadata.a': 1})
+        key = cache.QueryCache.key('statistics', vars(f), 60,
+                                   (None, 'p1'))
+        self.assertTrue(key.startswith('ceilometer-api-statistics-'))
+        self.assertEqual(key, cache.QueryCache.key(
+            'statistics', vars(storage.SampleFilter(
+                meter='cpu', project='p1', metaquery={'metadata.a': 1},
+                start_timestamp=datetime.datetime(2016, 6, 1))),
+            60, (None, 'p1')))
+        self.assertNotEqual(key, cache.QueryCache.key(
+            'statistics', vars(f), 60, (None, 'p2')))
+        self.assertNotEqual(key, cache.QueryCache.key(
+            'meters', vars(f), 60, (None, 'p1')))
+
+    def test_disabled(self):
+        query_cache = self._cache('none')
+        self.assertEqual([1], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+        self.assertEqual([2], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+
+    @mock.patch('time.time')
+    def test_memory(self, mock_time):
+        mock_time.return_value = 1000
+        query_cache = self._cache('memory')
+        self.assertEqual([1], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+        mock_time.return_value = 1029
+        self.assertEqual([1], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+        self.assertEqual([2], query_cache.get_or_compute('other', 30,
+                                                         self.compute))
+        mock_time.return_value = 1030
+        self.assertEqual([3], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+
+    def test_memory_lru(self):
+        self.CONF.set_override('query_cache_size', 1, group='api')
+        query_cache = self._cache('memory')
+        query_cache.get_or_compute('k', 30, self.compute)
+        query_cache.get_or_compute('other', 30, self.compute)
+        self.assertEqual([3], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+
+    @testtools.skipIf(cache.oslo_cache is None, 'oslo.cache not installed')
+    def test_oslo_cache(self):
+        cache.oslo_cache.configure(self.CONF)
+        self.CONF.set_override('enabled', True, group='cache')
+        self.CONF.set_override('backend', 'dogpile.cache.memory',
+                               group='cache')
+        query_cache = self._cache('oslo.cache')
+        self.assertEqual([1], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+        self.assertEqual([1], query_cache.get_or_compute('k', 30,
+                                                         self.compute))
+        self.assertEqual(1, self.compute.call_count)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_statistics_ttl(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2016, 6, 2)
+        query_cache = self._cache('memory')
+        self.assertEqual(3600, query_cache.statistics_ttl(
+            storage.SampleFilter(end_timestamp='2016-06-01T00:00:00')))
+        self.assertEqual(30, query_cache.statistics_ttl(
+            storage.SampleFilter(end_timestamp='2016-06-03T00:00:00')))
+        self.assertEqual(30, query_cache.statistics_ttl(
+            storage.SampleFilter()))
@@ -104,6 +104,25 @@ class TestComplexQuery(base.BaseTestCase):
         self.assertEqual("or", list(filter_expr.keys())[0])
         self.assertEqual("and", list(filter_expr["or"][1].keys())[0])
 
+    def test_normalize_filter(self):
+        filter_expr = {"AND": [{"=": {"timestamp": "2013-12-05T19:38:29Z"}},
+                               {"Not": {"=": {"project": "p1"}}},
+                               {"=": {"metadata.a": 1}}]}
+        self.query._normalize_filter(filter_expr, None, "project_id")
+        self.assertEqual(
+            {"and": [{"=": {"timestamp": datetime.datetime(2013, 12, 5,
+                                                           19, 38, 29)}},
+                     {"not": {"=": {"project_id": "p1"}}},
+                     {"=": {"resource_metadata.a": 1}}]},
+            filter_expr)
+
+    def test_normalize_filter_other_project(self):
+        filter_expr = {"or": [{"=": {"project": "p1"}},
+                              {"=": {"project": "p2"}}]}
+        self.assertRaises(wsme.exc.ClientSideError,
+                          self.query._normalize_filter,
+                          filter_expr, "p1", "project_id")
+
     def test_invalid_filter_misstyped_field_name_samples(self):
         filter = {"=": {"project_id11": 42}}
         self.assertRaises(jsonschema.ValidationError,
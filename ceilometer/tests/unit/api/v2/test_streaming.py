@@ -0,0 +1,84 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+import mock
+from oslotest import base
+import wsme.rest.json
+from wsme import types as wtypes
+
+from ceilometer.api.controllers.v2 import base as v2_base
+from ceilometer.api.controllers.v2 import meters
+from ceilometer.api.controllers.v2 import resources
+from ceilometer.api.controllers.v2 import samples
+from ceilometer.api.controllers.v2 import streaming
+
+
+class TestStreaming(base.BaseTestCase):
+
+    def _assert_encoding(self, items, datatype):
+        self.assertEqual(
+            wsme.rest.json.encode_result(items, wtypes.ArrayType(datatype)),
+            b''.join(streaming.encode(iter(items), datatype)).decode('utf-8'))
+
+    def test_encode_sample(self):
+        items = [samples.Sample.sample() for i in range(3)]
+        items[1].metadata = {u'name': u'caf\xe9'}
+        items[2].recorded_at = None
+        self._assert_encoding(items, samples.Sample)
+
+    def test_encode_old_sample(self):
+        items = [meters.OldSample.sample(),
+                 meters.OldSample(counter_name='cpu', counter_type='delta',
+                                  counter_unit='ns', counter_volume=2,
+                                  resource_id='r',
+                                  timestamp='2015-01-01T12:00:00')]
+        self._assert_encoding(items, meters.OldSample)
+
+    def test_encode_resource(self):
+        self._assert_encoding([resources.Resource.sample()],
+                              resources.Resource)
+
+    def test_encode_chunks(self):
+        items = [v2_base.Link(href='http://localhost/%d' % i, rel='self')
+                 for i in range(streaming.CHUNK_SIZE * 2 + 1)]
+        chunks = list(streaming.encode(iter(items), v2_base.Link))
+        self.assertEqual(4, len(chunks))
+        self._assert_encoding(items, v2_base.Link)
+
+    def test_encode_empty(self):
+        self.assertEqual([b'[]'], list(streaming.encode(iter([]),
+                                                        v2_base.Link)))
+
+    def test_converter(self):
+        convert = streaming.converter(samples.Sample)
+        self.assertIs(convert, streaming.converter(samples.Sample))
+        self.assertEqual(
+            {'meter': 'cpu',
+             'timestamp': '2015-01-01T12:00:00'},
+            convert(samples.Sample(
+                meter='cpu', timestamp=datetime.datetime(2015, 1, 1, 12))))
+
+    @mock.patch.dict(streaming._converters, clear=True)
+    def test_converter_published_complete(self):
+        list_attributes = wtypes.list_attributes
+
+        def check_unpublished(datatype):
+            self.assertNotIn(datatype, streaming._converters)
+            return list_attributes(datatype)
+
+        with mock.patch.object(streaming.wtypes, 'list_attributes',
+                               side_effect=check_unpublished):
+            convert = streaming.converter(resources.Resource)
+        self.assertIs(convert, streaming._converters[resources.Resource])
+        self.assertIn(v2_base.Link, streaming._converters)
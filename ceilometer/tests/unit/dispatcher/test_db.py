@@ -40,10 +40,10 @@ class TestDispatcherDB(base.BaseTestCase):
         )
 
         with mock.patch.object(self.meter_dispatcher.conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.meter_dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(msg)
+        record_batch.assert_called_once_with([msg])
 
     def test_timestamp_conversion(self):
         msg = {'counter_name': 'test',
@@ -59,10 +59,10 @@ class TestDispatcherDB(base.BaseTestCase):
         expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
 
         with mock.patch.object(self.meter_dispatcher.conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.meter_dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
 
     def test_timestamp_tzinfo_conversion(self):
         msg = {'counter_name': 'test',
@@ -79,7 +79,7 @@ class TestDispatcherDB(base.BaseTestCase):
                                                   31, 50, 262000)
 
         with mock.patch.object(self.meter_dispatcher.conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.meter_dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
@@ -478,6 +478,83 @@ class DispatcherTest(base.BaseTestCase):
         d.record_metering_data(samples)
         self.assertEqual(0, len(fake_batch.call_args[0][1]))
 
+    @mock.patch('gnocchiclient.v1.client.Client')
+    def test_resource_definition_memoized(self, fakeclient_cls):
+        self.conf.config(filter_service_activity=False,
+                         group='dispatcher_gnocchi')
+        d = gnocchi.GnocchiDispatcher(self.conf.conf)
+        with mock.patch.object(gnocchi.ResourcesDefinition, 'metric_match',
+                               return_value=True) as match:
+            rd = d._get_resource_definition_from_metric('disk.root.size')
+            self.assertEqual(1, match.call_count)
+            self.assertIs(rd, d._get_resource_definition_from_metric(
+                'disk.root.size'))
+            self.assertEqual(1, match.call_count)
+        self.assertIsNone(d._get_resource_definition_from_metric('unknown'))
+        self.assertIn('unknown', d._metric_definitions)
+
+    @mock.patch('gnocchiclient.v1.client.Client')
+    def test_attributes_from_last_sample(self, fakeclient_cls):
+        self.conf.config(filter_service_activity=False,
+                         group='dispatcher_gnocchi')
+        self.samples[1]['resource_metadata']['display_name'] = 'renamed'
+        d = gnocchi.GnocchiDispatcher(self.conf.conf)
+        with mock.patch.object(gnocchi.ResourcesDefinition,
+                               'sample_attributes',
+                               autospec=True,
+                               return_value={'display_name': 'renamed'}
+                               ) as attributes:
+            d.record_metering_data(list(self.samples))
+        attributes.assert_called_once_with(mock.ANY, self.samples[1])
+        fakeclient = fakeclient_cls.return_value
+        batch = fakeclient.metric.batch_resources_metrics_measures
+        batch.assert_called_once_with(
+            {self.resource_id: {'disk.root.size': [
+                {'timestamp': s['timestamp'], 'value': s['counter_volume']}
+                for s in self.samples]}}, create_metrics=True)
+        fakeclient.resource.update.assert_called_once_with(
+            'instance', self.resource_id, {'display_name': 'renamed'})
+
+    @mock.patch('gnocchiclient.v1.client.Client')
+    def test_batch_split(self, fakeclient_cls):
+        self.conf.config(filter_service_activity=False,
+                         batch_max_measures=2,
+                         group='dispatcher_gnocchi')
+        samples = []
+        for i in range(5):
+            sample = dict(self.samples[0], resource_id='resource-%d' % i)
+            samples.extend([sample, dict(sample)])
+        d = gnocchi.GnocchiDispatcher(self.conf.conf)
+        d.record_metering_data(samples)
+        batch = fakeclient_cls.return_value.metric.\
+            batch_resources_metrics_measures
+        self.assertEqual(5, batch.call_count)
+        posted = {}
+        for call in batch.call_args_list:
+            self.assertEqual(1, len(call[0][0]))
+            posted.update(call[0][0])
+        self.assertEqual(set('resource-%d' % i for i in range(5)),
+                         set(posted))
+        for metrics in posted.values():
+            self.assertEqual(2, len(metrics['disk.root.size']))
+
+    def test_split_measures(self):
+        self.conf.config(batch_max_measures=3, group='dispatcher_gnocchi')
+        with mock.patch('gnocchiclient.v1.client.Client'):
+            d = gnocchi.GnocchiDispatcher(self.conf.conf)
+        measures = {'a': {'m1': [1, 2], 'm2': [3]},
+                    'b': {'m1': [1]},
+                    'c': {'m1': [1, 2]},
+                    'd': {'m1': [1, 2, 3, 4]}}
+        chunks = d._split_measures(measures)
+        self.assertEqual(sorted(measures),
+                         sorted(r for c in chunks for r in c))
+        for chunk in chunks:
+            size = sum(len(m) for ms in chunk.values() for m in ms.values())
+            self.assertTrue(size <= 3 or len(chunk) == 1)
+        self.conf.config(batch_max_measures=0, group='dispatcher_gnocchi')
+        self.assertEqual([measures], d._split_measures(measures))
+
 
 class MockResponse(mock.NonCallableMock):
     def __init__(self, code):
@@ -17,6 +17,7 @@
 import abc
 import copy
 import datetime
+import threading
 import traceback
 import unittest
 
@@ -698,6 +699,45 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(new_publisher.samples[0], 'name'))
 
+    def test_multiple_publisher_concurrent(self):
+        self._set_pipeline_cfg('publishers', ['test://', 'new://'])
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF,
+            self.cfg2file(self.pipeline_cfg), self.transformer_manager)
+        first, second = pipeline_manager.pipelines[0].publishers
+        started = threading.Event()
+        overlapped = []
+
+        def wait_for_second(samples):
+            overlapped.append(started.wait(5))
+
+        def signal_first(samples):
+            started.set()
+
+        first.publish_samples = wait_for_second
+        second.publish_samples = signal_first
+        with pipeline_manager.publisher() as p:
+            p([self.test_counter])
+        self.assertEqual([True], overlapped)
+
+    def test_multiple_publisher_stats(self):
+        self._set_pipeline_cfg('publishers', ['except://', 'new://'])
+        self.CONF.set_override('multi_publish_workers', 0)
+        pipeline_manager = pipeline.PipelineManager(
+            self.CONF,
+            self.cfg2file(self.pipeline_cfg), self.transformer_manager)
+        with pipeline_manager.publisher() as p:
+            p([self.test_counter])
+            p([self.test_counter])
+
+        sink = pipeline_manager.pipelines[0].sink
+        failing, working = sink.publishers
+        self.assertEqual(2, len(working.samples))
+        self.assertEqual(2, sink.publisher_stats[str(failing)]['calls'])
+        self.assertEqual(2, sink.publisher_stats[str(failing)]['errors'])
+        self.assertEqual(2, sink.publisher_stats[str(working)]['calls'])
+        self.assertEqual(0, sink.publisher_stats[str(working)]['errors'])
+
     def test_multiple_counter_pipeline(self):
         self._set_pipeline_cfg('meters', ['a', 'b'])
         pipeline_manager = pipeline.PipelineManager(
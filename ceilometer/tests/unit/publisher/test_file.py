@@ -16,10 +16,16 @@
 """
 
 import datetime
+import gzip
+import json
 import logging.handlers
 import os
+import socket
 import tempfile
+import weakref
 
+import mock
+import msgpack
 from oslo_utils import netutils
 from oslotest import base
 
@@ -120,3 +126,170 @@ class TestFilePublisher(base.BaseTestCase):
         publisher.publish_samples(self.test_data)
 
         self.assertIsNone(publisher.publisher_logger)
+
+    def _segments(self, tempdir):
+        return sorted(os.path.join(tempdir, f) for f in os.listdir(tempdir))
+
+    def test_file_publisher_json_gzip(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=json&compression=gzip' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        self.assertIsNone(publisher.publisher_logger)
+        publisher.publish_samples(self.test_data)
+        publisher.writer.close()
+
+        segments = self._segments(tempdir)
+        self.assertEqual(1, len(segments))
+        self.assertTrue(segments[0].endswith('.json.gz'))
+        with gzip.open(segments[0], 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+        self.assertEqual([s.as_dict() for s in self.test_data],
+                         [json.loads(line) for line in lines])
+
+    def test_file_publisher_msgpack(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=msgpack' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        publisher.publish_samples(self.test_data)
+        publisher.writer.close()
+
+        segments = self._segments(tempdir)
+        self.assertEqual(1, len(segments))
+        self.assertTrue(segments[0].endswith('.msgpack'))
+        with open(segments[0], 'rb') as f:
+            unpacker = msgpack.Unpacker(f, encoding='utf-8')
+            self.assertEqual([s.as_dict() for s in self.test_data],
+                             list(unpacker))
+
+    def test_file_publisher_size_rotation(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=json&max_bytes=1&backup_count=2'
+            % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        for s in self.test_data:
+            publisher.publish_samples([s])
+        publisher.writer.close()
+
+        segments = self._segments(tempdir)
+        self.assertEqual(2, len(segments))
+        contents = []
+        for segment in segments:
+            with open(segment) as f:
+                contents.append(json.loads(f.read())['name'])
+        self.assertEqual(['test2', 'test2'], contents)
+
+    @mock.patch('time.time')
+    def test_file_publisher_time_rotation(self, mock_time):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=json&rotate_interval=3600' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        mock_time.return_value = 1500000000
+        publisher.publish_samples(self.test_data[:1])
+        mock_time.return_value = 1500000100
+        publisher.publish_samples(self.test_data[1:2])
+        self.assertEqual(1, len(self._segments(tempdir)))
+        mock_time.return_value = 1500003600
+        publisher.publish_samples(self.test_data[2:])
+        publisher.writer.close()
+        self.assertEqual(2, len(self._segments(tempdir)))
+
+    @mock.patch('time.time', return_value=1500000000)
+    def test_file_publisher_segment_name(self, mock_time):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, 'samples')
+        prefix = '%s.20170714T024000Z.%s-%d' % (
+            path, socket.gethostname(), os.getpid())
+        open(prefix + '.json', 'w').close()
+        writer = file.SegmentWriter(path)
+        writer.write([s.as_dict() for s in self.test_data])
+        writer.close()
+        self.assertEqual(prefix + '-1.json', writer.segment)
+        self.assertEqual([prefix + '-1.json', prefix + '.json'],
+                         self._segments(tempdir))
+
+    def test_file_publisher_prune_own_segments(self):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, 'samples')
+        other = '%s.20170714T024000Z.otherhost-1.json' % path
+        open(other, 'w').close()
+        writer = file.SegmentWriter(path, max_bytes=1, backup_count=1)
+        for s in self.test_data:
+            writer.write([s.as_dict()])
+        writer.close()
+        self.assertEqual(2, len(self._segments(tempdir)))
+        self.assertIn(other, self._segments(tempdir))
+
+    def test_file_publisher_writer_not_kept_alive(self):
+        tempdir = tempfile.mkdtemp()
+        writer = file.SegmentWriter(os.path.join(tempdir, 'samples'))
+        ref = weakref.ref(writer)
+        self.assertIn(writer, file._writers)
+        del writer
+        self.assertIsNone(ref())
+
+    def test_file_publisher_invalid_format(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=xml' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        publisher.publish_samples(self.test_data)
+        self.assertIsNone(publisher.writer)
+        self.assertIsNone(publisher.publisher_logger)
+        self.assertEqual([], os.listdir(tempdir))
+
+    @mock.patch.object(file, 'pyarrow', None)
+    def test_file_publisher_columnar_fallback(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=columnar' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        self.assertEqual('json', publisher.writer.format)
+
+    def test_file_publisher_columnar(self):
+        if file.pyarrow is None:
+            self.skipTest('pyarrow is not installed')
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=columnar' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        publisher.publish_samples(self.test_data[:1])
+        publisher.publish_samples(self.test_data[1:])
+        publisher.writer.close()
+
+        segments = self._segments(tempdir)
+        self.assertEqual(1, len(segments))
+        self.assertTrue(segments[0].endswith('.parquet'))
+        table = file.parquet.read_table(segments[0])
+        self.assertEqual(['test', 'test2', 'test2'],
+                         table.column('name').to_pylist())
+        self.assertEqual([1.0, 1.0, 1.0], table.column('volume').to_pylist())
+        self.assertEqual(['{"name": "TestPublish"}'] * 3,
+                         table.column('resource_metadata').to_pylist())
+
+    def test_file_publisher_columnar_schema_change(self):
+        if file.pyarrow is None:
+            self.skipTest('pyarrow is not installed')
+        tempdir = tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit(
+            'file://%s/samples?format=columnar' % tempdir)
+        publisher = file.FilePublisher(self.CONF, parsed_url)
+        publisher.writer.write([{'name': 'test', 'volume': 1}])
+        publisher.writer.write([{'name': 'test2', 'volume': None}])
+        self.assertEqual(1, len(self._segments(tempdir)))
+        publisher.writer.write([{'name': 'test3', 'volume': 'one'}])
+        publisher.writer.write([{'name': 'test4', 'unit': 'B'}])
+        publisher.writer.close()
+
+        tables = [file.parquet.read_table(segment)
+                  for segment in self._segments(tempdir)]
+        self.assertEqual(
+            [[{'name': 'test', 'volume': 1.0},
+              {'name': 'test2', 'volume': None}],
+             [{'name': 'test3', 'volume': 'one'}],
+             [{'name': 'test4', 'unit': 'B'}]],
+            sorted((t.to_pylist() for t in tables),
+                   key=lambda rows: rows[0]['name']))
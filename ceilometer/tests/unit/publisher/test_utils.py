@@ -18,6 +18,7 @@ from oslo_serialization import jsonutils
 from oslotest import base
 
 from ceilometer.publisher import utils
+from ceilometer import sample
 
 
 class TestSignature(base.BaseTestCase):
@@ -120,3 +121,16 @@ class TestSignature(base.BaseTestCase):
     def test_verify_no_secret(self):
         data = {'a': 'A', 'b': 'B'}
         self.assertTrue(utils.verify_signature(data, ''))
+
+    def test_meter_messages_from_counters(self):
+        samples = [sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', i,
+                                 'user', 'project', 'resource',
+                                 timestamp='2016-06-01T00:00:00',
+                                 resource_metadata={'nested': {'a': i}})
+                   for i in range(3)]
+        for secret in ('not-so-secret', u'caf\xe9', ''):
+            messages = utils.meter_messages_from_counters(samples, secret)
+            self.assertEqual([utils.meter_message_from_counter(s, secret)
+                              for s in samples], messages)
+            for msg in messages:
+                self.assertTrue(utils.verify_signature(msg, secret))
@@ -0,0 +1,92 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import operator
+
+from oslotest import base as testbase
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+
+from ceilometer.storage.sqlalchemy import json_metadata
+
+
+class JsonMetadataTest(testbase.BaseTestCase):
+
+    def setUp(self):
+        super(JsonMetadataTest, self).setUp()
+        self.column = sa.table('resource',
+                               sa.column('flat_metadata')).c.flat_metadata
+
+    def _compare(self, dialect, value, op=operator.eq, key='image.name'):
+        condition = json_metadata.compare(self.column, key, op, value,
+                                          dialect)
+        return str(condition.compile(dialect=dialect,
+                                     compile_kwargs={'literal_binds': True}))
+
+    def test_compare_postgresql(self):
+        dialect = postgresql.dialect()
+        self.assertEqual(
+            "(CAST(resource.flat_metadata AS JSONB) -> 'image.name') = "
+            "CAST('\"cirros\"' AS JSONB)", self._compare(dialect, 'cirros'))
+        self.assertEqual(
+            "(CAST(resource.flat_metadata AS JSONB) -> 'image.name') > "
+            "CAST('1' AS JSONB)", self._compare(dialect, 1, operator.gt))
+        self.assertEqual(
+            "(CAST(resource.flat_metadata AS JSONB) ->> 'image.name') "
+            "IS NULL", self._compare(dialect, None))
+        self.assertEqual(
+            "(CAST(resource.flat_metadata AS JSONB) ->> 'image.name') ~ "
+            "'cir.*'", self._compare(dialect, 'cir.*',
+                                     lambda f, v: f.op('~')(v)))
+
+    def test_compare_mysql(self):
+        dialect = mysql.dialect()
+        self.assertEqual(
+            "left(json_unquote(json_extract(resource.flat_metadata, "
+            "'$.\"image.name\"')), 255) = 'cirros' AND "
+            "json_extract(resource.flat_metadata, '$.\"image.name\"') = "
+            "json_extract('\"cirros\"', '$')",
+            self._compare(dialect, 'cirros'))
+        self.assertEqual(
+            "json_extract(resource.flat_metadata, '$.\"up\"') = "
+            "json_extract('true', '$')",
+            self._compare(dialect, True, key='up'))
+
+    def test_plan(self):
+        existing = set([json_metadata.index_name('instance_type'),
+                        json_metadata.index_name('size')])
+        create, drop = json_metadata.plan(existing,
+                                          ['image.name', 'instance_type'])
+        self.assertEqual(['image.name'], create)
+        self.assertEqual([json_metadata.index_name('size')], drop)
+
+    def test_statements(self):
+        name = json_metadata.index_name('image.name')
+        column = 'meta_' + name[len('ix_resource_meta_'):]
+        self.assertEqual(
+            ["CREATE INDEX %s ON resource ((CAST(flat_metadata AS JSONB) "
+             "-> 'image.name'))" % name],
+            json_metadata.create_statements(postgresql.dialect(),
+                                            ['image.name']))
+        self.assertEqual(
+            ["ALTER TABLE resource ADD COLUMN %s VARCHAR(255) AS "
+             "(left(json_unquote(json_extract(flat_metadata, "
+             "'$.\"image.name\"')), 255)) VIRTUAL, ADD INDEX %s (%s)"
+             % (column, name, column)],
+            json_metadata.create_statements(mysql.dialect(), ['image.name']))
+        self.assertEqual(
+            ['ALTER TABLE resource DROP COLUMN %s' % column],
+            json_metadata.drop_statements(mysql.dialect(), [name]))
+        self.assertEqual(['DROP INDEX %s' % name],
+                         json_metadata.drop_statements(postgresql.dialect(),
+                                                       [name]))
@@ -0,0 +1,132 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+from oslotest import base as testbase
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+
+from ceilometer import storage
+from ceilometer.storage.sqlalchemy import partitions
+
+
+def _day(day):
+    return datetime.datetime(2016, 6, day)
+
+
+class PartitionsTest(testbase.BaseTestCase):
+
+    def test_periods(self):
+        ts = datetime.datetime(2016, 6, 1, 15, 7, 31)
+        self.assertEqual(_day(1), partitions.period_start(ts, 'day'))
+        self.assertEqual(_day(2), partitions.next_period(ts, 'day'))
+        # NOTE: 2016-06-01 is a Wednesday
+        self.assertEqual(datetime.datetime(2016, 5, 30),
+                         partitions.period_start(ts, 'week'))
+        self.assertEqual(_day(6), partitions.next_period(ts, 'week'))
+        self.assertEqual('sample_p20160601', partitions.partition_name(ts))
+
+    def test_parse_bound(self):
+        self.assertEqual(_day(2), partitions.parse_bound('mysql',
+                                                         '1464825600'))
+        self.assertIsNone(partitions.parse_bound('mysql', 'MAXVALUE'))
+        self.assertEqual(_day(2), partitions.parse_bound(
+            'postgresql', "FOR VALUES FROM ('2016-06-01 00:00:00') "
+            "TO ('2016-06-02 00:00:00')"))
+        self.assertEqual(_day(2), partitions.parse_bound(
+            'postgresql', "FOR VALUES FROM (MINVALUE) "
+            "TO ('2016-06-02 00:00:00+00')"))
+        self.assertIsNone(partitions.parse_bound('postgresql', 'DEFAULT'))
+
+    def test_plan(self):
+        now = datetime.datetime(2016, 6, 3, 12)
+        existing = {partitions.LEGACY: _day(3), partitions.DEFAULT: None}
+        create, drop = partitions.plan(existing, 'day', now, 2)
+        self.assertEqual([(_day(3), _day(4)), (_day(4), _day(5)),
+                          (_day(5), _day(6))], create)
+        self.assertEqual([], drop)
+
+        existing = {partitions.LEGACY: _day(1), partitions.DEFAULT: None,
+                    'sample_p20160601': _day(2),
+                    'sample_p20160602': _day(3),
+                    'sample_p20160603': _day(4)}
+        create, drop = partitions.plan(existing, 'day', now, 1,
+                                       expire_before=_day(2))
+        self.assertEqual([(_day(4), _day(5))], create)
+        self.assertEqual([partitions.LEGACY, 'sample_p20160601'], drop)
+
+        # NOTE: weekly partitions start at the end of the daily ones
+        create, drop = partitions.plan(existing, 'week', now, 1,
+                                       expire_before=_day(1))
+        self.assertEqual([(_day(4), _day(6)), (_day(6), _day(13))], create)
+        self.assertEqual([partitions.LEGACY], drop)
+
+    def test_partition_statements(self):
+        boundary = _day(2)
+        statements = partitions.partition_statements(
+            mysql.dialect(), boundary, ['sample_ibfk_1'])
+        self.assertEqual(2, len(statements))
+        self.assertIn('DROP FOREIGN KEY sample_ibfk_1', statements[0])
+        self.assertIn('ADD PRIMARY KEY (id, partition_key)', statements[0])
+        self.assertIn('PARTITION BY RANGE (partition_key)', statements[1])
+        self.assertIn('PARTITION sample_legacy VALUES LESS THAN (1464825600)',
+                      statements[1])
+
+        statements = partitions.partition_statements(
+            postgresql.dialect(), boundary)
+        self.assertEqual('ALTER TABLE sample RENAME TO sample_legacy',
+                         statements[0])
+        self.assertIn('CREATE INDEX ix_sample_timestamp ON sample '
+                      '(timestamp)', statements)
+        self.assertIn("ALTER TABLE sample ATTACH PARTITION sample_legacy "
+                      "FOR VALUES FROM (MINVALUE) TO ('2016-06-02 00:00:00')",
+                      statements)
+        self.assertEqual('CREATE TABLE sample_default PARTITION OF sample '
+                         'DEFAULT', statements[-1])
+
+    def test_create_and_drop_statements(self):
+        bounds = [(_day(1), _day(2)), (_day(2), _day(3))]
+        self.assertEqual(
+            ['ALTER TABLE sample REORGANIZE PARTITION sample_default INTO ('
+             'PARTITION sample_p20160601 VALUES LESS THAN (1464825600), '
+             'PARTITION sample_p20160602 VALUES LESS THAN (1464912000), '
+             'PARTITION sample_default VALUES LESS THAN MAXVALUE)'],
+            partitions.create_statements(mysql.dialect(), bounds))
+        self.assertEqual(
+            ["CREATE TABLE sample_p20160601 PARTITION OF sample FOR VALUES "
+             "FROM ('2016-06-01 00:00:00') TO ('2016-06-02 00:00:00')",
+             "CREATE TABLE sample_p20160602 PARTITION OF sample FOR VALUES "
+             "FROM ('2016-06-02 00:00:00') TO ('2016-06-03 00:00:00')"],
+            partitions.create_statements(postgresql.dialect(), bounds))
+        self.assertEqual([], partitions.create_statements(mysql.dialect(),
+                                                          []))
+        self.assertEqual(
+            ['ALTER TABLE sample DROP PARTITION sample_legacy, '
+             'sample_p20160601'],
+            partitions.drop_statements(mysql.dialect(),
+                                       ['sample_legacy', 'sample_p20160601']))
+        self.assertEqual(['DROP TABLE sample_legacy'],
+                         partitions.drop_statements(postgresql.dialect(),
+                                                    ['sample_legacy']))
+
+    def test_key_conditions(self):
+        f = storage.SampleFilter(
+            start_timestamp=datetime.datetime(2016, 6, 1, 0, 0, 1, 5),
+            end_timestamp=_day(2))
+        self.assertEqual(
+            [('sample.partition_key', 'ge', 1464739201),
+             ('sample.partition_key', 'le', 1464825600)],
+            [(str(c.left), c.operator.__name__, c.right.value)
+             for c in partitions.key_conditions(f)])
+        self.assertEqual([], partitions.key_conditions(
+            storage.SampleFilter()))
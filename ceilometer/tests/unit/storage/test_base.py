@@ -14,6 +14,7 @@
 import datetime
 import math
 
+import mock
 from oslotest import base as testbase
 
 from ceilometer.storage import base
@@ -52,3 +53,51 @@ class BaseTest(testbase.BaseTestCase):
         sort_keys_resource = base._handle_sort_key('resource', 'project_id')
         self.assertEqual(['project_id', 'user_id', 'timestamp'],
                          sort_keys_resource)
+
+
+class CompiledQueryCacheTest(testbase.BaseTestCase):
+
+    def test_get_or_compile(self):
+        cache = base.CompiledQueryCache(10)
+        compile = mock.Mock(side_effect=lambda f: object())
+        filter_expr = {"and": [{"=": {"counter_name": "cpu"}},
+                               {">": {"timestamp":
+                                      datetime.datetime(2016, 6, 1)}}]}
+        compiled = cache.get_or_compile(filter_expr, compile)
+        self.assertIs(compiled, cache.get_or_compile(
+            {"and": [{"=": {"counter_name": "cpu"}},
+                     {">": {"timestamp": datetime.datetime(2016, 6, 1)}}]},
+            compile))
+        self.assertEqual(1, compile.call_count)
+        cache.get_or_compile(filter_expr, compile, True)
+        cache.get_or_compile({"=": {"counter_volume": 1}}, compile)
+        cache.get_or_compile({"=": {"counter_volume": 1.0}}, compile)
+        cache.get_or_compile({"=": {"counter_volume": True}}, compile)
+        cache.get_or_compile({">": {"timestamp": "2016-06-01T00:00:00"}},
+                             compile)
+        self.assertEqual(6, compile.call_count)
+
+    def test_disabled(self):
+        cache = base.CompiledQueryCache(0)
+        compile = mock.Mock(side_effect=lambda f: object())
+        self.assertIsNot(cache.get_or_compile({"=": {"counter_volume": 1}},
+                                              compile),
+                         cache.get_or_compile({"=": {"counter_volume": 1}},
+                                              compile))
+
+
+class PoolStatisticsTest(testbase.BaseTestCase):
+
+    def test_snapshot(self):
+        stats = base.PoolStatistics()
+        stats.record('checkout', 0.5)
+        stats.record('checkout', 1.5)
+        stats.record('statement', 0.25)
+        self.assertEqual({'checkouts': 2, 'checkout_time_avg': 1.0,
+                          'checkout_time_max': 1.5, 'statements': 1,
+                          'statement_time_avg': 0.25,
+                          'statement_time_max': 0.25}, stats.snapshot())
+
+    def test_empty(self):
+        self.assertEqual(0.0,
+                         base.PoolStatistics().snapshot()['checkout_time_avg'])
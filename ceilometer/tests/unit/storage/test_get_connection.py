@@ -80,3 +80,14 @@ class ConnectionConfigTest(base.BaseTestCase):
                                group="database")
         conn = storage.get_connection_from_config(self.CONF)
         self.assertIsInstance(conn, impl_sqlalchemy.Connection)
+
+    def test_warm_up(self):
+        self.CONF.set_override("connection", "log://", group="database")
+        with mock.patch.object(impl_log.Connection, 'warm_up') as warm_up:
+            storage.get_connection_from_config(self.CONF)
+            storage.get_connection_from_config(self.CONF, warm_up=True)
+            self.assertFalse(warm_up.called)
+            self.CONF.set_override("connection_warm_up", 5,
+                                   group="database")
+            storage.get_connection_from_config(self.CONF, warm_up=True)
+        warm_up.assert_called_once_with(5)
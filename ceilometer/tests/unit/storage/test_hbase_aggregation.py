@@ -0,0 +1,110 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+import mock
+from oslotest import base as testbase
+
+import ceilometer
+from ceilometer import storage
+from ceilometer.storage.hbase import aggregation
+
+
+class AggregationTest(testbase.BaseTestCase):
+
+    def setUp(self):
+        super(AggregationTest, self).setUp()
+        self.start = datetime.datetime(2016, 6, 1, 15)
+        # NOTE: newest first, as scanned from the meter table
+        self.entries = [
+            self._entry(50, 7, 'user-2', 'resource-2'),
+            self._entry(40, 1, 'user-1', 'resource-1'),
+            self._entry(20, 4, 'user-1', 'resource-2'),
+            self._entry(5, 2, 'user-1', 'resource-1'),
+        ]
+
+    def _entry(self, minute, volume, user_id, resource_id):
+        return {'timestamp': self.start + datetime.timedelta(minutes=minute),
+                'counter_volume': volume, 'counter_unit': 'GB',
+                'user_id': user_id, 'resource_id': resource_id}
+
+    def test_validate(self):
+        aggregation.validate(['user_id', 'resource_id'],
+                             [mock.Mock(func='cardinality',
+                                        param='project_id')])
+        self.assertRaises(ceilometer.NotImplementedError,
+                          aggregation.validate, ['source'], None)
+        self.assertRaises(storage.StorageBadAggregate,
+                          aggregation.validate, None,
+                          [mock.Mock(func='median', param=None)])
+        self.assertRaises(storage.StorageBadAggregate,
+                          aggregation.validate, None,
+                          [mock.Mock(func='cardinality', param='counter')])
+
+    def test_columns(self):
+        self.assertEqual(['f:timestamp', 'f:counter_volume',
+                          'f:counter_unit', 'f:resource_id', 'f:user_id'],
+                         aggregation.columns(
+                             ['user_id'],
+                             [mock.Mock(func='cardinality',
+                                        param='resource_id'),
+                              mock.Mock(func='max', param=None)]))
+
+    def test_single_period(self):
+        buckets = aggregation.aggregate_periods(iter(self.entries), None, 0)
+        self.assertEqual([(None, ())], list(buckets))
+        stats, = aggregation.to_statistics(buckets, None, None, 0)
+        self.assertEqual(4, stats.count)
+        self.assertEqual(1, stats.min)
+        self.assertEqual(7, stats.max)
+        self.assertEqual(14, stats.sum)
+        self.assertEqual(3.5, stats.avg)
+        self.assertEqual('GB', stats.unit)
+        self.assertEqual(0, stats.period)
+        self.assertEqual(self.entries[-1]['timestamp'], stats.period_start)
+        self.assertEqual(self.entries[0]['timestamp'], stats.period_end)
+        self.assertEqual(2700, stats.duration)
+        self.assertIsNone(stats.groupby)
+
+    def test_periods_groupby(self):
+        buckets = aggregation.aggregate_periods(
+            iter(self.entries), self.start, 1800, ['user_id'])
+        results = aggregation.to_statistics(buckets, self.start, None, 1800,
+                                            ['user_id'])
+        self.assertEqual(
+            [(self.start, {'user_id': 'user-1'}, 2, 6),
+             (self.start + datetime.timedelta(minutes=30),
+              {'user_id': 'user-1'}, 1, 1),
+             (self.start + datetime.timedelta(minutes=30),
+              {'user_id': 'user-2'}, 1, 7)],
+            [(s.period_start, s.groupby, s.count, s.sum) for s in results])
+        self.assertEqual(self.start + datetime.timedelta(minutes=30),
+                         results[0].period_end)
+
+    def test_selectable_aggregates(self):
+        aggregate = [mock.Mock(func='stddev', param=None),
+                     mock.Mock(func='cardinality', param='resource_id'),
+                     mock.Mock(func='max', param=None)]
+        buckets = aggregation.aggregate_periods(
+            iter(self.entries), None, 0, cardinality=['resource_id'])
+        stats, = aggregation.to_statistics(buckets, None, None, 0,
+                                           aggregate=aggregate)
+        self.assertAlmostEqual(5.25 ** 0.5, stats.aggregate.pop('stddev'))
+        self.assertEqual({'max': 7, 'cardinality/resource_id': 2},
+                         stats.aggregate)
+        self.assertEqual(7, stats.max)
+        self.assertFalse(hasattr(stats, 'sum'))
+
+    def test_no_sample(self):
+        self.assertEqual([], aggregation.to_statistics(
+            aggregation.aggregate_periods([], None, 0), None, None, 0))
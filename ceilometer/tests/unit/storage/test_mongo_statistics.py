@@ -0,0 +1,109 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+import mock
+from oslotest import base as testbase
+
+import ceilometer
+from ceilometer import storage
+from ceilometer.storage.mongo import statistics
+
+
+class StatisticsPipelineTest(testbase.BaseTestCase):
+
+    def setUp(self):
+        super(StatisticsPipelineTest, self).setUp()
+        self.start = datetime.datetime(2016, 6, 1, 15)
+
+    def test_validate(self):
+        statistics.validate(['user_id', 'resource_metadata.instance_type'],
+                            [mock.Mock(func='cardinality',
+                                       param='resource_id')], [3, 2])
+        self.assertRaises(ceilometer.NotImplementedError,
+                          statistics.validate, ['counter_name'], None,
+                          [3, 2])
+        self.assertRaises(storage.StorageBadAggregate,
+                          statistics.validate, None,
+                          [mock.Mock(func='median', param=None)], [3, 2])
+        self.assertRaises(storage.StorageBadAggregate,
+                          statistics.validate, None,
+                          [mock.Mock(func='cardinality', param='timestamp')],
+                          [3, 2])
+
+    def test_pipeline(self):
+        match, fields, group, sort, project = statistics.pipeline(
+            {'counter_name': 'cpu'}, self.start, 60, ['user_id'], None,
+            [3, 2])
+        self.assertEqual({'$match': {'counter_name': 'cpu'}}, match)
+        offset = {'$subtract': ['$timestamp', self.start]}
+        self.assertEqual(
+            {'$project': {'_id': 0, 'timestamp': 1, 'counter_name': 1,
+                          'counter_unit': 1, 'counter_volume': 1,
+                          'user_id': 1,
+                          'period_start': {'$subtract': [
+                              offset, {'$mod': [offset, 60000]}]}}},
+            fields)
+        self.assertEqual({'name': '$counter_name', 'unit': '$counter_unit',
+                          'user_id': '$user_id',
+                          'period_start': '$period_start'},
+                         group['$group']['_id'])
+        self.assertEqual(set(['_id', 'first_timestamp', 'last_timestamp',
+                              'sum', 'avg', 'min', 'max', 'count']),
+                         set(group['$group']))
+        self.assertEqual({'$sort': {'_id.period_start': 1}}, sort)
+        self.assertEqual({'$add': [self.start, '$_id.period_start']},
+                         project['$project']['period_start'])
+        self.assertEqual({'$add': [self.start, '$_id.period_start', 60000]},
+                         project['$project']['period_end'])
+
+    def test_pipeline_selectable_aggregates(self):
+        aggregate = [mock.Mock(func='stddev', param=None),
+                     mock.Mock(func='cardinality', param='resource_id')]
+        _, fields, group, _, project = [
+            list(stage.values())[0] for stage in statistics.pipeline(
+                {}, self.start, None, None, aggregate, [3, 2])]
+        self.assertEqual(1, fields['resource_id'])
+        self.assertNotIn('period_start', fields)
+        self.assertEqual({'$stdDevPop': '$counter_volume'}, group['stddev'])
+        self.assertEqual({'$addToSet': '$resource_id'},
+                         group['cardinality/resource_id'])
+        self.assertEqual('$stddev', project['stddev'])
+        self.assertIn('$size', project['cardinality/resource_id']['$cond'][2])
+        self.assertEqual({'$add': [self.start, 0]}, project['period_start'])
+        self.assertEqual('$last_timestamp', project['period_end'])
+
+        group = statistics.pipeline({}, self.start, None, None, aggregate,
+                                    [2, 6])[2]['$group']
+        self.assertIn('std_square', group)
+
+    def test_to_statistics(self):
+        end = self.start + datetime.timedelta(minutes=30)
+        result = {'_id': {'name': 'cpu', 'unit': 'ns', 'user_id': 'user-1',
+                          'period_start': 0},
+                  'unit': 'ns', 'duration_start': self.start,
+                  'duration_end': end, 'duration': 1800.0,
+                  'period_start': self.start,
+                  'period_end': self.start + datetime.timedelta(hours=1),
+                  'stddev': 1.5, 'cardinality/resource_id': 2}
+        aggregate = [mock.Mock(func='stddev', param=None),
+                     mock.Mock(func='cardinality', param='resource_id')]
+        stats, = statistics.to_statistics(iter([result]), 3600, ['user_id'],
+                                          aggregate, [3, 2])
+        self.assertEqual(3600, stats.period)
+        self.assertEqual(self.start, stats.period_start)
+        self.assertEqual(1800.0, stats.duration)
+        self.assertEqual(end, stats.duration_end)
+        self.assertEqual({'user_id': 'user-1'}, stats.groupby)
+        self.assertEqual({'stddev': 1.5, 'cardinality/resource_id': 2},
+                         stats.aggregate)
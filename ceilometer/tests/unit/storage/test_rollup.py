@@ -0,0 +1,92 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+
+import mock
+from oslotest import base as testbase
+
+from ceilometer import storage
+from ceilometer.storage import rollup
+
+
+class RollupTest(testbase.BaseTestCase):
+
+    def test_parse_resolutions(self):
+        self.assertEqual([60, 300, 3600, 86400],
+                         rollup.parse_resolutions(['1h', '300', '5m', '1D',
+                                                   '60s']))
+        self.assertEqual([], rollup.parse_resolutions(None))
+        self.assertRaises(ValueError, rollup.parse_resolution, '0m')
+        self.assertRaises(ValueError, rollup.parse_resolution, 'h')
+        self.assertRaises(ValueError, rollup.parse_resolution, '1w')
+
+    def test_period_start(self):
+        ts = datetime.datetime(2016, 6, 1, 15, 7, 31, 5)
+        self.assertEqual(datetime.datetime(2016, 6, 1, 15, 5),
+                         rollup.period_start(ts, 300))
+        self.assertEqual(datetime.datetime(2016, 6, 1),
+                         rollup.period_start(ts, 86400))
+        self.assertTrue(rollup.is_aligned(
+            datetime.datetime(2016, 6, 1, 15), 3600))
+        self.assertFalse(rollup.is_aligned(
+            datetime.datetime(2016, 6, 1, 15, 0, 0, 1), 3600))
+        self.assertFalse(rollup.is_aligned(
+            datetime.datetime(2016, 6, 1, 15, 5), 3600))
+
+    def test_aggregate(self):
+        t = datetime.datetime(2016, 6, 1, 15)
+        minute = datetime.timedelta(minutes=1)
+        rows = rollup.aggregate([('a', t + minute, 3),
+                                 ('a', t, 5),
+                                 ('a', t + 5 * minute, 1),
+                                 ('b', t, None),
+                                 ('b', t + 2 * minute, 2)], [300, 3600])
+        self.assertEqual({
+            (300, 'a', t): [2, 8, 3, 5, t, t + minute],
+            (300, 'a', t + 5 * minute): [1, 1, 1, 1, t + 5 * minute,
+                                         t + 5 * minute],
+            (300, 'b', t): [1, 2, 2, 2, t + 2 * minute, t + 2 * minute],
+            (3600, 'a', t): [3, 9, 1, 5, t, t + 5 * minute],
+            (3600, 'b', t): [1, 2, 2, 2, t + 2 * minute, t + 2 * minute],
+        }, rows)
+
+    def test_choose_resolution(self):
+        resolutions = [60, 300, 3600]
+        start = datetime.datetime(2016, 6, 1, 15)
+        f = storage.SampleFilter(meter='a', start_timestamp=start,
+                                 end_timestamp=start +
+                                 datetime.timedelta(days=1))
+        self.assertEqual(3600, rollup.choose_resolution(resolutions, f))
+        self.assertEqual(300, rollup.choose_resolution(resolutions, f, 600))
+        self.assertEqual(60, rollup.choose_resolution(resolutions, f, 420))
+        self.assertIsNone(rollup.choose_resolution(resolutions, f, 90))
+        self.assertIsNone(rollup.choose_resolution([], f))
+        self.assertIsNone(rollup.choose_resolution(
+            resolutions, f, aggregate=[mock.Mock(func='stddev')]))
+        self.assertEqual(3600, rollup.choose_resolution(
+            resolutions, f, aggregate=[mock.Mock(func='cardinality')]))
+
+        f.start_timestamp = start + datetime.timedelta(minutes=5)
+        self.assertEqual(300, rollup.choose_resolution(resolutions, f))
+        f.start_timestamp_op = 'gt'
+        self.assertIsNone(rollup.choose_resolution(resolutions, f))
+
+        f = storage.SampleFilter(meter='a', end_timestamp=start,
+                                 end_timestamp_op='lt')
+        self.assertEqual(3600, rollup.choose_resolution(resolutions, f))
+        # NOTE: periods start at the first sample without start timestamp
+        self.assertIsNone(rollup.choose_resolution(resolutions, f, 3600))
+        f.end_timestamp_op = 'le'
+        self.assertIsNone(rollup.choose_resolution(resolutions, f))
+        f = storage.SampleFilter(meter='a', message_id='id')
+        self.assertIsNone(rollup.choose_resolution(resolutions, f))
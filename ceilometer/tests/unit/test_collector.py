@@ -58,3 +58,45 @@ class TestEventDispatcherVerifier(base.BaseTestCase):
             sample['payload'][0], "secret")
         v.sample([sample])
         self.assertEqual(sample['payload'], manager['file'].obj.events)
+
+
+class TestDatagramQueue(base.BaseTestCase):
+    def test_drop_oldest_when_full(self):
+        queue = collector.DatagramQueue(2)
+        for i in range(3):
+            queue.put(i)
+        self.assertEqual([1, 2], queue.get_batch(10))
+        self.assertEqual({'received': 3, 'decoded': 0,
+                          'invalid_signature': 0, 'dispatched': 0,
+                          'dropped': 1}, queue.stats.snapshot())
+
+    def test_get_batch_bounded(self):
+        queue = collector.DatagramQueue(10)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual([0, 1, 2], queue.get_batch(3))
+        self.assertEqual([3, 4], queue.get_batch(3))
+
+    def test_closed_queue_is_drained(self):
+        queue = collector.DatagramQueue(10)
+        queue.put(1)
+        queue.close()
+        self.assertEqual([1], queue.get_batch(3))
+        self.assertIsNone(queue.get_batch(3))
+
+
+class TestUDPKernelStats(base.BaseTestCase):
+    def test_parse_snmp(self):
+        snmp = self.useFixture(fixtures.TempDir()).join('snmp')
+        with open(snmp, 'w') as f:
+            f.write('Udp: InDatagrams NoPorts InErrors OutDatagrams '
+                    'RcvbufErrors SndbufErrors\n'
+                    'Udp: 1000 3 12 500 10 0\n'
+                    'UdpLite: InDatagrams NoPorts\n'
+                    'UdpLite: 0 0\n')
+        self.assertEqual({'InDatagrams': 1000, 'InErrors': 12,
+                          'RcvbufErrors': 10},
+                         collector.udp_kernel_stats(snmp))
+
+    def test_missing_snmp(self):
+        self.assertIsNone(collector.udp_kernel_stats('/nonexistent/snmp'))
@@ -175,7 +175,7 @@ def dict_to_keyval(value, key_base=None):
 
 def lowercase_keys(mapping):
     """Converts the values of the keys in mapping to lowercase."""
-    items = mapping.items()
+    items = list(mapping.items())
     for key, value in items:
         del mapping[key]
         mapping[key.lower()] = value
@@ -23,10 +23,15 @@ Generate testing data for e.g. for default time span
 source .tox/py27/bin/activate
 ./tools/make_test_data.py --user 1 --project 1 --resource 1 --counter cpu_util
 --volume 20
+
+Samples are recorded one by one unless --batch-size is given, in which case
+they are recorded with record_metering_data_batch. The recording rate is
+printed at the end so both paths can be compared against a given backend.
 """
 import argparse
 import datetime
 import random
+import time
 import uuid
 
 from oslo_utils import timeutils
@@ -100,8 +105,27 @@ def make_test_data(conf, name, meter_type, unit, volume, random_min,
 
 
 def record_test_data(conf, conn, *args, **kwargs):
-    for data in make_test_data(conf, *args, **kwargs):
-        conn.record_metering_data(data)
+    batch_size = kwargs.pop('batch_size', 0)
+    started = time.time()
+    n = 0
+    if batch_size:
+        batch = []
+        for data in make_test_data(conf, *args, **kwargs):
+            batch.append(data)
+            if len(batch) >= batch_size:
+                conn.record_metering_data_batch(batch)
+                n += len(batch)
+                batch = []
+        if batch:
+            conn.record_metering_data_batch(batch)
+            n += len(batch)
+    else:
+        for data in make_test_data(conf, *args, **kwargs):
+            conn.record_metering_data(data)
+            n += 1
+    elapsed = time.time() - started
+    print('Recorded %d samples in %.2fs (%.1f samples/s).'
+          % (n, elapsed, n / elapsed if elapsed else 0))
 
 
 def get_parser():
@@ -179,6 +203,14 @@ def get_parser():
         type=int,
         default=1,
     )
+    parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        help='Record samples in batches of this size, 0 records them one '
+             'by one.',
+        type=int,
+        default=0,
+    )
     return parser
 
 
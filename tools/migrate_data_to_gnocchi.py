@@ -171,18 +171,18 @@ def main():
             filter_expr = None
         samples = storage_conn.query_samples(
             filter_expr=filter_expr, orderby=orderby, limit=batch_size)
-        samples = list(samples)
-        if not samples:
-            break
-        last_message_id = samples[-1].message_id
+        samples_dict = []
         for sample in samples:
             logger.info('Migrating sample with message_id: %s, meter: %s, '
                         'resource_id: %s' % (sample.message_id,
                                              sample.counter_name,
                                              sample.resource_id))
-        samples_dict = [sample.as_dict() for sample in samples]
+            samples_dict.append(sample.as_dict())
+        if not samples_dict:
+            break
+        last_message_id = samples_dict[-1]['message_id']
         gnocchi_dispatcher.record_metering_data(samples_dict)
-        length = len(samples)
+        length = len(samples_dict)
         migrated_amount += length
         if pbar:
             pbar.update(length)
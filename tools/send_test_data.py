@@ -128,6 +128,9 @@ def get_parser():
 def main():
     args = get_parser().parse_known_args()[0]
     make_data_args = make_test_data.get_parser().parse_known_args()[0]
+    # NOTE: --batch-size is shared with make_test_data but only drives how
+    # samples are sent here
+    del make_data_args.batch_size
     conf = service.prepare_service(argv=['/', '--config-file',
                                          args.config_file])
     notifier = get_notifier(conf)